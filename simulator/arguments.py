@@ -18,6 +18,27 @@ def configure():
     parser.add_argument("-s", "--font-size", help="Set font size")
     parser.add_argument("--widget-margin", help="Set widget margin")
     parser.add_argument("-t", "--time-scale", help="Set time scale")
+    parser.add_argument("--physics-thread", help="Run physics on its own thread, the window renders its latest snapshot", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--physics-budget", help="Milliseconds of physics per frame, as many steps as fit instead of a fixed number")
+    parser.add_argument("--headless", help="Run without a window until the mission ends and print a JSON summary", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--time-limit", help="Stop a headless run after this many simulated seconds")
+    parser.add_argument("--summary", help="Write the headless summary to this file instead of stdout")
+    parser.add_argument("--checkpoint", help="Save the simulation state to this file when a headless run stops, or on `k` in the window")
+    parser.add_argument("--restore", help="Continue from a checkpoint saved from the same mission")
+    parser.add_argument("--record", help="Record the trajectories to PATH.json, PATH.frames and PATH.events")
+    parser.add_argument("--record-interval", help="Simulated seconds between recorded frames")
+    parser.add_argument("--replay", help="Play a recording back instead of simulating")
+    parser.add_argument("--tracked-bodies", help="Bodies whose gravity on the rockets is plotted", nargs="+")
+    parser.add_argument("--telemetry-sampling", help="When the plot telemetry records a row", choices=("steps", "time", "change"))
+    parser.add_argument("--telemetry-sampling-value", help="Steps, simulated seconds or relative change between telemetry rows")
+    parser.add_argument("--telemetry", help="Also save the plot telemetry columns to this .npz file")
+    parser.add_argument("--plot-directory", help="Directory the graphics are written to")
+    parser.add_argument("--plot-formats", help="File formats of the graphics", nargs="+", choices=("png", "svg", "pdf"))
+    parser.add_argument("--plot-points", help="Samples per curve of the graphics")
+    parser.add_argument("--ensemble", help="Fly this many perturbed copies of the mission rocket as one vectorized ensemble")
+    parser.add_argument("--ensemble-seed", help="Seed of the ensemble perturbations")
+    parser.add_argument("--ensemble-spread", help="Relative standard deviation of the ensemble parameters, radians for the launch angle")
+    add_physics_arguments(parser)
 
     args = parser.parse_args()
 
@@ -29,3 +50,45 @@ def configure():
     config.FONT_SIZE = int(args.font_size) if args.font_size is not None else config.FONT_SIZE
     config.WIDGET_MARGIN = int(args.widget_margin) if args.widget_margin is not None else config.WIDGET_MARGIN
     config.TIME_SCALE = int(args.time_scale) if args.time_scale is not None else config.TIME_SCALE
+    config.PHYSICS_THREAD = args.physics_thread if args.physics_thread is not None else config.PHYSICS_THREAD
+    config.PHYSICS_BUDGET = float(args.physics_budget) / 1000 if args.physics_budget is not None else config.PHYSICS_BUDGET
+    config.HEADLESS = args.headless if args.headless is not None else config.HEADLESS
+    config.TIME_LIMIT = float(args.time_limit) if args.time_limit is not None else config.TIME_LIMIT
+    config.SUMMARY_PATH = args.summary if args.summary is not None else config.SUMMARY_PATH
+    config.CHECKPOINT_PATH = args.checkpoint if args.checkpoint is not None else config.CHECKPOINT_PATH
+    config.RESTORE_PATH = args.restore if args.restore is not None else config.RESTORE_PATH
+    config.RECORD_PATH = args.record if args.record is not None else config.RECORD_PATH
+    config.RECORD_INTERVAL = float(args.record_interval) if args.record_interval is not None else config.RECORD_INTERVAL
+    config.REPLAY_PATH = args.replay if args.replay is not None else config.REPLAY_PATH
+    config.TRACKED_BODIES = tuple(args.tracked_bodies) if args.tracked_bodies is not None else config.TRACKED_BODIES
+    config.TELEMETRY_SAMPLING = args.telemetry_sampling if args.telemetry_sampling is not None else config.TELEMETRY_SAMPLING
+    config.TELEMETRY_SAMPLING_VALUE = float(args.telemetry_sampling_value) if args.telemetry_sampling_value is not None else config.TELEMETRY_SAMPLING_VALUE
+    config.TELEMETRY_PATH = args.telemetry if args.telemetry is not None else config.TELEMETRY_PATH
+    config.PLOT_DIRECTORY = args.plot_directory if args.plot_directory is not None else config.PLOT_DIRECTORY
+    config.PLOT_FORMATS = tuple(args.plot_formats) if args.plot_formats is not None else config.PLOT_FORMATS
+    config.PLOT_POINTS = int(args.plot_points) if args.plot_points is not None else config.PLOT_POINTS
+    config.ENSEMBLE_SIZE = int(args.ensemble) if args.ensemble is not None else config.ENSEMBLE_SIZE
+    config.ENSEMBLE_SEED = int(args.ensemble_seed) if args.ensemble_seed is not None else config.ENSEMBLE_SEED
+    config.ENSEMBLE_SPREAD = float(args.ensemble_spread) if args.ensemble_spread is not None else config.ENSEMBLE_SPREAD
+    apply_physics_arguments(args)
+
+
+# physics options shared by every entry point that runs missions
+def add_physics_arguments(parser):
+    parser.add_argument("--gravity", help="Gravity solver", choices=("pairwise", "barnes-hut"))
+    parser.add_argument("--restricted", help="Treat rockets as massless test particles that only feel the planets", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--theta", help="Barnes-Hut opening angle")
+    parser.add_argument("-i", "--integrator", help="Numerical integration scheme", choices=("euler", "verlet", "yoshida", "rk4", "dopri"))
+    parser.add_argument("--coast", help="Propagate coasting rockets on Kepler conics and jump to phase events", action=argparse.BooleanOptionalAction)
+    parser.add_argument("--ephemeris", help="Drive planets by the ephemeris at this path (built on first use)")
+    parser.add_argument("-e", "--array-engine", help="Keep entity state in numpy arrays and update it in batches", action=argparse.BooleanOptionalAction)
+
+
+def apply_physics_arguments(args):
+    config.ARRAY_ENGINE = args.array_engine if args.array_engine is not None else config.ARRAY_ENGINE
+    config.INTEGRATOR = args.integrator if args.integrator is not None else config.INTEGRATOR
+    config.COAST = args.coast if args.coast is not None else config.COAST
+    config.EPHEMERIS_PATH = args.ephemeris if args.ephemeris is not None else config.EPHEMERIS_PATH
+    config.GRAVITY_MODE = args.gravity if args.gravity is not None else config.GRAVITY_MODE
+    config.RESTRICTED = args.restricted if args.restricted is not None else config.RESTRICTED
+    config.BARNES_HUT_THETA = float(args.theta) if args.theta is not None else config.BARNES_HUT_THETA
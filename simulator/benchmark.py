@@ -0,0 +1,352 @@
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+import config
+from physics import Entity, Physics, Point, Vector
+from gravity import QuadTree, barnes_hut_accelerations, pairwise_accelerations, restricted_accelerations
+from integrators import INTEGRATORS
+from events import EventBus, EventSubscriber, GravityTrackingEvent, LogableEvent, PauseEvent, RocketEvent
+from groups import create_physics_groups
+from mission import create_solar_system, create_mars_mission_rocket, create_mars_mission_ensemble
+from simulation import Simulation
+
+
+SUN_WEIGHT = 1.989E30
+ASTEROID_WEIGHT = 1E15
+MIN_BELT_RADIUS = 3.3E11
+MAX_BELT_RADIUS = 4.9E11
+ROCKET_WEIGHT = 9E6
+
+
+def make_belt(amount: int, seed: int = 0):
+    generator = np.random.default_rng(seed)
+    radiuses = generator.uniform(MIN_BELT_RADIUS, MAX_BELT_RADIUS, amount)
+    angles = generator.uniform(0, 2 * np.pi, amount)
+    positions = np.column_stack((radiuses * np.cos(angles), radiuses * np.sin(angles)))
+    weights = generator.uniform(0.1, 10, amount) * ASTEROID_WEIGHT
+    # the Sun always goes first and is summed exactly
+    return np.vstack(([0, 0], positions)), np.concatenate(([SUN_WEIGHT], weights))
+
+
+def measure(function, repeat: int):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def gravity_scaling(args):
+    print(f"{'bodies':>8} {'tree, s':>10} {'per N log N, ns':>16} {'pairwise, s':>12} {'median error':>15}")
+    for amount in args.amounts:
+        positions, weights = make_belt(amount)
+        tree_time = measure(lambda: barnes_hut_accelerations(positions, weights, args.theta, config.BARNES_HUT_EXACT_WEIGHT), args.repeat)
+        line = f"{amount:>8} {tree_time:>10.4f} {tree_time / (amount * np.log2(amount)) * 1E9:>16.1f}"
+
+        if amount <= args.max_pairwise:
+            pairwise_time = measure(lambda: pairwise_accelerations(positions, weights), args.repeat)
+            # the error is measured on the asteroid-asteroid attraction, the only approximated part
+            exact = pairwise_accelerations(positions[1:], weights[1:])
+            approximate = QuadTree(positions[1:], Physics.G * weights[1:]).accelerations(positions[1:], args.theta)
+            error = np.median(np.linalg.norm(approximate - exact, axis=1) / np.linalg.norm(exact, axis=1))
+            line += f" {pairwise_time:>12.4f} {error:>15.2e}"
+
+        print(line)
+        sys.stdout.flush()
+
+
+def restricted_scaling(args):
+    # the Sun and a handful of planets with a growing fleet of rockets in the belt
+    print(f"{'rockets':>8} {'pairwise, s':>12} {'restricted, s':>14} {'speedup':>8} {'planet error':>13}")
+    for amount in args.amounts:
+        planet_positions, planet_weights = make_belt(args.planets - 1, seed=1)
+        rocket_positions, _ = make_belt(amount)
+        positions = np.vstack((planet_positions, rocket_positions[1:]))
+        weights = np.concatenate((planet_weights * 1E9, np.full(amount, ROCKET_WEIGHT)))
+        massive = np.arange(len(weights)) < args.planets
+
+        pairwise_time = measure(lambda: pairwise_accelerations(positions, weights), args.repeat)
+        restricted_time = measure(lambda: restricted_accelerations(positions, weights, massive), args.repeat)
+        # the only dropped terms are the pulls of the rockets
+        exact = pairwise_accelerations(positions, weights)[massive]
+        error = np.max(np.linalg.norm(restricted_accelerations(positions, weights, massive)[massive] - exact, axis=1) / np.linalg.norm(exact, axis=1))
+        print(f"{amount:>8} {pairwise_time:>12.4f} {restricted_time:>14.4f} {pairwise_time / restricted_time:>8.1f} {error:>13.2e}")
+        sys.stdout.flush()
+
+
+def fleet_step_time(sprites, steps: int, delta_time: float, event_bus: EventBus):
+    simulation = Simulation(groups=create_physics_groups(*sprites, event_bus=event_bus), event_bus=event_bus)
+    start = time.perf_counter()
+    for _ in range(steps):
+        simulation.step(delta_time)
+    return (time.perf_counter() - start) / steps
+
+
+def ensemble_scaling(args):
+    # the Mars mission from its launch: every rocket burns, decides and moves each step
+    print(f"{'rockets':>8} {'ensemble, ms':>13} {'per rocket, us':>15} {'rockets, ms':>12} {'speedup':>8}")
+    config.RESTRICTED = True
+    for amount in args.amounts:
+        event_bus = EventBus()
+        planet_sprites = create_solar_system(event_bus)
+        earth, moon, sun, mars = [sprite.entity for sprite in planet_sprites]
+        ensemble = create_mars_mission_ensemble([earth, moon, sun, mars], earth, sun, mars, amount, event_bus=event_bus)
+        ensemble_time = fleet_step_time((*planet_sprites, ensemble), args.steps, args.delta_time, event_bus)
+        line = f"{amount:>8} {ensemble_time * 1E3:>13.3f} {ensemble_time / amount * 1E6:>15.2f}"
+
+        if amount <= args.max_rockets:
+            # the same fleet as separate rockets, decided one by one by SmartGroup
+            event_bus = EventBus()
+            planet_sprites = create_solar_system(event_bus)
+            earth, moon, sun, mars = [sprite.entity for sprite in planet_sprites]
+            # on distinct launch sites, the pairwise kernel divides by the distance between rockets
+            polar_angles = np.random.default_rng(0).normal(0, 0.01, amount)
+            rockets = [create_mars_mission_rocket(earth, sun, mars, polar_angle=polar_angle, event_bus=event_bus) for polar_angle in polar_angles]
+            rockets_time = fleet_step_time((*planet_sprites, *rockets), args.steps, args.delta_time, event_bus)
+            line += f" {rockets_time * 1E3:>12.3f} {rockets_time / ensemble_time:>8.1f}"
+
+        print(line)
+        sys.stdout.flush()
+
+
+# The coordinate list Vector, Point and Physics the scalar path had before the slots, the baseline of vectors
+class BaselineVector:
+    def __init__(self, *args):
+        if len(args) == 1 and (isinstance(args[0], list) or isinstance(args[0], tuple)):
+            self._coordinates = args[0][::]
+        elif len(args) == 2 and all(isinstance(arg, BaselinePoint) for arg in args):
+            point1, point2 = args
+            self._coordinates = [j - i for i, j in zip(point1.coordinates, point2.coordinates)]
+        else:
+            raise ValueError("Invalid number of arguments")
+
+    def __add__(self, other):
+        return BaselineVector([i + j for i, j in zip(self._coordinates, other.coordinates)])
+
+    def __iadd__(self, other):
+        self._coordinates = [i + j for i, j in zip(self._coordinates, other.coordinates)]
+        return self
+
+    def __isub__(self, other):
+        self._coordinates = [i - j for i, j in zip(self._coordinates, other.coordinates)]
+        return self
+
+    def __mul__(self, number: float):
+        return BaselineVector([i * number for i in self._coordinates])
+
+    def __truediv__(self, number: float):
+        return BaselineVector([i / number for i in self._coordinates])
+
+    @property
+    def coordinates(self):
+        return tuple(self._coordinates)
+
+    @property
+    def magnitude(self):
+        return math.sqrt(sum([i ** 2 for i in self._coordinates]))
+
+    def normalize(self):
+        magnitude = self.magnitude
+        return BaselineVector([i / magnitude for i in self._coordinates])
+
+
+class BaselinePoint:
+    def __init__(self, coordinates):
+        self._coordinates = coordinates
+
+    def __add__(self, vector: BaselineVector):
+        return BaselinePoint([i + j for i, j in zip(self._coordinates, vector.coordinates)])
+
+    @property
+    def x(self):
+        return self._coordinates[0]
+
+    @property
+    def y(self):
+        return self._coordinates[1]
+
+    @property
+    def coordinates(self):
+        return self._coordinates
+
+
+class BaselinePhysics:
+    @staticmethod
+    def calculate_gravity(body1: Entity, body2: Entity):
+        distance = math.sqrt((body1.position.x - body2.position.x) ** 2 + (body1.position.y - body2.position.y) ** 2)
+        gravity_force = Physics.G * body1.weight * body2.weight / distance ** 2
+        return BaselineVector(body1.position, body2.position).normalize() * gravity_force
+
+    @staticmethod
+    def apply_gravity(body1: Entity, body2: Entity):
+        force_vector = BaselinePhysics.calculate_gravity(body1, body2)
+        body1.force += force_vector
+        body2.force -= force_vector
+
+    @staticmethod
+    def move(body: Entity, delta_time: float):
+        acceleration = body.force / body.weight
+        body.position = body.position + body.speed * delta_time + acceleration * delta_time ** 2 / 2
+        body.speed += acceleration * delta_time
+
+
+def vector_operations(args):
+    # the scalar path of the physics groups: two bodies of the Earth-Moon system, one call at a time,
+    # against the same calls on the coordinate list baseline
+    earth = Entity(5.972E24, Point((0.0, 0.0)), Vector((0.0, -29780.0)), Vector((0.0, 0.0)))
+    moon = Entity(7.346E22, Point((384E6, 0.0)), Vector((0.0, -30802.0)), Vector((0.0, 0.0)))
+    speed = Vector((3.0, 4.0))
+    baseline_earth = Entity(5.972E24, BaselinePoint([0.0, 0.0]), BaselineVector((0.0, -29780.0)), BaselineVector((0.0, 0.0)))
+    baseline_moon = Entity(7.346E22, BaselinePoint([384E6, 0.0]), BaselineVector((0.0, -30802.0)), BaselineVector((0.0, 0.0)))
+    baseline_speed = BaselineVector((3.0, 4.0))
+    operations = {
+        "Physics.calculate_gravity": (lambda: Physics.calculate_gravity(earth, moon),
+                                      lambda: BaselinePhysics.calculate_gravity(baseline_earth, baseline_moon)),
+        "Physics.apply_gravity": (lambda: Physics.apply_gravity(earth, moon),
+                                  lambda: BaselinePhysics.apply_gravity(baseline_earth, baseline_moon)),
+        "Physics.move": (lambda: Physics.move(moon, 1.0), lambda: BaselinePhysics.move(baseline_moon, 1.0)),
+        "Vector +": (lambda: speed + speed, lambda: baseline_speed + baseline_speed),
+        "Vector *": (lambda: speed * 2.0, lambda: baseline_speed * 2.0),
+        "Vector.magnitude": (lambda: speed.magnitude, lambda: baseline_speed.magnitude),
+        "Vector.normalize": (lambda: speed.normalize(), lambda: baseline_speed.normalize()),
+    }
+
+    def per_call(operation):
+        def loop():
+            for _ in range(args.calls):
+                operation()
+        return measure(loop, args.repeat) / args.calls * 1E9
+
+    print(f"{'operation':>26} {'baseline, ns':>13} {'per call, ns':>13} {'speedup':>8}")
+    for name, (operation, baseline) in operations.items():
+        baseline_time, time_per_call = per_call(baseline), per_call(operation)
+        print(f"{name:>26} {baseline_time:>13.0f} {time_per_call:>13.0f} {baseline_time / time_per_call:>8.1f}")
+        sys.stdout.flush()
+
+
+class CountingSubscriber(EventSubscriber):
+    def __init__(self, event_bus: EventBus):
+        self.event_bus = event_bus
+        self.events = 0
+
+    def handle_event(self, event):
+        self.events += 1
+
+
+def event_dispatch(args):
+    # one subscriber of RocketEvent among many subscribers of other event types
+    speed, position = Vector((3.0, 4.0)), Point((1.0, 2.0))
+    print(f"{'subscribers':>12} {'per event, ns':>14} {'skipped, ns':>12}")
+    for amount in args.amounts:
+        event_bus = EventBus()
+        for index in range(amount - 1):
+            CountingSubscriber(event_bus).subscribe(PauseEvent if index % 2 else LogableEvent)
+        CountingSubscriber(event_bus).subscribe(RocketEvent)
+
+        def dispatch():
+            for _ in range(args.calls):
+                event_bus.register_event(RocketEvent(0, speed, position, position, 1.0, 1.0))
+
+        def skip():
+            for _ in range(args.calls):
+                if event_bus.has_subscribers(GravityTrackingEvent):
+                    raise AssertionError("GravityTrackingEvent has no subscribers")
+
+        print(f"{amount:>12} {measure(dispatch, args.repeat) / args.calls * 1E9:>14.0f} {measure(skip, args.repeat) / args.calls * 1E9:>12.0f}")
+        sys.stdout.flush()
+
+
+def make_earth_moon_system():
+    # Sun, Earth and Moon with the initial state of main.py
+    positions = np.array(((-1.496E11, 0), (0, 0), (384E6, 0)))
+    speeds = np.array(((0, 0), (0, -29780), (0, -29780 - 1.022E3)))
+    weights = np.array((1.989E30, 5.972E24, 7.346E22))
+    return positions, speeds, weights
+
+
+def total_energy(positions, speeds, weights):
+    kinetic = np.sum(weights * np.einsum("ij,ij->i", speeds, speeds)) / 2
+    first, second = np.triu_indices(len(weights), 1)
+    distances = np.linalg.norm(positions[second] - positions[first], axis=1)
+    return kinetic - np.sum(Physics.G * weights[first] * weights[second] / distances)
+
+
+def integrator_energy(args):
+    print(f"{'integrator':>10} {'step, s':>9} {'evaluations':>12} {'time, s':>8} {'energy error':>13}")
+    for name in args.integrators:
+        for delta_time in args.steps:
+            positions, speeds, weights = make_earth_moon_system()
+            initial_energy = total_energy(positions, speeds, weights)
+            integrator = INTEGRATORS[name]()
+            evaluations = 0
+
+            def field(trial_positions, time_offset):
+                nonlocal evaluations
+                evaluations += 1
+                return pairwise_accelerations(trial_positions, weights)
+
+            amount = int(args.days * 24 * 3600 / delta_time)
+            start = time.perf_counter()
+            accelerations = field(positions, 0)
+            for _ in range(amount):
+                positions, speeds = integrator.step(positions, speeds, weights, accelerations, field, delta_time)
+                accelerations = integrator.field_at(field, positions, weights)
+            elapsed = time.perf_counter() - start
+
+            error = abs((total_energy(positions, speeds, weights) - initial_energy) / initial_energy)
+            print(f"{name:>10} {delta_time:>9.0f} {evaluations:>12} {elapsed:>8.2f} {error:>13.2e}")
+            sys.stdout.flush()
+
+
+def configure():
+    parser = argparse.ArgumentParser(prog=sys.argv[0], description="Simulator benchmarks")
+    subparsers = parser.add_subparsers(required=True)
+
+    scaling = subparsers.add_parser("gravity-scaling", help="Barnes-Hut gravity time versus amount of bodies")
+    scaling.add_argument("--amounts", type=int, nargs="+", default=[100, 300, 1000, 3000, 10000, 30000, 100000])
+    scaling.add_argument("--theta", type=float, default=config.BARNES_HUT_THETA)
+    scaling.add_argument("--max-pairwise", type=int, default=3000, help="Largest amount of bodies to compare with the exact kernel")
+    scaling.add_argument("--repeat", type=int, default=3)
+    scaling.set_defaults(benchmark=gravity_scaling)
+
+    restricted = subparsers.add_parser("restricted", help="Restricted versus full pairwise gravity for a fleet of rockets")
+    restricted.add_argument("--amounts", type=int, nargs="+", default=[10, 100, 1000, 3000, 10000])
+    restricted.add_argument("--planets", type=int, default=5, help="Amount of massive bodies, the Sun included")
+    restricted.add_argument("--repeat", type=int, default=3)
+    restricted.set_defaults(benchmark=restricted_scaling)
+
+    fleet = subparsers.add_parser("ensemble", help="Step time of a vectorized rocket ensemble versus separate rockets")
+    fleet.add_argument("--amounts", type=int, nargs="+", default=[10, 100, 1000, 10000, 100000])
+    fleet.add_argument("--max-rockets", type=int, default=1000, help="Largest fleet to also fly as separate rockets")
+    fleet.add_argument("--steps", type=int, default=50)
+    fleet.add_argument("--delta-time", type=float, default=1 / 6)
+    fleet.set_defaults(benchmark=ensemble_scaling)
+
+    vectors = subparsers.add_parser("vectors", help="Time per call of the scalar Vector and Physics operations against the coordinate list baseline")
+    vectors.add_argument("--calls", type=int, default=100000)
+    vectors.add_argument("--repeat", type=int, default=5)
+    vectors.set_defaults(benchmark=vector_operations)
+
+    dispatch = subparsers.add_parser("events", help="Time to dispatch an event versus amount of subscribers")
+    dispatch.add_argument("--amounts", type=int, nargs="+", default=[1, 10, 100, 1000])
+    dispatch.add_argument("--calls", type=int, default=100000)
+    dispatch.add_argument("--repeat", type=int, default=5)
+    dispatch.set_defaults(benchmark=event_dispatch)
+
+    energy = subparsers.add_parser("integrators", help="Energy error of the integrators on the Sun-Earth-Moon system")
+    energy.add_argument("--integrators", nargs="+", default=list(INTEGRATORS), choices=list(INTEGRATORS))
+    energy.add_argument("--steps", type=float, nargs="+", default=[60, 600, 3600])
+    energy.add_argument("--days", type=float, default=30)
+    energy.set_defaults(benchmark=integrator_energy)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = configure()
+    args.benchmark(args)
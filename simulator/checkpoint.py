@@ -0,0 +1,252 @@
+import importlib
+import io
+import json
+import numbers
+import os
+
+import numpy as np
+
+import config
+from entities import DerivedState
+from simobjects import SimEnsembleObject
+
+FORMAT_VERSION = 3
+# entity attributes that belong to the simulation it lives in, not to its state
+ENTITY_BINDINGS = ("engine", "index", "derived_state", "event_bus")
+# the only modules whose classes a checkpoint may hold instances of (phases, orbits, conics, vectors, events)
+STATE_MODULES = ("entities", "rocket_phases", "kepler", "physics", "events")
+# the config settings a mission is built with, recorded so the same mission can be built again
+MISSION_SETTINGS = ("ENSEMBLE_SIZE", "ENSEMBLE_SEED", "ENSEMBLE_SPREAD", "INTEGRATOR", "COAST", "ARRAY_ENGINE",
+                    "RESTRICTED", "GRAVITY_MODE", "BARNES_HUT_THETA", "BARNES_HUT_EXACT_WEIGHT", "EPHEMERIS_PATH")
+
+
+# Checkpoints hold the state of a simulation, not its objects: they are restored into a simulation
+# built the same way (same mission, same sprite names). The state is plain data, JSON next to the
+# numpy arrays in one .npz file. Sprites and their entities are written as references by name, so
+# phases, orbits and collisions restored from a checkpoint point at the objects of the simulation
+# they are restored into. Other objects are instances of the classes of STATE_MODULES, written as
+# their attributes and numbered, so shared objects stay shared and cycles are kept.
+class CheckpointEncoder:
+    def __init__(self, sprites: dict):
+        self.references = {id(sprite): {"sprite": name} for name, sprite in sprites.items()}
+        self.references.update({id(sprite.entity): {"entity": name} for name, sprite in sprites.items() if sprite.entity is not None})
+        self.memo = {}
+        self.arrays = {}
+        # the encoded objects stay alive until the save ends, so their ids are not reused meanwhile
+        self.kept = []
+
+    def encode(self, value):
+        if value is None or type(value) in (bool, int, float, str):
+            return value
+        if isinstance(value, np.generic):
+            return value.item()
+        reference = self.references.get(id(value))
+        if reference is not None:
+            return reference
+        if id(value) in self.memo:
+            return {"ref": self.memo[id(value)]}
+        number = self.memo[id(value)] = len(self.memo)
+        self.kept.append(value)
+
+        if isinstance(value, np.ndarray):
+            key = f"array_{len(self.arrays)}"
+            self.arrays[key] = value
+            return {"id": number, "array": key}
+        if type(value) is list:
+            return {"id": number, "list": [self.encode(item) for item in value]}
+        if type(value) is tuple:
+            return {"id": number, "tuple": [self.encode(item) for item in value]}
+        if type(value) is dict:
+            return {"id": number, "dict": [[self.encode(key), self.encode(item)] for key, item in value.items()]}
+
+        cls = type(value)
+        if cls.__module__ not in STATE_MODULES:
+            raise TypeError(f"Checkpoints can not hold a {cls.__module__}.{cls.__qualname__}")
+        attributes = dict(vars(value)) if hasattr(value, "__dict__") else {}
+        for slot in (slot for base in cls.__mro__ for slot in getattr(base, "__slots__", ())):
+            attributes[slot] = getattr(value, slot)
+        return {"id": number, "class": f"{cls.__module__}.{cls.__qualname__}",
+                "attributes": {name: self.encode(item) for name, item in attributes.items()}}
+
+
+class CheckpointDecoder:
+    def __init__(self, sprites: dict, arrays):
+        self.sprites = sprites
+        self.arrays = arrays
+        self.memo = {}
+
+    def decode(self, value):
+        if not isinstance(value, dict):
+            return value
+        if "sprite" in value:
+            return self.sprites[value["sprite"]]
+        if "entity" in value:
+            return self.sprites[value["entity"]].entity
+        if "ref" in value:
+            return self.memo[value["ref"]]
+
+        number = value["id"]
+        if "array" in value:
+            result = self.memo[number] = np.array(self.arrays[value["array"]])
+        elif "list" in value:
+            result = self.memo[number] = []
+            result.extend(self.decode(item) for item in value["list"])
+        elif "tuple" in value:
+            result = self.memo[number] = tuple(self.decode(item) for item in value["tuple"])
+        elif "dict" in value:
+            result = self.memo[number] = {}
+            for key, item in value["dict"]:
+                result[self.decode(key)] = self.decode(item)
+        else:
+            module, _, name = value["class"].partition(".")
+            if module not in STATE_MODULES:
+                raise ValueError(f"Checkpoint holds a {value['class']}, not a simulation state class")
+            cls = getattr(importlib.import_module(module), name)
+            # created before its attributes are decoded, they may refer back to it
+            result = self.memo[number] = cls.__new__(cls)
+            for attribute, item in value["attributes"].items():
+                setattr(result, attribute, self.decode(item))
+        return result
+
+
+def simulation_sprites(simulation):
+    sprites = {sprite.name: sprite for sprite in simulation.objects}
+    if len(sprites) != len(simulation.objects):
+        raise ValueError("Checkpoints need sprites with unique names")
+    return sprites
+
+
+def mission_header(simulation):
+    # what a checkpoint is restored into, checked before any of its state is read
+    sprites = simulation_sprites(simulation)
+    return {
+        "version": FORMAT_VERSION,
+        "sprites": sorted(sprites),
+        "ensembles": {name: len(sprite.ensemble) for name, sprite in sprites.items() if isinstance(sprite, SimEnsembleObject)},
+        "settings": {name: getattr(config, name) for name in MISSION_SETTINGS},
+    }
+
+
+def read_mission(path: str):
+    with np.load(path, allow_pickle=False) as data:
+        if "mission" not in data.files:
+            raise ValueError("Checkpoint format 2 or older is not supported")
+        mission = json.loads(data["mission"].tobytes().decode())
+    if mission["version"] != FORMAT_VERSION:
+        raise ValueError(f"Checkpoint format {mission['version']} is not supported")
+    return mission
+
+
+def check_mission(simulation, mission):
+    current = mission_header(simulation)
+    if (mission["sprites"], mission["ensembles"]) != (current["sprites"], current["ensembles"]):
+        settings = ", ".join(f"{name}={value!r}" for name, value in mission["settings"].items())
+        raise ValueError(f"Checkpoint was saved from a mission with the sprites {mission['sprites']} and the ensembles "
+                         f"{mission['ensembles']}, not {current['sprites']} and {current['ensembles']}; "
+                         f"build the mission with the settings of the checkpoint: {settings}")
+
+
+def scalar_state(obj):
+    # the counters, clocks, step sizes and flags of groups, integrators and sprites; the ones numpy
+    # computed (an adaptive step size, a clock advanced by one) are kept as Python numbers
+    state = {}
+    for name, value in vars(obj).items():
+        if type(value) in (int, float, bool):
+            state[name] = value
+        elif isinstance(value, np.bool_):
+            state[name] = bool(value)
+        elif isinstance(value, np.integer):
+            state[name] = int(value)
+        elif isinstance(value, (numbers.Real, np.floating)):
+            state[name] = float(value)
+    return state
+
+
+def group_state(group):
+    state = {"group": scalar_state(group)}
+    for part in ("integrator", "sources"):
+        if getattr(group, part, None) is not None:
+            state[part] = scalar_state(getattr(group, part))
+    return state
+
+
+def entity_state(entity):
+    attributes = {name: value for name, value in vars(entity).items() if not name.startswith("_") and name not in ENTITY_BINDINGS}
+    return {"weight": entity.weight, "position": entity.position, "speed": entity.speed, "attributes": attributes}
+
+
+def save_checkpoint(simulation, path: str):
+    sprites = simulation_sprites(simulation)
+    entities = {name: sprite.entity for name, sprite in sprites.items() if sprite.entity is not None}
+    state = {
+        "simulation": {
+            "total_sim_time": simulation.total_sim_time,
+            "steps": simulation.steps,
+            "time_scale": simulation.time_scale,
+            "amount_of_iterations": simulation.amount_of_iterations,
+            "collisions": simulation.collisions,
+        },
+        "groups": [group_state(group) for group in simulation.groups],
+        "sprites": {name: dict(scalar_state(sprite), alive=sprite.alive()) for name, sprite in sprites.items()},
+        "entities": {name: entity_state(entity) for name, entity in entities.items()},
+        "ensembles": {
+            name: {"phases": sprite.ensemble.phases, "version": sprite.ensemble.version,
+                   "arrays": {key: value for key, value in vars(sprite.ensemble).items() if isinstance(value, np.ndarray)}}
+            for name, sprite in sprites.items() if isinstance(sprite, SimEnsembleObject)
+        },
+    }
+
+    encoder = CheckpointEncoder(sprites)
+    text = json.dumps(encoder.encode(state))
+    buffer = io.BytesIO()
+    mission = json.dumps(mission_header(simulation)).encode()
+    np.savez(buffer, mission=np.frombuffer(mission, dtype=np.uint8), state=np.frombuffer(text.encode(), dtype=np.uint8), **encoder.arrays)
+    # written next to the target first, an interrupted save leaves the previous checkpoint intact
+    with open(path + ".tmp", "wb") as checkpoint_file:
+        checkpoint_file.write(buffer.getbuffer())
+    os.replace(path + ".tmp", path)
+
+
+def load_checkpoint(simulation, path: str):
+    check_mission(simulation, read_mission(path))
+    sprites = simulation_sprites(simulation)
+    entities = {name: sprite.entity for name, sprite in sprites.items() if sprite.entity is not None}
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files if key != "mission"}
+    state = CheckpointDecoder(sprites, arrays).decode(json.loads(arrays.pop("state").tobytes().decode()))
+    if len(state["groups"]) != len(simulation.groups) or set(state["entities"]) != set(entities):
+        raise ValueError("Checkpoint was saved from a simulation built differently")
+
+    for name, value in state["simulation"].items():
+        setattr(simulation, name, value)
+    for group, saved in zip(simulation.groups, state["groups"]):
+        for part, values in saved.items():
+            target = group if part == "group" else getattr(group, part)
+            for name, value in values.items():
+                setattr(target, name, value)
+
+    for name, saved in state["entities"].items():
+        entity = entities[name]
+        for attribute, value in saved["attributes"].items():
+            setattr(entity, attribute, value)
+        entity.weight = saved["weight"]
+        entity.position = saved["position"]
+        entity.speed = saved["speed"]
+        if hasattr(entity, "derived_state"):
+            entity.derived_state = DerivedState()
+
+    for name, saved in state["ensembles"].items():
+        ensemble = sprites[name].ensemble
+        ensemble.phases = saved["phases"]
+        for attribute, value in saved["arrays"].items():
+            setattr(ensemble, attribute, value)
+        ensemble.version = saved["version"] + 1
+        ensemble.rockets = {}
+
+    for name, saved in state["sprites"].items():
+        sprite = sprites[name]
+        alive = saved.pop("alive")
+        for attribute, value in saved.items():
+            setattr(sprite, attribute, value)
+        if not alive and sprite.alive():
+            sprite.kill()
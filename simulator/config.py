@@ -2,6 +2,9 @@ OFFSET_DELTA = 3
 SCALE_DELTA = 1.03
 MOUSE_SCALE_DELTA = 1.03
 MIN_PLANETARY_SIZE = 1
+# planets wider than this many pixels are drawn as the polygon of their part inside the window
+MAX_CIRCLE_RADIUS = 4096
+HORIZON_SEGMENT_LENGTH = 8
 ROCKET_MARKER_SIZE = 2
 FONT_PATH = '../media/fonts/Inconsolata.ttf'
 ICON_PATH = '../media/icon.png'
@@ -15,6 +18,76 @@ MAX_AMOUNT_OF_ITERATIONS = 4096
 AMOUNT_OF_ITERATIONS_DELTA = 2
 CLICK_RADIUS = 60
 MOUSECLICK_TIME = 0.2
+PHYSICS_THREAD = False
+# wall seconds of physics per window frame instead of AMOUNT_OF_ITERATIONS steps, None to keep the steps;
+# the step and drawing costs are averaged with BUDGET_SMOOTHING, the rate shown is measured over RATE_INTERVAL
+PHYSICS_BUDGET = None
+BUDGET_SMOOTHING = 0.2
+RATE_INTERVAL = 0.5
+HEADLESS = False
+TIME_LIMIT = None
+SUMMARY_PATH = None
+# a headless run saves its final state to CHECKPOINT_PATH, the window on `k`; RESTORE_PATH is loaded
+# into the freshly built mission before it starts
+CHECKPOINT_PATH = None
+RESTORE_PATH = None
+# recordings hold the positions of every sprite every RECORD_INTERVAL simulated seconds; a replay
+# seeks by REPLAY_SEEK_FRACTION of its length
+RECORD_PATH = None
+RECORD_INTERVAL = 60
+REPLAY_PATH = None
+REPLAY_SEEK_FRACTION = 0.01
+# bodies whose gravity on the rockets is recorded for the gravity plot, by sprite name
+TRACKED_BODIES = ("Sun", "Earth")
+# rows of the plot telemetry: every N steps ("steps"), every N simulated seconds ("time") or once the
+# speed or height changed by the relative amount N ("change")
+TELEMETRY_SAMPLING = "steps"
+TELEMETRY_SAMPLING_VALUE = 1
+TELEMETRY_CHUNK_SIZE = 65536
+TELEMETRY_PATH = None
+# the plots are files drawn by a worker process, every curve is cut down to PLOT_POINTS samples
+PLOT_DIRECTORY = "plots"
+PLOT_FORMATS = ("png",)
+PLOT_POINTS = 2000
+ENSEMBLE_SIZE = 0
+ENSEMBLE_SEED = 0
+ENSEMBLE_SPREAD = 0.01
+# longest ensemble substep as a fraction of the orbital time scale sqrt(r^3 / mu) around the planet
+ENSEMBLE_STEP_FRACTION = 1E-3
+ARRAY_ENGINE = False
+GRAVITY_MODE = "pairwise"
+RESTRICTED = False
+BARNES_HUT_THETA = 0.5
+BARNES_HUT_EXACT_WEIGHT = 1E21
+INTEGRATOR = "euler"
+ADAPTIVE_TOLERANCE = 1E-9
+ADAPTIVE_ABSOLUTE_TOLERANCE = 1E-6
+ADAPTIVE_MIN_STEP = 1E-3
+ADAPTIVE_THRUST_STEP = 1 / 6
+# the cruise controller was tuned with the 1/60 s frames of the window at time scale 1000
+ADAPTIVE_CRUISE_STEP = 1000 / 60
+COAST = False
+COAST_MAX_STEP = 60
+EPHEMERIS_PATH = None
+EPHEMERIS_DURATION = 730 * 24 * 3600
+EPHEMERIS_SEGMENT_DURATION = 2 * 24 * 3600
+EPHEMERIS_DEGREE = 15
+EPHEMERIS_STEP = 300
+
+# rendered text surfaces kept for markers and widgets, and lines kept by the log widget
+TEXT_CACHE_SIZE = 512
+LOGGER_SCROLLBACK = 40
+
+# trails keep TRAIL_LENGTH positions, a new one once the sprite moved TRAIL_SAMPLE_PIXELS on the screen;
+# predicted orbits are ORBIT_POINTS points, hyperbolas drawn up to ORBIT_MAX_DISTANCE times the current distance
+TRAIL_LENGTH = 256
+TRAIL_SAMPLE_PIXELS = 4
+ORBIT_POINTS = 256
+ORBIT_MAX_DISTANCE = 10
+# a predicted orbit is sampled again at most every ORBIT_REFRESH wall seconds while only drifting
+ORBIT_REFRESH = 0.25
 
 draw_markers = True
 draw_widgets = True
+draw_trails = True
+draw_orbits = True
@@ -0,0 +1,49 @@
+import numpy as np
+
+from physics import Entity
+from entities import Planet
+from gravity import calculate_forces
+
+
+# Structure-of-arrays entity state: bound entities become views into these arrays,
+# so the physics groups can update all of them with batched array operations
+class ArrayEngine:
+    def __init__(self, *entities: Entity):
+        self.entities = list(entities)
+        amount = len(self.entities)
+        self.positions = np.zeros((amount, 2))
+        self.speeds = np.zeros((amount, 2))
+        self.forces = np.zeros((amount, 2))
+        self.weights = np.zeros(amount)
+        # planets are the massive bodies of the restricted problem, everything else is a test particle
+        self.massive = np.array([isinstance(entity, Planet) for entity in self.entities], dtype=bool)
+        # bumped by every write of positions, speeds or weights, it invalidates derived state of the entities
+        self.version = 0
+
+        for index, entity in enumerate(self.entities):
+            self.positions[index] = entity.position.coordinates
+            self.speeds[index] = entity.speed.coordinates
+            self.forces[index] = entity.force.coordinates
+            self.weights[index] = entity.weight
+            entity.engine = self
+            entity.index = index
+
+    def indices(self, entities):
+        # groups usually hold a contiguous run of the engine's entities: a slice then selects views of
+        # the rows instead of copies, which is most of the cost of an operation on a few bodies
+        indices = np.array([entity.index for entity in entities], dtype=np.intp)
+        if len(indices) and np.array_equal(indices, np.arange(indices[0], indices[0] + len(indices))):
+            return slice(int(indices[0]), int(indices[0]) + len(indices))
+        return indices
+
+    def reset_forces(self, indices):
+        self.forces[indices] = 0
+
+    def apply_gravity(self, indices):
+        self.forces[indices] += calculate_forces(self.positions[indices], self.weights[indices], self.massive[indices])
+
+    def move(self, indices, delta_time: float):
+        acceleration = self.forces[indices] / self.weights[indices, np.newaxis]
+        self.positions[indices] = self.positions[indices] + self.speeds[indices] * delta_time + acceleration * delta_time ** 2 / 2
+        self.speeds[indices] += acceleration * delta_time
+        self.version += 1
@@ -0,0 +1,306 @@
+import math
+
+import numpy as np
+
+import config
+from entities import Planet, PhaseControlledRocket, DerivedState
+from events import EventBus
+from gravity import test_particle_accelerations
+from physics import Physics
+
+
+# Structure-of-arrays state of a fleet of phase controlled rockets that share one phase list and one
+# solar system. The rockets are test particles of the planets; every step each phase of the list
+# decides for all the rockets that are currently in it at once (RocketPhase.make_batch_decision).
+class RocketEnsemble:
+    def __init__(self, planets, planet: Planet, phases, weights, payload_weights, polar_angles, target_accelerations, fuel_speeds,
+                 event_bus: EventBus = None):
+        self.planets = list(planets)
+        self.event_bus = event_bus if event_bus is not None else EventBus()
+        self.phases = list(phases)
+        self.weights = np.array(weights, dtype=float)
+        amount = len(self.weights)
+        self.payload_weights = np.broadcast_to(np.asarray(payload_weights, dtype=float), (amount,)).copy()
+        self.target_accelerations = np.broadcast_to(np.asarray(target_accelerations, dtype=float), (amount,)).copy()
+        self.fuel_speeds = np.broadcast_to(np.asarray(fuel_speeds, dtype=float), (amount,)).copy()
+        polar_angles = np.broadcast_to(np.asarray(polar_angles, dtype=float), (amount,))
+
+        self.planet_index = np.full(amount, self.planets.index(planet), dtype=np.intp)
+        self.phase_index = np.zeros(amount, dtype=np.intp)
+        # time spent in the current phase, the per-rocket state of the phases that need one
+        self.phase_time = np.zeros(amount)
+        # thrust coefficient of the last step, where the phases that search one start the next search
+        self.phase_coefficient = np.ones(amount)
+        self.active = np.ones(amount, dtype=bool)
+        self.out_of_fuel = np.zeros(amount, dtype=bool)
+        self.collision_planet = np.full(amount, -1, dtype=np.intp)
+        self.collision_speed = np.full(amount, np.nan)
+        self.forces = np.zeros((amount, 2))
+        # derived state of the EnsembleRocket views, like ArrayEngine.version
+        self.version = 0
+        self.refresh_planets()
+
+        # on the surface like BaseRocket, moving with it
+        directions = np.column_stack((np.cos(polar_angles), np.sin(polar_angles)))
+        self.positions = self.planet_positions[self.planet_index] + directions * (planet.radius + 1)
+        surface_speeds = np.column_stack((-directions[:, 1], directions[:, 0])) * planet.angle_speed * planet.radius
+        self.speeds = self.planet_speeds[self.planet_index] + surface_speeds
+        self.rockets = {}
+
+    def __len__(self):
+        return len(self.weights)
+
+    def refresh_planets(self):
+        self.planet_positions = np.array([planet.position.coordinates for planet in self.planets], dtype=float).reshape(-1, 2)
+        self.planet_speeds = np.array([planet.speed.coordinates for planet in self.planets], dtype=float).reshape(-1, 2)
+        self.planet_weights = np.array([planet.weight for planet in self.planets], dtype=float)
+        self.planet_radiuses = np.array([planet.radius for planet in self.planets], dtype=float)
+        self.planet_angle_speeds = np.array([planet.angle_speed for planet in self.planets], dtype=float)
+        self.planet_accelerations = np.array([(planet.force / planet.weight).coordinates for planet in self.planets], dtype=float).reshape(-1, 2)
+
+    @property
+    def finished(self):
+        return bool(np.all(~self.active | (self.phase_index >= len(self.phases))))
+
+    @property
+    def crashed(self):
+        # hit a planet before the last phase ended
+        return bool(np.any(~self.active & (self.phase_index < len(self.phases))))
+
+    def rocket(self, row: int):
+        # scalar view of one row for the phases without a batch decision
+        if row not in self.rockets:
+            self.rockets[row] = EnsembleRocket(self, row)
+        return self.rockets[row]
+
+    def planet_of(self, planet: Planet):
+        return self.planets.index(planet)
+
+    def position_vectors(self, rows, planets=None):
+        planets = self.planet_index[rows] if planets is None else planets
+        return self.positions[rows] - self.planet_positions[planets]
+
+    def relative_speeds(self, rows, planets=None):
+        planets = self.planet_index[rows] if planets is None else planets
+        return self.speeds[rows] - self.planet_speeds[planets]
+
+    def radial_directions(self, rows):
+        position_vectors = self.position_vectors(rows)
+        return position_vectors / np.linalg.norm(position_vectors, axis=1)[:, np.newaxis]
+
+    def heights(self, rows):
+        return np.linalg.norm(self.position_vectors(rows), axis=1) - self.planet_radiuses[self.planet_index[rows]]
+
+    def gravity_to_planet(self, rows):
+        position_vectors = self.position_vectors(rows)
+        distances = np.linalg.norm(position_vectors, axis=1)
+        pull = Physics.G * self.weights[rows] * self.planet_weights[self.planet_index[rows]] / distances ** 3
+        return -position_vectors * pull[:, np.newaxis]
+
+    def orbits(self, rows, planets=None, positions=None, speeds=None):
+        # Orbit.calculate_orbit for many rockets: specific energy, eccentricity, perigee and apogee
+        # distance. A non-negative energy is an open orbit, the scalar code raises ValueError on it.
+        planets = self.planet_index[rows] if planets is None else planets
+        positions = self.positions[rows] if positions is None else positions
+        speeds = self.speeds[rows] if speeds is None else speeds
+        mu = Physics.G * self.planet_weights[planets]
+        r = positions - self.planet_positions[planets]
+        v = speeds - self.planet_speeds[planets]
+        distances = np.linalg.norm(r, axis=1)
+        energy = np.einsum("ij,ij->i", v, v) / 2 - mu / distances
+        angular_momentum = r[:, 0] * v[:, 1] - r[:, 1] * v[:, 0]
+        eccentricity = np.sqrt(np.maximum(1 + 2 * energy * angular_momentum ** 2 / mu ** 2, 0))
+        with np.errstate(divide="ignore"):
+            semi_major_axis = -mu / (2 * energy)
+        return energy, eccentricity, semi_major_axis * (1 - eccentricity), semi_major_axis * (1 + eccentricity)
+
+    def fire_engine(self, rows, thrust, delta_time: float):
+        next_weights = self.weights[rows] - np.linalg.norm(thrust, axis=1) * delta_time / self.fuel_speeds[rows]
+        fueled = next_weights >= self.payload_weights[rows]
+        self.forces[rows[fueled]] += thrust[fueled]
+        self.weights[rows[fueled]] = next_weights[fueled]
+        self.version += 1
+        self.out_of_fuel[rows[~fueled]] = True
+
+    def add_speed(self, rows, delta_v_required, delta_time: float):
+        # RocketPhase.add_speed for many rockets
+        magnitudes = np.linalg.norm(delta_v_required, axis=1)
+        delta_v_actual = np.minimum(magnitudes, self.target_accelerations[rows] * delta_time)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            directions = np.nan_to_num(delta_v_required / magnitudes[:, np.newaxis])
+        self.fire_engine(rows, directions * (self.weights[rows] * delta_v_actual / delta_time)[:, np.newaxis], delta_time)
+
+    @staticmethod
+    def solve_coefficients(function, guesses, tolerance: float = 0.001):
+        # RocketPhase.solve_coefficient for many rockets: function takes indexes into guesses and a
+        # coefficient for each of them, NaN stands for None. Every rocket keeps its own bracket and
+        # only the rockets whose bracket is still too wide are evaluated again.
+        everything = np.arange(len(guesses))
+        coefficients = np.ones(len(guesses))
+        low, low_values = np.zeros(len(guesses)), function(everything, np.zeros(len(guesses)))
+        coefficients[~(low_values > 0)] = 0
+        pending = everything[low_values > 0]
+
+        high, high_values = np.array(guesses, dtype=float), np.full(len(guesses), np.nan)
+        high_values[pending] = function(pending, high[pending])
+        above = pending[high_values[pending] > 0]
+        pending = pending[~(high_values[pending] > 0)]
+        above = above[high[above] < 1]
+        low[above], low_values[above] = high[above], high_values[above]
+        high[above] = 1
+        high_values[above] = function(above, high[above])
+        pending = np.concatenate((pending, above[~(high_values[above] > 0)]))
+        bracketed = pending
+
+        side = np.zeros(len(guesses))
+        pending = pending[high[pending] - low[pending] > tolerance]
+        while len(pending) != 0:
+            with np.errstate(invalid="ignore"):
+                coefficients[pending] = low[pending] + (high[pending] - low[pending]) * low_values[pending] / (low_values[pending] - high_values[pending])
+            coefficients[pending] = np.where(np.isnan(high_values[pending]), (low[pending] + high[pending]) / 2, coefficients[pending])
+            coefficients[pending] = np.clip(coefficients[pending], low[pending] + tolerance / 2, high[pending] - tolerance / 2)
+            values = function(pending, coefficients[pending])
+
+            below = ~(values > 0)
+            low_values[pending[below & (side[pending] < 0)]] /= 2
+            high_values[pending[~below & (side[pending] > 0)]] /= 2
+            high[pending[below]], high_values[pending[below]] = coefficients[pending[below]], values[below]
+            low[pending[~below]], low_values[pending[~below]] = coefficients[pending[~below]], values[~below]
+            side[pending] = np.where(below, -1, 1)
+            pending = pending[high[pending] - low[pending] > tolerance]
+
+        coefficients[bracketed] = (low[bracketed] + high[bracketed]) / 2
+        return coefficients
+
+    def end_phase(self, rows):
+        self.phase_index[rows] += 1
+        self.phase_time[rows] = 0
+        self.phase_coefficient[rows] = 1
+
+    def make_decisions(self, delta_time: float):
+        # rows are grouped before any phase runs: a rocket enters its next phase on the next step
+        deciding = np.flatnonzero(self.active & (self.phase_index < len(self.phases)))
+        current = self.phase_index[deciding]
+        for phase_index in np.unique(current):
+            self.phases[phase_index].make_batch_decision(self, deciding[current == phase_index], delta_time)
+
+    def collide(self):
+        rows = np.flatnonzero(self.active)
+        difference = self.positions[rows, np.newaxis, :] - self.planet_positions[np.newaxis, :, :]
+        inside = np.einsum("ijk,ijk->ij", difference, difference) < self.planet_radiuses ** 2
+        hit = np.any(inside, axis=1)
+        if not np.any(hit):
+            return
+
+        rows, planets = rows[hit], np.argmax(inside[hit], axis=1)
+        position_vectors = self.positions[rows] - self.planet_positions[planets]
+        radial = position_vectors / np.linalg.norm(position_vectors, axis=1)[:, np.newaxis]
+        surface_speeds = np.column_stack((-radial[:, 1], radial[:, 0])) * (self.planet_radiuses * self.planet_angle_speeds)[planets, np.newaxis]
+        self.collision_planet[rows] = planets
+        self.collision_speed[rows] = np.linalg.norm(self.speeds[rows] - self.planet_speeds[planets] - surface_speeds, axis=1)
+        self.active[rows] = False
+
+    def move(self, delta_time: float, start_weights, end_planet_positions=None):
+        rows = np.flatnonzero(self.active)
+        # gravity pulls the weight from before this step's burn, as GravityGroup goes before SmartGroup
+        gravity = test_particle_accelerations(self.positions[rows], self.planet_positions, Physics.G * self.planet_weights) * start_weights[rows, np.newaxis]
+        accelerations = (gravity + self.forces[rows]) / self.weights[rows, np.newaxis]
+        self.positions[rows] += self.speeds[rows] * delta_time + accelerations * delta_time ** 2 / 2
+        if end_planet_positions is not None:
+            # substeps take the mean of the gravity at both of their ends for the speed (velocity Verlet)
+            end_gravity = test_particle_accelerations(self.positions[rows], end_planet_positions, Physics.G * self.planet_weights) * start_weights[rows, np.newaxis]
+            accelerations = ((gravity + end_gravity) / 2 + self.forces[rows]) / self.weights[rows, np.newaxis]
+        self.speeds[rows] += accelerations * delta_time
+        self.version += 1
+
+    def max_step(self):
+        # the smallest limit the phases of the flying rockets put on a variable step, None for no limit
+        self.refresh_planets()
+        rows = np.flatnonzero(self.active & (self.phase_index < len(self.phases)))
+        current = self.phase_index[rows]
+        limits = [self.phases[phase_index].batch_max_step(self, rows[current == phase_index]) for phase_index in np.unique(current)]
+        limits = [limit for limit in limits if limit is not None]
+        return min(limits) if limits else None
+
+    def substep_limit(self):
+        # a fraction of the shortest orbital time scale sqrt(r^3 / mu) of the flying rockets
+        rows = np.flatnonzero(self.active)
+        if len(rows) == 0:
+            return None
+        distances = np.linalg.norm(self.position_vectors(rows), axis=1)
+        time_scales = np.sqrt(distances ** 3 / (Physics.G * self.planet_weights[self.planet_index[rows]]))
+        return config.ENSEMBLE_STEP_FRACTION * float(np.min(time_scales))
+
+    def update(self, delta_time: float, verlet: bool = False):
+        self.refresh_planets()
+        start_weights = self.weights.copy()
+        self.forces[:] = 0
+        # the phases decide once for the whole step, like SmartGroup for a rocket, so a phase still
+        # starts on the step after the one that ended the previous phase
+        self.make_decisions(delta_time)
+
+        # the rockets take one constant acceleration step like Physics.move, or a velocity Verlet step
+        # next to the higher order integrators; a long step (coasting, adaptive integration) is split
+        # into Verlet substeps during which the planets follow their state at the start of the step
+        limit = self.substep_limit()
+        substeps = max(math.ceil(delta_time / limit), 1) if limit else 1
+        step = delta_time / substeps
+        start_positions, start_speeds = self.planet_positions, self.planet_speeds
+        planet_positions = lambda time_offset: start_positions + start_speeds * time_offset + self.planet_accelerations * time_offset ** 2 / 2
+        for substep in range(substeps):
+            if substep != 0:
+                self.planet_positions = planet_positions(substep * step)
+                self.planet_speeds = start_speeds + self.planet_accelerations * (substep * step)
+            self.collide()
+            self.move(step, start_weights, planet_positions((substep + 1) * step) if verlet or substeps > 1 else None)
+
+    def summary(self):
+        done = self.phase_index >= len(self.phases)
+        return {
+            "rockets": len(self),
+            "phases_complete": int(np.count_nonzero(done)),
+            "crashed": int(np.count_nonzero(~self.active & ~done)),
+            "out_of_fuel": int(np.count_nonzero(self.out_of_fuel)),
+            "phase_counts": np.bincount(self.phase_index, minlength=len(self.phases) + 1).tolist(),
+        }
+
+
+# One row of an ensemble seen as a PhaseControlledRocket: the entity is bound to the ensemble arrays
+# like to an ArrayEngine, its planet and the end of its phases go through the ensemble
+class EnsembleRocket(PhaseControlledRocket):
+    def __init__(self, ensemble: RocketEnsemble, row: int):
+        self.ensemble = ensemble
+        self.engine = ensemble
+        self.index = row
+        self.derived_state = DerivedState()
+
+    @property
+    def planet(self):
+        return self.ensemble.planets[self.ensemble.planet_index[self.index]]
+
+    @planet.setter
+    def planet(self, planet: Planet):
+        self.ensemble.planet_index[self.index] = self.ensemble.planet_of(planet)
+
+    @property
+    def event_bus(self):
+        return self.ensemble.event_bus
+
+    @property
+    def payload_weight(self):
+        return float(self.ensemble.payload_weights[self.index])
+
+    @property
+    def fuel_speed(self):
+        return float(self.ensemble.fuel_speeds[self.index])
+
+    @property
+    def target_acceleration(self):
+        return float(self.ensemble.target_accelerations[self.index])
+
+    @property
+    def phase_stack(self):
+        return self.ensemble.phases[self.ensemble.phase_index[self.index]:][::-1]
+
+    def end_phase(self):
+        self.ensemble.end_phase(np.array([self.index]))
@@ -1,7 +1,9 @@
 import math
 
+import config
 from physics import Entity, Point, Vector, Physics
-from events import EventRegistrer, RocketEntityOutOfFuelEvent
+from events import EventBus, RocketEntityOutOfFuelEvent
+from kepler import Conic
 
 
 class Planet(Entity):
@@ -15,11 +17,29 @@ class Planet(Entity):
         return Vector.make_vector_by_polar_angle(polar_angle + math.pi / 2, self.angle_speed * self.radius)
 
 
+class DerivedState:
+    def __init__(self):
+        self.version = None
+        self.planet = None
+        self.planet_version = None
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def reset(self, version: int, planet, planet_version: int):
+        self.version = version
+        self.planet = planet
+        self.planet_version = planet_version
+        self.values = {}
+
+
 class BaseRocket(Entity):
-    def __init__(self, weight: float, payload_weight: float, planet: Planet, polar_angle: float, fuel_speed: float):
+    def __init__(self, weight: float, payload_weight: float, planet: Planet, polar_angle: float, fuel_speed: float, event_bus: EventBus = None):
         position = planet.position + Vector.make_vector_by_polar_angle(polar_angle, planet.radius + 1)
         speed = planet.surface_speed(polar_angle) + planet.speed
         super().__init__(weight, position, speed)
+        self.event_bus = event_bus if event_bus is not None else EventBus()
+        self.derived_state = DerivedState()
         self.planet = planet
         self.payload_weight = payload_weight
         self.fuel_speed = fuel_speed
@@ -30,44 +50,84 @@ class BaseRocket(Entity):
             self.force += engine_force_vector
             self.weight = next_weight
         else:
-            EventRegistrer.register_event(RocketEntityOutOfFuelEvent(self))
+            self.event_bus.register_event(RocketEntityOutOfFuelEvent(self))
+
+    def derived(self, name: str, compute):
+        # quantities derived from the state of the rocket and its planet are computed once per state:
+        # moving either body, burning fuel or switching the planet starts a new cache
+        planet = self.planet
+        version = self._version if self.engine is None else self.engine.version
+        planet_version = planet._version if planet.engine is None else planet.engine.version
+        derived_state = self.derived_state
+        if derived_state.version == version and derived_state.planet_version == planet_version and derived_state.planet is planet:
+            value = derived_state.values.get(name)
+            if value is not None:
+                derived_state.hits += 1
+                return value
+        else:
+            derived_state.reset(version, planet, planet_version)
+        derived_state.misses += 1
+        value = derived_state.values[name] = compute(self)
+        return value
+
+    # the cached vectors are shared by every caller, they must not be changed in place
 
     @property
     def absolute_height(self):
-        return Physics.calculate_distance(self.position, self.planet.position)
+        return self.derived("absolute_height", lambda rocket: Physics.calculate_distance(rocket.position, rocket.planet.position))
 
     @property
     def height(self):
-        return Physics.calculate_distance(self.position, self.planet.position) - self.planet.radius
+        return self.derived("height", lambda rocket: Physics.calculate_distance(rocket.position, rocket.planet.position) - rocket.planet.radius)
 
     @property
     def position_vector(self):
-        return Vector(self.planet.position, self.position)
+        return self.derived("position_vector", lambda rocket: Vector(rocket.planet.position, rocket.position))
 
     @property
     def polar_angle(self):
-        return self.position_vector.polar_angle
+        return self.derived("polar_angle", lambda rocket: rocket.position_vector.polar_angle)
 
     @property
     def gravity_to_planet(self):
-        return Physics.calculate_gravity(self, self.planet)
+        return self.derived("gravity_to_planet", lambda rocket: Physics.calculate_gravity(rocket, rocket.planet))
 
     @property
     def relative_speed(self):
-        return self.speed - self.planet.speed
+        return self.derived("relative_speed", lambda rocket: rocket.speed - rocket.planet.speed)
 
     @property
     def takeoff_speed(self):
-        return self.position_vector.normalize() * Vector.dot_product(self.position_vector.normalize(), self.relative_speed)
+        return self.derived("takeoff_speed", lambda rocket: rocket.position_vector.normalize() * rocket.radial_speed)
+
+    @property
+    def conic(self):
+        return self.derived("conic", lambda rocket: Conic(rocket.position_vector, rocket.relative_speed, Physics.G * rocket.planet.weight))
+
+    @property
+    def orbit(self):
+        # the osculating orbit around rocket.planet, ValueError on an open one (never cached)
+        return self.derived("orbit", lambda rocket: Orbit.calculate_orbit(rocket.planet, rocket))
+
+    @property
+    def coasting(self):
+        return False
+
+    @property
+    def radial_speed(self):
+        return self.derived("radial_speed", lambda rocket: Vector.dot_product(rocket.position_vector.normalize(), rocket.relative_speed))
 
     def make_decision(self, delta_time: float):
         raise NotImplementedError("Call make_decision of BaseRocket")
 
+    def max_step(self):
+        return None
+
 
 class PhaseControlledRocket(BaseRocket):
     def __init__(self, weight: float, payload_weight: float, planet: Planet, polar_angle: float,
-                 phase_list, target_acceleration: float = 3.0 * 9.8, fuel_speed: float = 3000):
-        super().__init__(weight, payload_weight, planet, polar_angle, fuel_speed)
+                 phase_list, target_acceleration: float = 3.0 * 9.8, fuel_speed: float = 3000, event_bus: EventBus = None):
+        super().__init__(weight, payload_weight, planet, polar_angle, fuel_speed, event_bus)
         self.target_acceleration = target_acceleration
         self.phase_stack = phase_list[::-1]
 
@@ -85,11 +145,60 @@ class PhaseControlledRocket(BaseRocket):
         if len(self.phase_stack) != 0:
             self.phase_stack[-1].make_decision(self, delta_time)
 
+    def max_step(self):
+        if len(self.phase_stack) != 0:
+            return self.phase_stack[-1].max_step(self)
+        return None
+
+    @property
+    def coasting(self):
+        return len(self.phase_stack) != 0 and self.phase_stack[-1].coasting
+
 
 class RocketPhase:
+    # coasting phases never fire the engine, in coast mode the rocket follows its conic analytically
+    coasting = False
+    # phases that keep state of the rocket they fly on the phase object (time in the phase, a warm
+    # start) are shared by all rows of an ensemble: they keep that state per row and never fall back
+    # to scalar views
+    stateful = False
+
     def make_decision(self, rocket: PhaseControlledRocket, delta_time: float):
         raise NotImplementedError("Call make_decision of abstract phase")
 
+    def check_batch(self, method: str):
+        if self.stateful:
+            raise NotImplementedError(f"{type(self).__name__} keeps per-rocket state and needs its own {method}")
+
+    def make_batch_decision(self, ensemble, rows, delta_time: float):
+        # the decision for the rows of a RocketEnsemble in this phase, phases without an array
+        # version decide rocket by rocket through scalar views of the rows
+        self.check_batch("make_batch_decision")
+        for row in rows.tolist():
+            self.make_decision(ensemble.rocket(row), delta_time)
+
+    def max_step(self, rocket: PhaseControlledRocket):
+        # the largest step the phase can be sampled with when the step size is variable, None for no limit
+        return config.ADAPTIVE_THRUST_STEP
+
+    def batch_max_step(self, ensemble, rows):
+        # max_step for the rows of a RocketEnsemble in this phase, through scalar views of the rows
+        # unless the phase keeps the default limit, which is the same for every rocket
+        if type(self).max_step is RocketPhase.max_step:
+            return self.max_step(None)
+        self.check_batch("batch_max_step")
+        limits = [self.max_step(ensemble.rocket(row)) for row in rows.tolist()]
+        limits = [limit for limit in limits if limit is not None]
+        return min(limits) if limits else None
+
+    @staticmethod
+    def time_to_height(rocket: PhaseControlledRocket, target_height: float):
+        radial_speed = rocket.radial_speed
+        distance = target_height - rocket.height
+        if distance * radial_speed <= 0:
+            return None
+        return distance / radial_speed
+
     @staticmethod
     def add_speed(rocket: PhaseControlledRocket, delta_v_required: Vector, delta_time: float):
         delta_v_actual = min(delta_v_required.magnitude, rocket.target_acceleration * delta_time)
@@ -102,6 +211,45 @@ class RocketPhase:
         thrust_vector = acceleration_required.normalize() * acceleration_actual_magnitude
         rocket.fire_engine(thrust_vector, delta_time)
 
+    @staticmethod
+    def solve_coefficient(function, guess: float = 1, tolerance: float = 0.001):
+        # The thrust coefficient in [0, 1] at which function, positive without thrust, first drops to
+        # zero or below (None counts as below), 1 if it never does. The guess, usually the answer of
+        # the last step, is tried first; around it the bracket of the root is narrowed with
+        # regula falsi (Illinois) steps until it is tolerance wide.
+        low, low_value = 0, function(0)
+        if low_value is None or low_value <= 0:
+            return 0
+        high, high_value = guess, function(guess)
+        if high_value is not None and high_value > 0:
+            if guess >= 1:
+                return 1
+            low, low_value = high, high_value
+            high, high_value = 1, function(1)
+            if high_value is not None and high_value > 0:
+                return 1
+
+        side = 0
+        while high - low > tolerance:
+            if high_value is None:
+                coefficient = (low + high) / 2
+            else:
+                coefficient = low + (high - low) * low_value / (low_value - high_value)
+            # at least half a tolerance inside, so a root next to an end is bracketed on the next step
+            coefficient = min(max(coefficient, low + tolerance / 2), high - tolerance / 2)
+            value = function(coefficient)
+            if value is None or value <= 0:
+                high, high_value = coefficient, value
+                if side < 0:
+                    low_value /= 2
+                side = -1
+            else:
+                low, low_value = coefficient, value
+                if side > 0 and high_value is not None:
+                    high_value /= 2
+                side = 1
+        return (low + high) / 2
+
     @staticmethod
     def add_force(rocket: PhaseControlledRocket, force_required: Vector, delta_time):
         RocketPhase.add_acceleration(rocket, force_required / rocket.weight, delta_time)
@@ -0,0 +1,131 @@
+import argparse
+import json
+import math
+import os
+import sys
+
+import numpy as np
+from numpy.polynomial import chebyshev
+
+import config
+from gravity import pairwise_accelerations
+from integrators import YoshidaIntegrator
+
+
+# Planet states as piecewise Chebyshev polynomials. The coefficients live in a .npy file that is
+# memory-mapped read-only, so every process evaluating the same ephemeris shares one copy.
+class Ephemeris:
+    def __init__(self, path: str):
+        with open(path + ".json") as metadata_file:
+            metadata = json.load(metadata_file)
+        self.names = metadata["names"]
+        self.weights = metadata["weights"]
+        self.segment_duration = metadata["segment_duration"]
+        # the simulation time and the states of the bodies the integration started from
+        self.epoch = metadata.get("epoch", 0)
+        self.initial_states = metadata.get("initial_states")
+        # segments x bodies x (x, y, vx, vy) x coefficients
+        self.coefficients = np.load(path + ".npy", mmap_mode="r")
+        self.segment = None
+        self.segment_coefficients = None
+
+    @property
+    def duration(self):
+        return self.segment_duration * len(self.coefficients)
+
+    def state(self, time: float):
+        time -= self.epoch
+        segment = int(time // self.segment_duration)
+        # the end of the last segment belongs to it, up to the rounding of the clocks that reach it
+        if segment == len(self.coefficients) and time <= self.duration + self.segment_duration * 1E-9:
+            segment -= 1
+        if not 0 <= segment < len(self.coefficients):
+            raise ValueError(f"Time {time:.0f} s is outside of the ephemeris (0 - {self.duration:.0f} s)")
+
+        if segment != self.segment:
+            # copy the current segment out of the map once, consecutive steps mostly stay inside it
+            self.segment = segment
+            self.segment_coefficients = np.array(self.coefficients[segment])
+
+        x = 2 * (time - segment * self.segment_duration) / self.segment_duration - 1
+        polynomials = [1.0, x]
+        while len(polynomials) < self.segment_coefficients.shape[-1]:
+            polynomials.append(2 * x * polynomials[-1] - polynomials[-2])
+        state = self.segment_coefficients @ polynomials
+        return state[:, :2], state[:, 2:]
+
+    def rows(self, names, weights):
+        rows = []
+        for name, weight in zip(names, weights):
+            if name not in self.names or not math.isclose(weight, self.weights[self.names.index(name)], rel_tol=1E-12):
+                raise ValueError(f"Ephemeris has no body {name} with weight {weight}")
+            rows.append(self.names.index(name))
+        return rows
+
+    @staticmethod
+    def build(path: str, entities, names, duration: float, segment_duration: float = None, degree: int = None, step: float = None, epoch: float = 0):
+        segment_duration = segment_duration if segment_duration is not None else config.EPHEMERIS_SEGMENT_DURATION
+        degree = degree if degree is not None else config.EPHEMERIS_DEGREE
+        step = step if step is not None else config.EPHEMERIS_STEP
+
+        positions = np.array([entity.position.coordinates for entity in entities], dtype=float)
+        speeds = np.array([entity.speed.coordinates for entity in entities], dtype=float)
+        weights = np.array([entity.weight for entity in entities], dtype=float)
+        integrator = YoshidaIntegrator()
+        field = lambda trial_positions, time_offset: pairwise_accelerations(trial_positions, weights)
+
+        # states are sampled at the Chebyshev nodes of every segment, which makes the fit an interpolation
+        nodes = np.sort(np.cos(np.pi * (np.arange(degree + 1) + 0.5) / (degree + 1)))
+        segments = math.ceil(duration / segment_duration)
+        coefficients = np.zeros((segments, len(entities), 4, degree + 1))
+        time = 0.0
+
+        for segment in range(segments):
+            start = segment * segment_duration
+            samples = []
+            for sample_time in list(start + (nodes + 1) / 2 * segment_duration) + [start + segment_duration]:
+                while sample_time - time > 0:
+                    delta_time = min(step, sample_time - time)
+                    positions, speeds = integrator.step(positions, speeds, weights, integrator.field_at(field, positions, weights), field, delta_time)
+                    time += delta_time
+                samples.append(np.concatenate((positions, speeds), axis=1))
+
+            samples = np.array(samples[:-1])
+            for body in range(len(entities)):
+                coefficients[segment, body] = chebyshev.chebfit(nodes, samples[:, body, :], degree).T
+
+        np.save(path + ".npy", coefficients)
+        with open(path + ".json", "w") as metadata_file:
+            json.dump({"names": list(names), "weights": weights.tolist(), "segment_duration": segment_duration, "epoch": epoch,
+                       "initial_states": Ephemeris.initial_states_of(entities)}, metadata_file)
+        return Ephemeris(path)
+
+    @staticmethod
+    def initial_states_of(entities):
+        return [[*entity.position.coordinates, *entity.speed.coordinates] for entity in entities]
+
+    @staticmethod
+    def open_or_build(path: str, sprites, duration: float, epoch: float = 0):
+        names = [sprite.name for sprite in sprites]
+        weights = [sprite.entity.weight for sprite in sprites]
+        entities = [sprite.entity for sprite in sprites]
+        if os.path.exists(path + ".npy") and os.path.exists(path + ".json"):
+            ephemeris = Ephemeris(path)
+            # rebuilt whenever the bodies or where they start from change; files without an epoch or
+            # initial states predate them and are rebuilt too
+            if (ephemeris.names == names and np.allclose(ephemeris.weights, weights, rtol=1E-12, atol=0) and ephemeris.duration >= duration
+                    and ephemeris.epoch == epoch and ephemeris.initial_states == Ephemeris.initial_states_of(entities)):
+                return ephemeris
+        return Ephemeris.build(path, entities, names, duration, epoch=epoch)
+
+
+if __name__ == '__main__':
+    from mission import create_solar_system
+
+    parser = argparse.ArgumentParser(prog=sys.argv[0], description="Build the planetary ephemeris")
+    parser.add_argument("-o", "--output", help="Ephemeris path without extension", default=config.EPHEMERIS_PATH, required=config.EPHEMERIS_PATH is None)
+    parser.add_argument("-d", "--days", help="Covered time in days", type=float, default=config.EPHEMERIS_DURATION / 24 / 3600)
+    args = parser.parse_args()
+
+    sprites = create_solar_system()
+    Ephemeris.build(args.output, [sprite.entity for sprite in sprites], [sprite.name for sprite in sprites], args.days * 24 * 3600)
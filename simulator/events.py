@@ -1,3 +1,7 @@
+import os
+import queue
+import threading
+
 from physics import Vector, Point, Physics
 
 
@@ -7,32 +11,59 @@ class Subscription:
         self.event_type = event_type
 
 
-class EventRegistrer:
-    subscriptions = []
-    events = []
-
-    @staticmethod
-    def register_event(event):
-        for subscription in EventRegistrer.subscriptions:
-            if isinstance(event, subscription.event_type):
-                subscription.subscriber.handle_event(event)
+# Subscriptions and stored events of one simulation: its sprites, groups, rockets and widgets are built
+# with the bus and fire their events on it. Events are dispatched through a table of the subscribers of
+# each concrete event type, filled from the subscriptions on first use and thrown away on every
+# subscribe, so an event costs a dict lookup instead of a scan of all the subscriptions.
+# Once owned by a thread (the window's, when physics runs on its own), events registered from any
+# other thread wait in a queue until the owner dispatches them, the subscribers only ever run there.
+class EventBus:
+    def __init__(self):
+        self.subscriptions = []
+        self.events = []
+        self.dispatch_table = {}
+        self.owner = None
+        self.deferred = queue.SimpleQueue()
+
+    def subscribers(self, event_type):
+        subscribers = self.dispatch_table.get(event_type)
+        if subscribers is None:
+            subscribers = tuple(subscription.subscriber for subscription in self.subscriptions if issubclass(event_type, subscription.event_type))
+            self.dispatch_table[event_type] = subscribers
+        return subscribers
+
+    def has_subscribers(self, event_type):
+        return len(self.subscribers(event_type)) != 0
+
+    def register_event(self, event):
+        if self.owner is not None and threading.current_thread() is not self.owner:
+            self.deferred.put(event)
+            return
+
+        for subscriber in self.subscribers(type(event)):
+            subscriber.handle_event(event)
 
         if event.store:
-            EventRegistrer.events.append(event)
+            self.events.append(event)
+
+    def dispatch_deferred(self):
+        while not self.deferred.empty():
+            self.register_event(self.deferred.get_nowait())
 
-    @staticmethod
-    def subscribe(subscriber, *event_types):
-        EventRegistrer.subscriptions += [Subscription(subscriber, e) for e in event_types]
+    def subscribe(self, subscriber, *event_types):
+        self.subscriptions += [Subscription(subscriber, e) for e in event_types]
+        self.dispatch_table = {}
 
         for event_type in event_types:
-            for event in EventRegistrer.events:
+            for event in self.events:
                 if isinstance(event, event_type):
                     subscriber.handle_event(event)
 
 
+# Subscribers keep the bus of their simulation in event_bus, given to them when they are built
 class EventSubscriber:
     def subscribe(self, *event_types):
-        EventRegistrer.subscribe(self, *event_types)
+        self.event_bus.subscribe(self, *event_types)
 
     def handle_event(self, event):
         raise NotImplementedError()
@@ -63,12 +94,14 @@ class CollisionEvent(LogableEvent):
         return f"{self.rocket.name} has fallen on {self.planet.name} at {self.collision_angle:.3f} with speed {self.finite_speed:.3f} m/s"
 
 class RocketEvent(Event):
-    def __init__(self, time, speed: Vector, position: Point, planet_position: Point):
+    def __init__(self, time, speed: Vector, position: Point, planet_position: Point, weight: float, height: float):
         super().__init__(store=False)
         self.time = time
         self.speed = speed
         self.position = position
         self.planet_position = planet_position
+        self.weight = weight
+        self.height = height
 
 class RocketSpritetOutOfFuelEvent(LogableEvent):
     def __init__(self, rocket):
@@ -84,24 +117,62 @@ class RocketEntityOutOfFuelEvent(Event):
         self.rocket = rocket
 
 
+# Raw state of a rocket and the tracked bodies (names to entities, see config.TRACKED_BODIES). The
+# gravity of a body is only computed when asked for.
 class GravityTrackingEvent(Event):
-    sun = None
-    earth = None
-
-    def __init__(self, time, rocket):
+    def __init__(self, time, rocket, bodies: dict):
         super().__init__(store=False)
         self.time = time
         self.rocket = rocket
-        self.sun_position = GravityTrackingEvent.sun.position
-        self.earth_position = GravityTrackingEvent.earth.position
-        self.sun_gravity = Physics.calculate_gravity(GravityTrackingEvent.sun, rocket).magnitude
-        self.earth_gravity = Physics.calculate_gravity(GravityTrackingEvent.earth, rocket).magnitude
+        self.position = rocket.position
+        self.weight = rocket.weight
+        self.bodies = bodies
+        self.body_positions = {name: body.position for name, body in bodies.items()}
+
+    def gravity(self, name: str):
+        distance = Physics.calculate_distance(self.body_positions[name], self.position)
+        return Physics.G * self.bodies[name].weight * self.weight / distance ** 2
 
 
 class BuildPlotsEvent(Event):
     def __init__(self):
         super().__init__(False)
 
+
+class PlotsBuiltEvent(LogableEvent):
+    def __init__(self, paths, error: Exception = None):
+        super().__init__()
+        self.paths = paths
+        self.error = error
+
+    def __str__(self):
+        if self.error is not None:
+            return f"Plots failed: {self.error}"
+        return f"{len(self.paths)} plots written to {os.path.dirname(self.paths[0])}" if self.paths else "No telemetry to plot yet"
+
+class SaveCheckpointEvent(Event):
+    def __init__(self, path: str):
+        super().__init__(False)
+        self.path = path
+
+
+class CheckpointSavedEvent(LogableEvent):
+    def __init__(self, path: str, time: float):
+        super().__init__()
+        self.path = path
+        self.time = time
+
+    def __str__(self):
+        return f"Checkpoint of {self.time:.0f} s saved to {self.path}"
+
+class EphemerisEndEvent(LogableEvent):
+    def __init__(self, time: float):
+        super().__init__()
+        self.time = time
+
+    def __str__(self):
+        return f"The ephemeris ends at {self.time:.0f} s, the planets are not known beyond it"
+
 class PauseEvent(Event):
     def __init__(self, is_paused):
         super().__init__(False)
@@ -120,6 +191,18 @@ class SetSimulationTimeScaleEvent(Event):
         self.time_scale = time_scale
 
 
+class SimulationRateEvent(Event):
+    def __init__(self, rate: float):
+        super().__init__(False)
+        self.rate = rate
+
+
+# registered by the window loop once per frame, on the thread that draws
+class FrameEvent(Event):
+    def __init__(self):
+        super().__init__(False)
+
+
 class NoFuelForManeuverEvent(Event):
     def __init__(self, rocket):
         self.rocket = rocket
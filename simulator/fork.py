@@ -0,0 +1,83 @@
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+
+import config
+from arguments import add_physics_arguments, apply_physics_arguments
+from checkpoint import load_checkpoint, read_mission
+from events import EventBus
+from groups import create_physics_groups
+from mission import create_mission
+from montecarlo import configure_worker
+from simulation import Simulation
+
+
+def build_mission():
+    # the mission of main.py, built from the settings the checkpoint recorded (see fork)
+    event_bus = EventBus()
+    sprites = create_mission(event_bus, config.ENSEMBLE_SIZE, config.ENSEMBLE_SEED, config.ENSEMBLE_SPREAD)
+    return Simulation(
+        time_scale=config.TIME_SCALE,
+        amount_of_iterations=config.AMOUNT_OF_ITERATIONS,
+        groups=create_physics_groups(*sprites, event_bus=event_bus),
+        event_bus=event_bus,
+    )
+
+
+# A variant of a forked checkpoint: the speed of every rocket relative to its planet is scaled by a
+# normal deviation of relative size spread, drawn from the stream of (seed, index)
+class SpeedPerturbation:
+    def __init__(self, seed: int, index: int, spread: float):
+        self.seed = seed
+        self.index = index
+        self.spread = spread
+
+    def __call__(self, simulation: Simulation):
+        generator = np.random.default_rng((self.seed, self.index))
+        for rocket in simulation.rockets:
+            entity = rocket.entity
+            entity.speed = entity.planet.speed + entity.relative_speed * (1 + self.spread * generator.standard_normal())
+
+
+def run_variant(path: str, build, variant, time_limit: float):
+    simulation = build()
+    load_checkpoint(simulation, path)
+    if variant is not None:
+        variant(simulation)
+    return simulation.run_headless(time_limit)
+
+
+def fork(path: str, variants, build=build_mission, time_limit: float = None, workers: int = None):
+    # runs every variant from the same checkpoint, each on its own process; build and the variants
+    # are sent to the workers, so they have to be picklable (module level functions, plain objects)
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+    # the workers build the mission the way the checkpoint was saved, not the way the options say
+    settings.update(read_mission(path)["settings"])
+    with ProcessPoolExecutor(workers, initializer=configure_worker, initargs=(settings,)) as executor:
+        return list(executor.map(run_variant, repeat(path), repeat(build), variants, repeat(time_limit)))
+
+
+def configure():
+    parser = argparse.ArgumentParser(prog=sys.argv[0], description="Fork variants of the Mars mission from a checkpoint")
+    parser.add_argument("checkpoint", help="Checkpoint saved by main.py --checkpoint")
+    parser.add_argument("-n", "--variants", type=int, default=os.cpu_count())
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--spread", type=float, default=0.0, help="Relative standard deviation of the rocket speed of the variants")
+    parser.add_argument("--time-limit", type=float, default=None, help="Simulated seconds, counted from the mission start, before a variant is given up")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    add_physics_arguments(parser)
+    args = parser.parse_args()
+    apply_physics_arguments(args)
+    return args
+
+
+if __name__ == '__main__':
+    args = configure()
+    variants = [SpeedPerturbation(args.seed, index, args.spread) for index in range(args.variants)]
+    summaries = fork(args.checkpoint, variants, time_limit=args.time_limit, workers=args.workers)
+    print(json.dumps([dict(variant=index, **summary) for index, summary in enumerate(summaries)], indent=2))
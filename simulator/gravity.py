@@ -0,0 +1,206 @@
+from functools import lru_cache
+
+import numpy as np
+
+import config
+from physics import Physics
+
+
+# Batched gravity kernels. They agree with the pairwise Physics.apply_gravity path to a relative
+# error below 1e-12 per force (only the order of floating point operations differs).
+
+DENSE_KERNEL_LIMIT = 64
+QUADTREE_LEAF_SIZE = 32
+QUADTREE_MAX_DEPTH = 48
+
+
+@lru_cache(maxsize=None)
+def pair_indices(amount: int):
+    return np.triu_indices(amount, 1)
+
+
+def dense_accelerations(positions, gravitational_parameters):
+    difference = positions[np.newaxis, :, :] - positions[:, np.newaxis, :]
+    squared_distance = np.einsum("ijk,ijk->ij", difference, difference)
+    np.fill_diagonal(squared_distance, np.inf)
+    return np.einsum("ijk,ij->ik", difference, gravitational_parameters / (squared_distance * np.sqrt(squared_distance)))
+
+
+def pairwise_accelerations(positions, weights):
+    amount = len(positions)
+    if amount < 2:
+        return np.zeros((amount, 2))
+
+    gravitational_parameters = Physics.G * weights
+    # for a handful of bodies the full matrix beats the bookkeeping of the pair list
+    if amount <= DENSE_KERNEL_LIMIT:
+        return dense_accelerations(positions, gravitational_parameters)
+
+    first, second = pair_indices(amount)
+
+    # every pair is evaluated once, the symmetric pull is reused for both bodies
+    difference = positions[second] - positions[first]
+    squared_distance = np.einsum("ij,ij->i", difference, difference)
+    pull = difference / (squared_distance * np.sqrt(squared_distance))[:, np.newaxis]
+
+    accelerations = np.empty((amount, 2))
+    for axis in range(2):
+        accelerations[:, axis] = (np.bincount(first, gravitational_parameters[second] * pull[:, axis], amount)
+                                  - np.bincount(second, gravitational_parameters[first] * pull[:, axis], amount))
+    return accelerations
+
+
+def mutual_accelerations(positions, gravitational_parameters, other_positions, other_parameters):
+    # exact interaction between two disjoint sets of bodies, each pair evaluated once
+    difference = other_positions[np.newaxis, :, :] - positions[:, np.newaxis, :]
+    squared_distance = np.einsum("ijk,ijk->ij", difference, difference)
+    pull = 1 / (squared_distance * np.sqrt(squared_distance))
+    accelerations = np.einsum("ijk,ij->ik", difference, pull * other_parameters)
+    other_accelerations = -np.einsum("ijk,ij->jk", difference, pull * gravitational_parameters[:, np.newaxis])
+    return accelerations, other_accelerations
+
+
+class QuadTree:
+    def __init__(self, positions, gravitational_parameters, leaf_size: int = QUADTREE_LEAF_SIZE):
+        self.positions = positions
+        self.gravitational_parameters = gravitational_parameters
+        self.leaf_size = leaf_size
+        self.centers_of_mass = []
+        self.masses = []
+        self.cells = []
+        self.children = []
+        self.bodies = []
+
+        lower = positions.min(axis=0)
+        upper = positions.max(axis=0)
+        half_size = max(float(np.max(upper - lower)) / 2, 1.0) * (1 + 1e-9)
+        self._build(np.arange(len(positions)), (lower + upper) / 2, half_size, 0)
+
+    def _build(self, bodies, center, half_size: float, depth: int):
+        node = len(self.masses)
+        parameters = self.gravitational_parameters[bodies]
+        mass = float(np.sum(parameters))
+        positions = self.positions[bodies]
+        center_of_mass = parameters @ positions / mass if mass > 0 else np.mean(positions, axis=0)
+
+        self.centers_of_mass.append(center_of_mass)
+        self.masses.append(mass)
+        self.cells.append((center, half_size))
+        self.children.append(None)
+        self.bodies.append(bodies)
+
+        if len(bodies) <= self.leaf_size or depth >= QUADTREE_MAX_DEPTH:
+            return node
+
+        quadrants = (positions[:, 0] >= center[0]) + 2 * (positions[:, 1] >= center[1])
+        order = np.argsort(quadrants, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(quadrants, minlength=4))))
+        children = []
+        for quadrant in range(4):
+            if bounds[quadrant] == bounds[quadrant + 1]:
+                continue
+            offset = np.array((1 if quadrant & 1 else -1, 1 if quadrant & 2 else -1)) * half_size / 2
+            children.append(self._build(bodies[order[bounds[quadrant]:bounds[quadrant + 1]]], center + offset, half_size / 2, depth + 1))
+
+        self.children[node] = children
+        self.bodies[node] = None
+        return node
+
+    def accelerations(self, targets, theta: float):
+        # all targets walk the tree together: at every node the ones that see it under an angle
+        # smaller than theta take its monopole, the rest descend into the children
+        accelerations = np.zeros_like(targets)
+        stack = [(0, np.arange(len(targets)))]
+
+        while stack:
+            node, selected = stack.pop()
+            points = targets[selected]
+            children = self.children[node]
+
+            if children is None:
+                sources = self.bodies[node]
+                difference = self.positions[sources][np.newaxis, :, :] - points[:, np.newaxis, :]
+                squared_distance = np.einsum("ijk,ijk->ij", difference, difference)
+                # a body does not attract itself
+                squared_distance[squared_distance == 0] = np.inf
+                pull = self.gravitational_parameters[sources] / (squared_distance * np.sqrt(squared_distance))
+                accelerations[selected] += np.einsum("ijk,ij->ik", difference, pull)
+                continue
+
+            center, half_size = self.cells[node]
+            difference = self.centers_of_mass[node] - points
+            squared_distance = np.einsum("ij,ij->i", difference, difference)
+            inside = np.all(np.abs(points - center) <= half_size, axis=1)
+            far = (4 * half_size ** 2 < theta ** 2 * squared_distance) & ~inside
+
+            if np.any(far):
+                pull = self.masses[node] / (squared_distance[far] * np.sqrt(squared_distance[far]))
+                accelerations[selected[far]] += difference[far] * pull[:, np.newaxis]
+
+            near = selected[~far]
+            if len(near) != 0:
+                stack.extend((child, near) for child in children)
+
+        return accelerations
+
+
+def barnes_hut_accelerations(positions, weights, theta: float, exact_weight: float):
+    # massive bodies are summed exactly (among themselves and against everything else),
+    # the quadtree only approximates the interaction between the light ones
+    gravitational_parameters = Physics.G * weights
+    massive = weights >= exact_weight
+    light = ~massive
+    accelerations = np.zeros((len(positions), 2))
+
+    if np.any(massive):
+        accelerations[massive] = pairwise_accelerations(positions[massive], weights[massive])
+    if np.any(massive) and np.any(light):
+        massive_accelerations, light_accelerations = mutual_accelerations(
+            positions[massive], gravitational_parameters[massive], positions[light], gravitational_parameters[light]
+        )
+        accelerations[massive] += massive_accelerations
+        accelerations[light] += light_accelerations
+    if np.count_nonzero(light) > 1:
+        light_positions = positions[light]
+        tree = QuadTree(light_positions, gravitational_parameters[light])
+        accelerations[light] += tree.accelerations(light_positions, theta)
+
+    return accelerations
+
+
+def test_particle_accelerations(positions, sources, gravitational_parameters):
+    # pull of the sources on massless particles, one row per particle
+    difference = sources[np.newaxis, :, :] - positions[:, np.newaxis, :]
+    squared_distance = np.einsum("ijk,ijk->ij", difference, difference)
+    return np.einsum("ijk,ij->ik", difference, gravitational_parameters / (squared_distance * np.sqrt(squared_distance)))
+
+
+def restricted_accelerations(positions, weights, massive):
+    # massive bodies attract each other and the test particles, test particles attract nothing:
+    # O(P^2 + P * R) instead of O((P + R)^2)
+    if len(positions) <= DENSE_KERNEL_LIMIT and config.GRAVITY_MODE == "pairwise":
+        return dense_accelerations(positions, Physics.G * weights * massive)
+
+    accelerations = np.zeros((len(positions), 2))
+    particles = ~massive
+    if np.any(massive):
+        accelerations[massive] = unrestricted_accelerations(positions[massive], weights[massive])
+    if np.any(massive) and np.any(particles):
+        accelerations[particles] = test_particle_accelerations(positions[particles], positions[massive], Physics.G * weights[massive])
+    return accelerations
+
+
+def unrestricted_accelerations(positions, weights):
+    if config.GRAVITY_MODE == "barnes-hut":
+        return barnes_hut_accelerations(positions, weights, config.BARNES_HUT_THETA, config.BARNES_HUT_EXACT_WEIGHT)
+    return pairwise_accelerations(positions, weights)
+
+
+def calculate_accelerations(positions, weights, massive=None):
+    if config.RESTRICTED and massive is not None:
+        return restricted_accelerations(positions, weights, massive)
+    return unrestricted_accelerations(positions, weights)
+
+
+def calculate_forces(positions, weights, massive=None):
+    return calculate_accelerations(positions, weights, massive) * weights[:, np.newaxis]
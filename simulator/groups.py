@@ -1,5 +1,6 @@
 import pygame
 import math
+import numpy as np
 
 from pygame.sprite import Group, Sprite
 from math import pi
@@ -7,63 +8,301 @@ from math import pi
 import config
 from physics import Vector, Point, Physics
 from entities import Planet, BaseRocket
-from simobjects import SimRocketObject, SimPlanetaryObject
-from events import RocketEvent, EventRegistrer, CollisionEvent
+from engine import ArrayEngine
+from gravity import calculate_forces, calculate_accelerations
+from integrators import Integrator, make_integrator
+from kepler import Conic
+from ephemeris import Ephemeris
+from simobjects import SimRocketObject, SimPlanetaryObject, SimEnsembleObject
+from events import EventBus, RocketEvent, CollisionEvent
 from events import GravityTrackingEvent
+from textcache import CachedFont
 
 
 class PhysicsGroup(Group):
-    def __init__(self, *sprites: Sprite):
+    def __init__(self, *sprites: Sprite, engine: ArrayEngine = None):
+        self.engine = engine
+        self._indices = None
         super().__init__(*sprites)
 
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self._indices = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self._indices = None
+
+    @property
+    def variable_step(self):
+        return False
+
+    @property
+    def end_time(self):
+        # the simulated time the group can not step past, None when there is none
+        return None
+
+    def max_step(self):
+        return None
+
+    @property
+    def indices(self):
+        if self._indices is None:
+            self._indices = self.engine.indices(sprite.entity for sprite in self.sprites())
+        return self._indices
+
     def update(self, delta_time: float):
+        if self.engine is not None:
+            self.engine.reset_forces(self.indices)
+            return
+
         entities = [sprite.entity for sprite in self.sprites()]
         for entity in entities:
             entity.force = Vector((0, 0))
 
 
 class GravityGroup(PhysicsGroup):
-    def __init__(self, *sprites):
-        super().__init__(*sprites)
+    def __init__(self, *sprites, engine: ArrayEngine = None):
+        super().__init__(*sprites, engine=engine)
 
     def update(self, delta_time: float):
+        if self.engine is not None:
+            self.engine.apply_gravity(self.indices)
+            return
+
         entities = [sprite.entity for sprite in self.sprites()]
-        for i, entity in enumerate(entities):
-            for other_entity in entities[i + 1:]:
-                Physics.apply_gravity(entity, other_entity)
+        positions = np.array([entity.position.coordinates for entity in entities], dtype=float).reshape(-1, 2)
+        weights = np.array([entity.weight for entity in entities], dtype=float)
+        massive = np.array([isinstance(entity, Planet) for entity in entities], dtype=bool)
+        for entity, force in zip(entities, calculate_forces(positions, weights, massive).tolist()):
+            entity.force += Vector(force)
 
 
 class MoveGroup(PhysicsGroup):
-    def __init__(self, *sprites):
-        super().__init__(*sprites)
+    def __init__(self, *sprites, engine: ArrayEngine = None, integrator: Integrator = None, coast: bool = False, sources=None):
+        super().__init__(*sprites, engine=engine)
+        self.integrator = integrator
+        self.coast = coast
+        # bodies that attract the group but move on their own (planets on an ephemeris)
+        self.sources = sources
+
+    @property
+    def variable_step(self):
+        # coast mode only changes the steps while a rocket coasts, everything else keeps the fixed step
+        return self.integrator is not None and self.integrator.adaptive or self.coast and self.coasting
+
+    @property
+    def coasting(self):
+        return any(isinstance(sprite.entity, BaseRocket) and sprite.entity.coasting for sprite in self.sprites())
+
+    @property
+    def end_time(self):
+        return self.sources.end_time if self.sources is not None else None
+
+    def max_step(self):
+        integrated = not self.coast or any(not (isinstance(sprite.entity, BaseRocket) and sprite.entity.coasting) for sprite in self.sprites())
+        if self.integrator is not None and self.integrator.adaptive and integrated:
+            return self.integrator.step_size
+        # planets are still integrated numerically between coast events
+        return config.COAST_MAX_STEP if self.coast and self.coasting else None
 
     def update(self, delta_time: float):
         entities = [sprite.entity for sprite in self.sprites()]
-        for entity in entities:
-            Physics.move(entity, delta_time)
+        coasting = [entity for entity in entities if isinstance(entity, BaseRocket) and entity.coasting] if self.coast else []
+        coast_states = [MoveGroup.coast_state(rocket) for rocket in coasting]
+        if coasting:
+            entities = [entity for entity in entities if entity not in coasting]
+        indices = self.indices if self.engine is not None and not coasting else None
+        # sources move first: the integrator samples them inside the step and coasting rockets follow their planet
+        if self.sources is not None:
+            self.sources.update(delta_time)
+
+        if self.integrator is not None and entities:
+            self.integrate(entities, delta_time, indices)
+        elif self.engine is not None:
+            self.engine.move(indices if indices is not None else self.engine.indices(entities), delta_time)
+        else:
+            for entity in entities:
+                Physics.move(entity, delta_time)
+
+        for rocket, coast_state in zip(coasting, coast_states):
+            MoveGroup.coast_move(rocket, coast_state, delta_time)
+
+    def integrate(self, entities, delta_time: float, indices=None):
+        if self.engine is not None:
+            indices = indices if indices is not None else self.engine.indices(entities)
+            positions = self.engine.positions[indices]
+            speeds = self.engine.speeds[indices]
+            weights = self.engine.weights[indices]
+            forces = self.engine.forces[indices]
+            massive = self.engine.massive[indices]
+        else:
+            positions = np.array([entity.position.coordinates for entity in entities], dtype=float).reshape(-1, 2)
+            speeds = np.array([entity.speed.coordinates for entity in entities], dtype=float).reshape(-1, 2)
+            weights = np.array([entity.weight for entity in entities], dtype=float)
+            forces = np.array([entity.force.coordinates for entity in entities], dtype=float).reshape(-1, 2)
+            massive = np.array([isinstance(entity, Planet) for entity in entities], dtype=bool)
+
+        def field(trial_positions, time_offset: float):
+            if self.sources is None:
+                return calculate_accelerations(trial_positions, weights, massive)
+            source_positions, source_weights = self.sources.state_at(time_offset)
+            return calculate_accelerations(
+                np.vstack((trial_positions, source_positions)), np.concatenate((weights, source_weights)),
+                np.concatenate((massive, np.ones(len(source_weights), dtype=bool)))
+            )[:len(weights)]
+
+        positions, speeds = self.integrator.step(positions, speeds, weights, forces / weights[:, np.newaxis], field, delta_time)
+
+        if self.engine is not None:
+            self.engine.positions[indices] = positions
+            self.engine.speeds[indices] = speeds
+            self.engine.version += 1
+        else:
+            for entity, position, speed in zip(entities, positions.tolist(), speeds.tolist()):
+                entity.position = Point(position)
+                entity.speed = Vector(speed)
+
+    @staticmethod
+    def coast_state(rocket: BaseRocket):
+        # everything but the attraction of rocket.planet (other bodies, tidal terms, thrust) is a perturbation
+        planet = rocket.planet
+        position = rocket.position_vector
+        two_body = position * (-Physics.G * planet.weight / position.magnitude ** 3)
+        perturbation = rocket.force / rocket.weight - planet.force / planet.weight - two_body
+        return position, rocket.relative_speed, perturbation
+
+    @staticmethod
+    def coast_move(rocket: BaseRocket, coast_state, delta_time: float):
+        # kick with the perturbation, drift along the conic around the (already moved) planet, kick again
+        position, speed, perturbation = coast_state
+        speed = speed + perturbation * (delta_time / 2)
+        position, speed = Conic(position, speed, Physics.G * rocket.planet.weight).propagate(delta_time)
+        rocket.position = rocket.planet.position + position
+        rocket.speed = rocket.planet.speed + speed + perturbation * (delta_time / 2)
+
+
+class EphemerisGroup(PhysicsGroup):
+    def __init__(self, *sprites: SimPlanetaryObject, ephemeris: Ephemeris, engine: ArrayEngine = None):
+        super().__init__(*sprites, engine=engine)
+        self.ephemeris = ephemeris
+        self.weights = np.array([sprite.entity.weight for sprite in sprites], dtype=float)
+        self.rows = ephemeris.rows([sprite.name for sprite in sprites], self.weights)
+        self.time = 0
+        self.step_start = 0
+
+    @property
+    def end_time(self):
+        return self.ephemeris.epoch + self.ephemeris.duration
+
+    def state_at(self, time_offset: float):
+        positions, _ = self.ephemeris.state(self.step_start + time_offset)
+        return positions[self.rows], self.weights
+
+    def update(self, delta_time: float):
+        self.step_start = self.time
+        self.time += delta_time
+        positions, speeds = self.ephemeris.state(self.time)
+        positions, speeds = positions[self.rows], speeds[self.rows]
+
+        if self.engine is not None:
+            self.engine.positions[self.indices] = positions
+            self.engine.speeds[self.indices] = speeds
+            self.engine.version += 1
+            return
+
+        for sprite, position, speed in zip(self.sprites(), positions.tolist(), speeds.tolist()):
+            sprite.entity.position = Point(position)
+            sprite.entity.speed = Vector(speed)
 
 
 class SmartGroup(PhysicsGroup):
-    def __init__(self, *sprites: SimRocketObject):
-        super().__init__(*sprites)
+    def __init__(self, *sprites: SimRocketObject, engine: ArrayEngine = None, tracked_bodies: dict = None, event_bus: EventBus = None):
+        super().__init__(*sprites, engine=engine)
+        self.event_bus = event_bus if event_bus is not None else EventBus()
         self.time = 0
+        self.tracked_bodies = tracked_bodies if tracked_bodies is not None else {}
+
+    def max_step(self):
+        limits = [sprite.entity.max_step() for sprite in self.sprites()]
+        limits = [limit for limit in limits if limit is not None]
+        return min(limits) if limits else None
 
     def update(self, delta_time: float):
         self.time += delta_time
         rockets = [sprite.entity for sprite in self.sprites()]
+        event_bus = self.event_bus
         for rocket in rockets:
             rocket.make_decision(delta_time)
-            EventRegistrer.register_event(RocketEvent(self.time, rocket.speed.copy(), rocket.position, rocket.planet.position))
-            EventRegistrer.register_event(GravityTrackingEvent(self.time, rocket))
+            if event_bus.has_subscribers(RocketEvent):
+                event_bus.register_event(RocketEvent(self.time, rocket.speed.copy(), rocket.position, rocket.planet.position, rocket.weight, rocket.height))
+            if self.tracked_bodies and event_bus.has_subscribers(GravityTrackingEvent):
+                event_bus.register_event(GravityTrackingEvent(self.time, rocket, self.tracked_bodies))
 
 
-class CollisionGroup(PhysicsGroup):
-    def __init__(self, *sprites):
+class EnsembleGroup(PhysicsGroup):
+    # fleets of rockets that only feel the planets: each decides, collides and moves as one batch with
+    # the planets where they are at the start of the step, so the group goes before MoveGroup
+    def __init__(self, *sprites: SimEnsembleObject, verlet: bool = False):
         super().__init__(*sprites)
+        self.verlet = verlet
+
+    def max_step(self):
+        limits = [sprite.ensemble.max_step() for sprite in self.sprites()]
+        limits = [limit for limit in limits if limit is not None]
+        return min(limits) if limits else None
 
     def update(self, delta_time: float):
-        rockets = [sprite for sprite in self.sprites() if isinstance(sprite, SimRocketObject)]
-        planets = [sprite for sprite in self.sprites() if isinstance(sprite, SimPlanetaryObject)]
+        for sprite in self.sprites():
+            sprite.ensemble.update(delta_time, self.verlet)
+
+
+class CollisionGroup(PhysicsGroup):
+    def __init__(self, *sprites, engine: ArrayEngine = None, event_bus: EventBus = None):
+        super().__init__(*sprites, engine=engine)
+        self.event_bus = event_bus if event_bus is not None else EventBus()
+        self._sides = None
+        self._engine_sides = None
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self._sides = None
+        self._engine_sides = None
+
+    def remove_internal(self, sprite):
+        super().remove_internal(sprite)
+        self._sides = None
+        self._engine_sides = None
+
+    @property
+    def sides(self):
+        if self._sides is None:
+            rockets = [sprite for sprite in self.sprites() if isinstance(sprite, SimRocketObject)]
+            planets = [sprite for sprite in self.sprites() if isinstance(sprite, SimPlanetaryObject)]
+            self._sides = rockets, planets
+        return self._sides
+
+    @property
+    def engine_sides(self):
+        if self._engine_sides is None:
+            rockets, planets = self.sides
+            self._engine_sides = (
+                self.engine.indices(rocket.entity for rocket in rockets),
+                self.engine.indices(planet.entity for planet in planets),
+                np.array([planet.entity.radius for planet in planets]),
+            )
+        return self._engine_sides
+
+    def update(self, delta_time: float):
+        rockets, planets = self.sides
+
+        if self.engine is not None and rockets and planets:
+            rocket_indices, planet_indices, radiuses = self.engine_sides
+            rocket_positions = self.engine.positions[rocket_indices]
+            planet_positions = self.engine.positions[planet_indices]
+            distances = np.sqrt(np.sum((rocket_positions[:, np.newaxis, :] - planet_positions[np.newaxis, :, :]) ** 2, axis=2))
+            # only the rockets that actually hit something go through the per-object path below
+            rockets = [rockets[i] for i in np.flatnonzero(np.any(distances < radiuses, axis=1))]
 
         for rocket in rockets:
             for planet in planets:
@@ -71,13 +310,16 @@ class CollisionGroup(PhysicsGroup):
                     landing_angle_absolute = Vector(planet.entity.position, rocket.entity.position).polar_angle
                     landing_angle_relative = (landing_angle_absolute - planet.entity.polar_angle) % (2 * math.pi)
                     finite_speed_magnitude = (rocket.entity.speed - planet.entity.speed - planet.entity.surface_speed(landing_angle_absolute)).magnitude
-                    EventRegistrer.register_event(CollisionEvent(planet, rocket, landing_angle_relative, finite_speed_magnitude))
-                    rocket.kill()
+                    self.event_bus.register_event(CollisionEvent(planet, rocket, landing_angle_relative, finite_speed_magnitude))
+                    # out of the physics here, the simulation kills the sprite where it is drawn
+                    for group in rocket.groups():
+                        if isinstance(group, PhysicsGroup):
+                            group.remove(rocket)
 
 
 class RotatingGroup(PhysicsGroup):
-    def __init__(self, *sprites: SimPlanetaryObject):
-        super().__init__(*sprites)
+    def __init__(self, *sprites: SimPlanetaryObject, engine: ArrayEngine = None):
+        super().__init__(*sprites, engine=engine)
 
     def update(self, delta_time: float):
         planets = [sprite.entity for sprite in self.sprites()]
@@ -90,18 +332,20 @@ class RenderGroup(Group):
     def __init__(self, *sprites):
         super().__init__(*sprites)
         pygame.font.init()
-        self.font = pygame.font.Font(config.FONT_PATH, config.FONT_SIZE)
+        self.font = CachedFont(pygame.font.Font(config.FONT_PATH, config.FONT_SIZE))
 
     def update_screen_settings(self, scale, offset: Vector):
         for sprite in self.sprites():
             sprite.update_screen_settings(scale, offset)
 
     def render(self, screen):
-        for sprite in self.sprites():
+        width, height = screen.get_size()
+        visible = [sprite for sprite in self.sprites() if sprite.on_screen(width, height)]
+        for sprite in visible:
             sprite.draw(screen, self.font)
 
         if config.draw_markers:
-            for sprite in self.sprites():
+            for sprite in visible:
                 sprite.draw_text_marker(screen, self.font)
 
 
@@ -109,7 +353,7 @@ class WidgetGroup(Group):
     def __init__(self, *sprites):
         super().__init__(*sprites)
         pygame.font.init()
-        self.font = pygame.font.Font(config.FONT_PATH, config.FONT_SIZE)
+        self.font = CachedFont(pygame.font.Font(config.FONT_PATH, config.FONT_SIZE))
 
     def render(self, screen, time: float):
         if config.draw_widgets:
@@ -126,14 +370,36 @@ class ClickableGroup(Group):
             sprite.process_mouseclick(mousepos)
 
 
-def create_physics_groups(*sprites):
+def create_physics_groups(*sprites, event_bus: EventBus = None):
+    ensembles = [sprite for sprite in sprites if isinstance(sprite, SimEnsembleObject)]
+    sprites = [sprite for sprite in sprites if not isinstance(sprite, SimEnsembleObject)]
     planets = [sprite for sprite in sprites if isinstance(sprite.entity, Planet)]
     rockets = [sprite for sprite in sprites if isinstance(sprite.entity, BaseRocket)]
+    engine = ArrayEngine(*[sprite.entity for sprite in sprites]) if config.ARRAY_ENGINE else None
+    names = {sprite.name: sprite.entity for sprite in planets}
+    tracked_bodies = {name: names[name] for name in config.TRACKED_BODIES if name in names}
+    # euler keeps the cheaper single-stage Physics.move path
+    integrator = make_integrator(config.INTEGRATOR) if config.INTEGRATOR != "euler" else None
+
+    if config.EPHEMERIS_PATH is None:
+        return (
+            PhysicsGroup(*sprites, engine=engine),
+            GravityGroup(*sprites, engine=engine),
+            SmartGroup(*rockets, engine=engine, tracked_bodies=tracked_bodies, event_bus=event_bus),
+            CollisionGroup(*sprites, engine=engine, event_bus=event_bus),
+            RotatingGroup(*planets, engine=engine),
+            EnsembleGroup(*ensembles, verlet=integrator is not None),
+            MoveGroup(*sprites, engine=engine, integrator=integrator, coast=config.COAST),
+        )
+
+    # planets follow the precomputed ephemeris, only rockets are integrated
+    ephemeris = Ephemeris.open_or_build(config.EPHEMERIS_PATH, planets, config.EPHEMERIS_DURATION)
     return (
-        PhysicsGroup(*sprites),
-        GravityGroup(*sprites),
-        SmartGroup(*rockets),
-        CollisionGroup(*sprites),
-        RotatingGroup(*planets),
-        MoveGroup(*sprites),
+        PhysicsGroup(*sprites, engine=engine),
+        GravityGroup(*sprites, engine=engine),
+        SmartGroup(*rockets, engine=engine, tracked_bodies=tracked_bodies, event_bus=event_bus),
+        CollisionGroup(*sprites, engine=engine, event_bus=event_bus),
+        RotatingGroup(*planets, engine=engine),
+        EnsembleGroup(*ensembles, verlet=integrator is not None),
+        MoveGroup(*rockets, engine=engine, integrator=integrator, coast=config.COAST, sources=EphemerisGroup(*planets, ephemeris=ephemeris, engine=engine)),
     )
@@ -0,0 +1,160 @@
+import numpy as np
+
+import config
+
+
+# Integrators advance positions and speeds of a set of bodies over one step. Forces follow the
+# two-phase model of the physics groups: gravity depends on the positions and is re-evaluated by
+# `field(positions, time_offset)` at every stage, everything else (engine thrust) was decided by SmartGroup for the whole
+# step and stays constant during it.
+class Integrator:
+    adaptive = False
+
+    def __init__(self):
+        self._last_evaluation = None
+
+    def field_at(self, field, positions, weights):
+        # the last evaluation of the previous step usually happened at the current positions
+        if self._last_evaluation is not None:
+            last_positions, last_weights, accelerations = self._last_evaluation
+            if last_positions.shape == positions.shape and np.array_equal(last_positions, positions) and np.array_equal(last_weights, weights):
+                return accelerations
+        return field(positions, 0)
+
+    def step(self, positions, speeds, weights, accelerations, field, delta_time: float):
+        external = accelerations - self.field_at(field, positions, weights)
+
+        def evaluate(trial_positions, time_offset: float):
+            gravity = field(trial_positions, time_offset)
+            # copies: the arrays may be views of the engine rows, which the next step changes in place
+            self._last_evaluation = (trial_positions.copy(), weights.copy(), gravity)
+            return gravity + external
+
+        return self.advance(positions, speeds, accelerations, evaluate, delta_time)
+
+    def advance(self, positions, speeds, accelerations, evaluate, delta_time: float):
+        raise NotImplementedError()
+
+
+class EulerIntegrator(Integrator):
+    # the same single-stage Taylor step as Physics.move
+    def advance(self, positions, speeds, accelerations, evaluate, delta_time: float):
+        return positions + speeds * delta_time + accelerations * delta_time ** 2 / 2, speeds + accelerations * delta_time
+
+
+class VerletIntegrator(Integrator):
+    @staticmethod
+    def kick_drift_kick(positions, speeds, accelerations, evaluate, delta_time: float, time_offset: float = 0):
+        speeds = speeds + accelerations * delta_time / 2
+        positions = positions + speeds * delta_time
+        accelerations = evaluate(positions, time_offset + delta_time)
+        return positions, speeds + accelerations * delta_time / 2, accelerations
+
+    def advance(self, positions, speeds, accelerations, evaluate, delta_time: float):
+        positions, speeds, _ = VerletIntegrator.kick_drift_kick(positions, speeds, accelerations, evaluate, delta_time)
+        return positions, speeds
+
+
+class YoshidaIntegrator(Integrator):
+    # fourth order symplectic scheme (Yoshida, Forest-Ruth): three velocity Verlet sub-steps
+    OUTER_WEIGHT = 1 / (2 - 2 ** (1 / 3))
+    INNER_WEIGHT = -2 ** (1 / 3) / (2 - 2 ** (1 / 3))
+
+    def advance(self, positions, speeds, accelerations, evaluate, delta_time: float):
+        time_offset = 0
+        for weight in (YoshidaIntegrator.OUTER_WEIGHT, YoshidaIntegrator.INNER_WEIGHT, YoshidaIntegrator.OUTER_WEIGHT):
+            positions, speeds, accelerations = VerletIntegrator.kick_drift_kick(positions, speeds, accelerations, evaluate, delta_time * weight, time_offset)
+            time_offset += delta_time * weight
+        return positions, speeds
+
+
+class RungeKuttaIntegrator(Integrator):
+    def advance(self, positions, speeds, accelerations, evaluate, delta_time: float):
+        speeds2 = speeds + accelerations * delta_time / 2
+        accelerations2 = evaluate(positions + speeds * delta_time / 2, delta_time / 2)
+        speeds3 = speeds + accelerations2 * delta_time / 2
+        accelerations3 = evaluate(positions + speeds2 * delta_time / 2, delta_time / 2)
+        speeds4 = speeds + accelerations3 * delta_time
+        accelerations4 = evaluate(positions + speeds3 * delta_time, delta_time)
+
+        positions = positions + (speeds + 2 * speeds2 + 2 * speeds3 + speeds4) * delta_time / 6
+        speeds = speeds + (accelerations + 2 * accelerations2 + 2 * accelerations3 + accelerations4) * delta_time / 6
+        return positions, speeds
+
+
+class DormandPrinceIntegrator(Integrator):
+    # embedded Runge-Kutta 5(4): the requested step is covered by as many sub-steps as the error
+    # estimate allows, the last accepted size is suggested for the next step
+    NODES = (0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1)
+    MATRIX = (
+        (),
+        (1 / 5,),
+        (3 / 40, 9 / 40),
+        (44 / 45, -56 / 15, 32 / 9),
+        (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+        (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+        (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+    )
+    ERROR_WEIGHTS = (71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40)
+    adaptive = True
+
+    def __init__(self, tolerance: float = None, absolute_tolerance: float = None, min_step: float = None):
+        super().__init__()
+        self.tolerance = tolerance if tolerance is not None else config.ADAPTIVE_TOLERANCE
+        self.absolute_tolerance = absolute_tolerance if absolute_tolerance is not None else config.ADAPTIVE_ABSOLUTE_TOLERANCE
+        self.min_step = min_step if min_step is not None else config.ADAPTIVE_MIN_STEP
+        self.step_size = config.ADAPTIVE_THRUST_STEP
+        self.accepted_steps = 0
+        self.rejected_steps = 0
+
+    def try_step(self, positions, speeds, accelerations, evaluate, delta_time: float, time_offset: float):
+        speed_stages = [speeds]
+        acceleration_stages = [accelerations]
+        for node, row in zip(DormandPrinceIntegrator.NODES[1:], DormandPrinceIntegrator.MATRIX[1:]):
+            stage_positions = positions + delta_time * sum(weight * stage for weight, stage in zip(row, speed_stages) if weight != 0)
+            speed_stages.append(speeds + delta_time * sum(weight * stage for weight, stage in zip(row, acceleration_stages) if weight != 0))
+            acceleration_stages.append(evaluate(stage_positions, time_offset + node * delta_time))
+
+        # the last stage is evaluated at the new state (first same as last)
+        new_positions = stage_positions
+        new_speeds = speed_stages[-1]
+        position_error = delta_time * sum(weight * stage for weight, stage in zip(DormandPrinceIntegrator.ERROR_WEIGHTS, speed_stages) if weight != 0)
+        speed_error = delta_time * sum(weight * stage for weight, stage in zip(DormandPrinceIntegrator.ERROR_WEIGHTS, acceleration_stages) if weight != 0)
+
+        # every component against atol + rtol * its larger magnitude at the start and the end of the step
+        position_scale = self.absolute_tolerance + self.tolerance * np.maximum(np.abs(positions), np.abs(new_positions))
+        speed_scale = self.absolute_tolerance + self.tolerance * np.maximum(np.abs(speeds), np.abs(new_speeds))
+        error = max(np.max(np.abs(position_error) / position_scale), np.max(np.abs(speed_error) / speed_scale))
+        return new_positions, new_speeds, acceleration_stages[-1], error
+
+    def advance(self, positions, speeds, accelerations, evaluate, delta_time: float):
+        elapsed = 0
+        while delta_time - elapsed > delta_time * 1E-12:
+            step = min(self.step_size, delta_time - elapsed)
+            new_positions, new_speeds, new_accelerations, error = self.try_step(positions, speeds, accelerations, evaluate, step, elapsed)
+            factor = min(5.0, max(0.2, 0.9 * error ** -0.2)) if error > 0 else 5.0
+
+            if error <= 1 or step <= self.min_step:
+                positions, speeds, accelerations = new_positions, new_speeds, new_accelerations
+                elapsed += step
+                self.accepted_steps += 1
+                # a step shortened to fit the remaining time says nothing against the suggested size
+                self.step_size = max(self.step_size, step * factor) if step < self.step_size else step * factor
+            else:
+                self.rejected_steps += 1
+                self.step_size = max(step * factor, self.min_step)
+
+        return positions, speeds
+
+
+INTEGRATORS = {
+    "euler": EulerIntegrator,
+    "verlet": VerletIntegrator,
+    "yoshida": YoshidaIntegrator,
+    "rk4": RungeKuttaIntegrator,
+    "dopri": DormandPrinceIntegrator,
+}
+
+
+def make_integrator(name: str):
+    return INTEGRATORS[name]()
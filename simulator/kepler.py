@@ -0,0 +1,101 @@
+import math
+
+from physics import Vector
+
+
+class Conic:
+    # two-body trajectory of a body relative to its attractor, described by true anomaly
+    NEWTON_ITERATIONS = 50
+    NEWTON_TOLERANCE = 1E-13
+
+    def __init__(self, position: Vector, speed: Vector, mu: float):
+        self.mu = mu
+        angular_momentum = position.cross_product(speed)
+        self.direction = 1 if angular_momentum >= 0 else -1
+        self.parameter = angular_momentum ** 2 / mu
+
+        # e = v x h / mu - r / |r| with h perpendicular to the plane
+        eccentricity_vector = Vector((speed.y, -speed.x)) * (angular_momentum / mu) - position / position.magnitude
+        self.eccentricity = eccentricity_vector.magnitude
+        self.periapsis_angle = math.atan2(eccentricity_vector.y, eccentricity_vector.x)
+
+        energy = speed.magnitude ** 2 / 2 - mu / position.magnitude
+        self.semi_major_axis = -mu / (2 * energy) if energy != 0 else math.inf
+        self.mean_motion = math.sqrt(mu / abs(self.semi_major_axis) ** 3)
+        self.anomaly = self.true_anomaly_of(position.polar_angle)
+        self.mean_anomaly = self.mean_anomaly_of(self.anomaly)
+
+    @property
+    def elliptic(self):
+        return self.eccentricity < 1
+
+    @property
+    def period(self):
+        return 2 * math.pi / self.mean_motion if self.elliptic else math.inf
+
+    def true_anomaly_of(self, polar_angle: float):
+        return math.remainder(self.direction * (polar_angle - self.periapsis_angle), 2 * math.pi)
+
+    def mean_anomaly_of(self, true_anomaly: float):
+        e = self.eccentricity
+        if self.elliptic:
+            eccentric_anomaly = 2 * math.atan(math.sqrt((1 - e) / (1 + e)) * math.tan(true_anomaly / 2))
+            return eccentric_anomaly - e * math.sin(eccentric_anomaly)
+        hyperbolic_anomaly = 2 * math.atanh(math.sqrt((e - 1) / (e + 1)) * math.tan(true_anomaly / 2))
+        return e * math.sinh(hyperbolic_anomaly) - hyperbolic_anomaly
+
+    def true_anomaly_at(self, mean_anomaly: float):
+        # Kepler's equation by Newton's method
+        e = self.eccentricity
+        if self.elliptic:
+            mean_anomaly = math.remainder(mean_anomaly, 2 * math.pi)
+            anomaly = mean_anomaly if e < 0.8 else math.copysign(math.pi, mean_anomaly)
+            for _ in range(Conic.NEWTON_ITERATIONS):
+                correction = (anomaly - e * math.sin(anomaly) - mean_anomaly) / (1 - e * math.cos(anomaly))
+                anomaly -= correction
+                if abs(correction) < Conic.NEWTON_TOLERANCE:
+                    break
+            return 2 * math.atan2(math.sqrt(1 + e) * math.sin(anomaly / 2), math.sqrt(1 - e) * math.cos(anomaly / 2))
+
+        anomaly = math.asinh(mean_anomaly / e)
+        for _ in range(Conic.NEWTON_ITERATIONS):
+            correction = (e * math.sinh(anomaly) - anomaly - mean_anomaly) / (e * math.cosh(anomaly) - 1)
+            anomaly -= correction
+            if abs(correction) < Conic.NEWTON_TOLERANCE * max(1.0, abs(anomaly)):
+                break
+        return 2 * math.atan(math.sqrt((e + 1) / (e - 1)) * math.tanh(anomaly / 2))
+
+    def state_at(self, true_anomaly: float):
+        radius = self.parameter / (1 + self.eccentricity * math.cos(true_anomaly))
+        polar_angle = self.periapsis_angle + self.direction * true_anomaly
+        radial = Vector.make_vector_by_polar_angle(polar_angle, 1)
+        transverse = Vector((-radial.y, radial.x)) * self.direction
+        speed_scale = math.sqrt(self.mu / self.parameter)
+        speed = radial * (speed_scale * self.eccentricity * math.sin(true_anomaly)) + transverse * (speed_scale * (1 + self.eccentricity * math.cos(true_anomaly)))
+        return radial * radius, speed
+
+    def propagate(self, delta_time: float):
+        return self.state_at(self.true_anomaly_at(self.mean_anomaly + self.mean_motion * delta_time))
+
+    def time_to_true_anomaly(self, true_anomaly: float):
+        if not self.elliptic:
+            limit = math.acos(-1 / self.eccentricity)
+            if abs(true_anomaly) >= limit:
+                return None
+            time = (self.mean_anomaly_of(true_anomaly) - self.mean_anomaly) / self.mean_motion
+            return time if time >= 0 else None
+        return (self.mean_anomaly_of(true_anomaly) - self.mean_anomaly) % (2 * math.pi) / self.mean_motion
+
+    def time_to_polar_angle(self, polar_angle: float):
+        return self.time_to_true_anomaly(self.true_anomaly_of(polar_angle))
+
+    def time_to_radius(self, radius: float):
+        if self.eccentricity == 0:
+            return None
+        cosine = (self.parameter / radius - 1) / self.eccentricity
+        if abs(cosine) > 1:
+            return None
+        anomaly = math.acos(cosine)
+        times = [self.time_to_true_anomaly(anomaly), self.time_to_true_anomaly(-anomaly)]
+        times = [time for time in times if time is not None]
+        return min(times) if times else None
@@ -1,85 +1,82 @@
-import matplotlib.pyplot as plt
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 import events
 import config
-from events import EventSubscriber
-from physics import Physics
-from events import GravityTrackingEvent
+from events import EventBus, EventSubscriber, PlotsBuiltEvent
+from plots import build_plots
+from telemetry import TelemetryStore, make_sampling_policy
 
 
 class Logger(events.EventSubscriber):
-    def __init__(self):
+    def __init__(self, event_bus: EventBus):
         super().__init__()
+        self.event_bus = event_bus
         self.subscribe(events.LogableEvent)
 
 
 class ConsoleLogger(Logger):
-    def __init__(self):
-        super().__init__()
+    def __init__(self, event_bus: EventBus):
+        super().__init__(event_bus)
 
     def handle_event(self, event):
         print(event)
 
 class RocketTracker(EventSubscriber):
-    def __init__(self):
+    def __init__(self, event_bus: EventBus):
         super().__init__()
+        self.event_bus = event_bus
         self.subscribe(events.RocketEvent)
         self.subscribe(events.CollisionEvent)
         self.subscribe(events.BuildPlotsEvent)
         self.subscribe(events.GravityTrackingEvent)
-        self.data = []
-        self.gravity_data = []
+        self.subscribe(events.FrameEvent)
+        self.bodies = list(config.TRACKED_BODIES)
+        # raw positions of the tracked bodies, their gravity is computed from them when the plots are built
+        columns = ["time", "x", "y", "vx", "vy", "mass", "height"] + [f"{name}_{axis}" for name in self.bodies for axis in ("x", "y")]
+        self.telemetry = TelemetryStore(columns, config.TELEMETRY_CHUNK_SIZE)
+        self.sampling = make_sampling_policy(config.TELEMETRY_SAMPLING, config.TELEMETRY_SAMPLING_VALUE)
+        # the gravity event of a step goes into the row of its rocket event
+        self.sampled = False
+        self.body_weights = {}
+        self.plot_executor = None
+        # jobs of the plot worker in submission order, reported from the frame loop once done
+        self.plot_jobs = deque()
 
     def handle_event(self, event):
         if isinstance(event, events.RocketEvent):
-            self.data.append(event)
+            self.sampled = self.sampling.sample(event)
+            if self.sampled:
+                self.telemetry.append((event.time, event.position.x, event.position.y, event.speed.x, event.speed.y, event.weight, event.height) + (np.nan,) * (2 * len(self.bodies)))
         elif isinstance(event, events.GravityTrackingEvent):
-            self.gravity_data.append(event)
+            if self.sampled:
+                for name, position in event.body_positions.items():
+                    if name in self.bodies:
+                        self.telemetry.set(f"{name}_x", position.x)
+                        self.telemetry.set(f"{name}_y", position.y)
+                        if name not in self.body_weights:
+                            self.body_weights[name] = event.bodies[name].weight
+        elif isinstance(event, events.FrameEvent):
+            self.report_plots()
         elif isinstance(event, events.CollisionEvent) and config.BUILD_GRAPHICS or isinstance(event, events.BuildPlotsEvent):
             self.build_plot()
 
     def build_plot(self):
-        self.build_speed_plot()
-        self.build_height_plot()
-        self.build_acceleration_plot()
-        self.build_position_plot()
-        self.build_gravity_graph()
-
-    def build_gravity_graph(self):
-        plt.plot([e.time for e in self.gravity_data], [e.sun_gravity for e in self.gravity_data], label="Sun")
-        plt.plot([e.time for e in self.gravity_data], [e.earth_gravity for e in self.gravity_data], label="Earth")
-        plt.xlabel('Time')
-        plt.ylabel('Gravity')
-        plt.title('Gravity to Sun and Earth vs Time')
-        plt.legend()
-        plt.show()
-
-    def build_speed_plot(self):
-        plt.plot([e.time for e in self.data], [e.speed.magnitude for e in self.data])
-        plt.xlabel('Time')
-        plt.ylabel('Speed')
-        plt.title('Speed vs Time')
-        plt.show()
-
-    def build_height_plot(self):
-        plt.plot([e.time for e in self.data], [Physics.calculate_distance(e.position, e.planet_position) for e in self.data])
-        plt.xlabel('Time')
-        plt.ylabel('Height')
-        plt.title('Height vs Time')
-        plt.show()
-
-    def build_acceleration_plot(self):
-        plt.plot([e.time for e in self.data[1:]], [(self.data[i].speed - self.data[i - 1].speed).magnitude / (self.data[i].time - self.data[i - 1].time) for i in range(1, len(self.data))])
-        plt.xlabel('Time')
-        plt.ylabel('Acceleration')
-        plt.title('Acceleration vs Time')
-        plt.show()
+        # drawn by a worker process from a snapshot of the telemetry, the simulation goes on meanwhile
+        if self.plot_executor is None:
+            self.plot_executor = ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn"))
+        telemetry = self.telemetry.snapshot()
+        if config.TELEMETRY_PATH is not None:
+            self.plot_executor.submit(telemetry.save, config.TELEMETRY_PATH)
+        self.plot_jobs.append(self.plot_executor.submit(build_plots, telemetry, dict(self.body_weights), config.PLOT_DIRECTORY, config.PLOT_FORMATS, config.PLOT_POINTS))
 
-    def build_position_plot(self):
-        plt.plot([e.position.x for e in self.data], [e.position.y for e in self.data])
-        plt.gca().invert_yaxis()
-        plt.gca().set_aspect('equal')
-        plt.xlabel('X')
-        plt.ylabel('Y')
-        plt.title('Rocket trajectory')
-        plt.show()
+    def report_plots(self):
+        # the worker finishes the jobs in order; the events go out on the window's thread, never on
+        # the executor's
+        while self.plot_jobs and self.plot_jobs[0].done():
+            job = self.plot_jobs.popleft()
+            error = job.exception()
+            self.event_bus.register_event(PlotsBuiltEvent([] if error is not None else job.result(), error))
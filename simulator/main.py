@@ -1,78 +1,76 @@
-import pygame
-import math
+import json
 
 import config
 from arguments import configure
-from entities import Planet, Orbit
-from physics import Vector, Point
-from groups import create_physics_groups
-from simobjects import SimPlanetaryObject, SimRocketObject
+from checkpoint import save_checkpoint, load_checkpoint
+from events import EventBus
+from groups import create_physics_groups, MoveGroup
+from mission import create_mission
 from simulation import Simulation
 from logger import RocketTracker
-from entities import PhaseControlledRocket
-from events import GravityTrackingEvent
-from rocket_phases import RocketTestOrbitManeuverPhase, RocketOrbitalBreakPhase, RocketTakeoffPhase, RocketPrintHeightPhase
-from rocket_phases import RocketRoundOrbitalManeuverPhase, RocketOrbitCorrectPhase, SetTimeScalePhase
-from rocket_phases import RocketWaitGreaterHeightPhase, RocketWaitPolarAnglePhase, RocketOrbitalManeuverPhase, RocketPrelandSlowingPhase, RocketWaitLessHeightPhase, RocketLandPhase
-from widgets import LoggerWidget, ClockWidget, TimeScaleWidget, CaptureWidget
+from replay import TrajectoryRecorder, TrajectoryReplay
+from widgets import LoggerWidget, ClockWidget, TimeScaleWidget, CaptureWidget, StepStatsWidget
 
 if __name__ == '__main__':
     configure()
 
-    earth = Planet(5.972E24, Point((0, 0)), Vector((0, -29780)), 6371E3, -math.pi / 12 / 60 / 60)
-    moon = Planet(7.346E22, Point((earth.position.x + 384E6, 0)), Vector((0.0, earth.speed.y -1.022E3)), 1737E3, 0)
-    sun = Planet(1.989E30, Point((-1.496E11, 0)), Vector((0, 0)), 696340E3, 0)
-    mars = Planet(6.39E23, Point((149293154749.65826 + sun.position.x, -172191648882.55933)), Vector((-18235.423356392195, -15810.429244034829)), 3389E3, math.pi / 24.62 / 2 / 60 / 60)
+    # every object of the simulation fires and subscribes on its bus
+    event_bus = EventBus()
+    sprites = create_mission(event_bus, config.ENSEMBLE_SIZE, config.ENSEMBLE_SEED, config.ENSEMBLE_SPREAD)
 
-    earth_sprite = SimPlanetaryObject(earth, pygame.Color("deepskyblue"), name="Earth")
-    moon_sprite = SimPlanetaryObject(moon, pygame.Color("white"), name="Moon")
-    sun_sprite = SimPlanetaryObject(sun, pygame.Color("yellow"), name="Sun")
-    mars_sprite = SimPlanetaryObject(mars, pygame.Color("red3"), name="Mars")
-
-    target_height = 50_000_000
+    # Building graphs
+    if config.BUILD_GRAPHICS and not config.HEADLESS:
+        rocket_tracker = RocketTracker(event_bus)
 
-    phases = [
-        RocketTakeoffPhase(300000),
-        RocketWaitGreaterHeightPhase(300000),
-        RocketRoundOrbitalManeuverPhase(300000),
-        RocketOrbitCorrectPhase(Orbit(earth, 300000, 0, 0)),
-        RocketWaitPolarAnglePhase(math.pi, 0.017),
-        RocketOrbitalManeuverPhase(Orbit.with_apogee(earth, 300000 + earth.radius, target_height + earth.radius, math.pi)),
-        RocketWaitGreaterHeightPhase(target_height),
-        RocketRoundOrbitalManeuverPhase(target_height),
-        RocketWaitGreaterHeightPhase(target_height),
-        SetTimeScalePhase(1000),
-        RocketTestOrbitManeuverPhase(earth, sun, mars),
-        SetTimeScalePhase(100),
-        RocketOrbitalBreakPhase(),
-        RocketPrelandSlowingPhase(1 - 1E-4, 1_000_000_000),
-        RocketWaitLessHeightPhase(100_000_000),
-        SetTimeScalePhase(10),
-        RocketPrelandSlowingPhase(1 - 1E-6, 30_000_000),
-        RocketWaitLessHeightPhase(20_000_000),
-        RocketLandPhase(),
-    ]
+    replay = TrajectoryReplay(config.REPLAY_PATH) if config.REPLAY_PATH is not None and not config.HEADLESS else None
+    recorder = TrajectoryRecorder(config.RECORD_PATH, sprites, config.RECORD_INTERVAL, event_bus) if config.RECORD_PATH is not None and replay is None else None
 
-    rocket = PhaseControlledRocket(9E6, 200, earth, 0, phases, fuel_speed=8000)
-    rocket_sprite = SimRocketObject(rocket, name="Rocket")
+    if config.HEADLESS:
+        groups = create_physics_groups(*sprites, event_bus=event_bus)
+        simulation = Simulation(time_scale=config.TIME_SCALE, amount_of_iterations=config.AMOUNT_OF_ITERATIONS, groups=groups,
+                                event_bus=event_bus, recorder=recorder)
+        if config.RESTORE_PATH is not None:
+            load_checkpoint(simulation, config.RESTORE_PATH)
+        if recorder is not None:
+            recorder.record(simulation)
+        summary = json.dumps(simulation.run_headless(config.TIME_LIMIT), indent=2)
+        if recorder is not None:
+            recorder.close()
+        if config.CHECKPOINT_PATH is not None:
+            save_checkpoint(simulation, config.CHECKPOINT_PATH)
+        if config.SUMMARY_PATH is None:
+            print(summary)
+        else:
+            with open(config.SUMMARY_PATH, "w") as summary_file:
+                summary_file.write(summary)
+        raise SystemExit(0)
 
-    # Building graphs
-    if config.BUILD_GRAPHICS:
-        rocket_tracker = RocketTracker()
+    logger_widget = LoggerWidget(event_bus)
+    clock_widget = ClockWidget()
+    time_scale_widget = TimeScaleWidget(False, config.TIME_SCALE, config.AMOUNT_OF_ITERATIONS, event_bus)
+    capture_widget = CaptureWidget(None, event_bus)
 
-    GravityTrackingEvent.sun = sun
-    GravityTrackingEvent.earth = earth
+    groups = create_physics_groups(*sprites, event_bus=event_bus)
+    widgets = [logger_widget, clock_widget, time_scale_widget, capture_widget]
 
-    logger_widget = LoggerWidget()
-    clock_widget = ClockWidget()
-    time_scale_widget = TimeScaleWidget(False, config.TIME_SCALE, config.AMOUNT_OF_ITERATIONS)
-    capture_widget = CaptureWidget(None)
+    integrator = next(group.integrator for group in groups if isinstance(group, MoveGroup))
+    if integrator is not None and integrator.adaptive:
+        widgets.append(StepStatsWidget(integrator))
 
     simulation = Simulation(
         time_scale=config.TIME_SCALE,
         amount_of_iterations=config.AMOUNT_OF_ITERATIONS,
-        groups=create_physics_groups(earth_sprite, moon_sprite, sun_sprite, mars_sprite, rocket_sprite),
-        widgets=(logger_widget, clock_widget, time_scale_widget, capture_widget),
-        clickable=(earth_sprite, rocket_sprite, mars_sprite, sun_sprite, moon_sprite),
+        groups=groups,
+        widgets=widgets,
+        clickable=sprites,
+        threaded=config.PHYSICS_THREAD,
+        event_bus=event_bus,
+        physics_budget=config.PHYSICS_BUDGET,
+        recorder=recorder,
+        replay=replay,
     )
+    if config.RESTORE_PATH is not None and replay is None:
+        load_checkpoint(simulation, config.RESTORE_PATH)
+    if recorder is not None:
+        recorder.record(simulation)
     simulation.run()
@@ -0,0 +1,89 @@
+import math
+
+import numpy as np
+import pygame
+
+from entities import Planet, Orbit, PhaseControlledRocket
+from physics import Vector, Point
+from simobjects import SimPlanetaryObject, SimRocketObject, SimEnsembleObject
+from ensemble import RocketEnsemble
+from events import EventBus
+from rocket_phases import RocketTestOrbitManeuverPhase, RocketOrbitalBreakPhase, RocketTakeoffPhase
+from rocket_phases import RocketRoundOrbitalManeuverPhase, RocketOrbitCorrectPhase, SetTimeScalePhase
+from rocket_phases import RocketWaitGreaterHeightPhase, RocketWaitPolarAnglePhase, RocketOrbitalManeuverPhase, RocketPrelandSlowingPhase, RocketWaitLessHeightPhase, RocketLandPhase
+
+
+def create_solar_system(event_bus: EventBus = None):
+    earth = Planet(5.972E24, Point((0, 0)), Vector((0, -29780)), 6371E3, -math.pi / 12 / 60 / 60)
+    moon = Planet(7.346E22, Point((earth.position.x + 384E6, 0)), Vector((0.0, earth.speed.y -1.022E3)), 1737E3, 0)
+    sun = Planet(1.989E30, Point((-1.496E11, 0)), Vector((0, 0)), 696340E3, 0)
+    mars = Planet(6.39E23, Point((149293154749.65826 + sun.position.x, -172191648882.55933)), Vector((-18235.423356392195, -15810.429244034829)), 3389E3, math.pi / 24.62 / 2 / 60 / 60)
+
+    earth_sprite = SimPlanetaryObject(earth, pygame.Color("deepskyblue"), name="Earth", event_bus=event_bus)
+    moon_sprite = SimPlanetaryObject(moon, pygame.Color("white"), name="Moon", event_bus=event_bus)
+    sun_sprite = SimPlanetaryObject(sun, pygame.Color("yellow"), name="Sun", event_bus=event_bus)
+    mars_sprite = SimPlanetaryObject(mars, pygame.Color("red3"), name="Mars", event_bus=event_bus)
+    return earth_sprite, moon_sprite, sun_sprite, mars_sprite
+
+
+def create_mars_mission_phases(earth: Planet, sun: Planet, mars: Planet, target_height: float = 50_000_000, orbit_height: float = 300_000):
+    return [
+        RocketTakeoffPhase(orbit_height),
+        RocketWaitGreaterHeightPhase(orbit_height),
+        RocketRoundOrbitalManeuverPhase(orbit_height),
+        RocketOrbitCorrectPhase(Orbit(earth, orbit_height, 0, 0)),
+        RocketWaitPolarAnglePhase(math.pi, 0.017),
+        RocketOrbitalManeuverPhase(Orbit.with_apogee(earth, orbit_height + earth.radius, target_height + earth.radius, math.pi)),
+        RocketWaitGreaterHeightPhase(target_height),
+        RocketRoundOrbitalManeuverPhase(target_height),
+        RocketWaitGreaterHeightPhase(target_height),
+        SetTimeScalePhase(1000),
+        RocketTestOrbitManeuverPhase(earth, sun, mars),
+        SetTimeScalePhase(100),
+        RocketOrbitalBreakPhase(),
+        RocketPrelandSlowingPhase(1 - 1E-4, 1_000_000_000),
+        RocketWaitLessHeightPhase(100_000_000),
+        SetTimeScalePhase(10),
+        RocketPrelandSlowingPhase(1 - 1E-6, 30_000_000),
+        RocketWaitLessHeightPhase(20_000_000),
+        RocketLandPhase(),
+    ]
+
+
+def create_mars_mission_rocket(earth: Planet, sun: Planet, mars: Planet, weight: float = 9E6, fuel_speed: float = 8000,
+                               target_acceleration: float = 3.0 * 9.8, polar_angle: float = 0,
+                               target_height: float = 50_000_000, orbit_height: float = 300_000, event_bus: EventBus = None):
+    phases = create_mars_mission_phases(earth, sun, mars, target_height, orbit_height)
+    rocket = PhaseControlledRocket(weight, 200, earth, polar_angle, phases, target_acceleration=target_acceleration, fuel_speed=fuel_speed, event_bus=event_bus)
+    return SimRocketObject(rocket, name="Rocket", event_bus=event_bus)
+
+
+def create_mission(event_bus: EventBus, ensemble_size: int = 0, ensemble_seed: int = 0, ensemble_spread: float = 0.01):
+    # the sprites of the mission: the planets, the rocket and, for an ensemble_size other than 0, the ensemble
+    earth_sprite, moon_sprite, sun_sprite, mars_sprite = create_solar_system(event_bus)
+    earth, sun, mars = earth_sprite.entity, sun_sprite.entity, mars_sprite.entity
+    sprites = [earth_sprite, moon_sprite, sun_sprite, mars_sprite, create_mars_mission_rocket(earth, sun, mars, event_bus=event_bus)]
+    if ensemble_size:
+        planets = [sprite.entity for sprite in (earth_sprite, moon_sprite, sun_sprite, mars_sprite)]
+        sprites.append(create_mars_mission_ensemble(planets, earth, sun, mars, ensemble_size, seed=ensemble_seed,
+                                                    spread=ensemble_spread, angle_spread=ensemble_spread, event_bus=event_bus))
+    return sprites
+
+
+def create_mars_mission_ensemble(planets, earth: Planet, sun: Planet, mars: Planet, amount: int, seed: int = 0, spread: float = 0.01,
+                                 angle_spread: float = 0.01, weight: float = 9E6, fuel_speed: float = 8000,
+                                 target_acceleration: float = 3.0 * 9.8, target_height: float = 50_000_000, orbit_height: float = 300_000,
+                                 event_bus: EventBus = None):
+    # the rockets share the phase list, their weight, engine and launch angle are perturbed
+    deviations = np.random.default_rng(seed).standard_normal((4, amount))
+    phases = create_mars_mission_phases(earth, sun, mars, target_height, orbit_height)
+    ensemble = RocketEnsemble(
+        planets, earth, phases,
+        weights=weight * (1 + spread * deviations[0]),
+        payload_weights=200,
+        polar_angles=angle_spread * deviations[1],
+        target_accelerations=target_acceleration * (1 + spread * deviations[2]),
+        fuel_speeds=fuel_speed * (1 + spread * deviations[3]),
+        event_bus=event_bus,
+    )
+    return SimEnsembleObject(ensemble, name="Ensemble", event_bus=event_bus)
@@ -0,0 +1,195 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import config
+from arguments import add_physics_arguments, apply_physics_arguments
+from ephemeris import Ephemeris
+from events import EventBus
+from groups import create_physics_groups
+from mission import create_solar_system, create_mars_mission_rocket
+from rocket_phases import RocketLandPhase
+from simulation import Simulation
+
+
+# Parameters of create_mars_mission_rocket that every run perturbs. The launch angle gets an
+# absolute spread in radians, all the others a relative one.
+NOMINAL = {
+    "weight": 9E6,
+    "fuel_speed": 8000,
+    "target_acceleration": 3.0 * 9.8,
+    "polar_angle": 0,
+    "target_height": 50_000_000,
+    "orbit_height": 300_000,
+}
+DEFAULT_TIME_LIMIT = 400 * 24 * 3600
+
+
+def make_case(seed: int, index: int, spread: float, angle_spread: float):
+    # every run draws from its own stream, so a case does not depend on the amount or order of runs
+    generator = np.random.default_rng((seed, index))
+    case = {}
+    for name, value in NOMINAL.items():
+        deviation = generator.standard_normal()
+        case[name] = value + angle_spread * deviation if name == "polar_angle" else value * (1 + spread * deviation)
+    return case
+
+
+def configure_worker(settings):
+    for name, value in settings.items():
+        setattr(config, name, value)
+
+
+def landing_stop_reason(simulation, rocket_sprite, target):
+    # A run ends when the rocket touches a planet, not when its phases are done: the landing phase
+    # ends above the surface with the rocket still falling onto it. Phases done on a trajectory that
+    # misses the surface of the target end it as well.
+    def stop_reason(time_limit: float = None):
+        if simulation.collisions:
+            return "collision"
+        if (reason := simulation.time_stop_reason(time_limit)) is not None:
+            return reason
+        rocket = rocket_sprite.entity
+        if not rocket.phase_stack:
+            conic = rocket.conic
+            periapsis = conic.parameter / (1 + conic.eccentricity)
+            if rocket.planet is not target or periapsis > target.radius or not conic.elliptic and rocket.radial_speed > 0:
+                return "phases_complete"
+        return None
+    return stop_reason
+
+
+def landing(rocket):
+    # a touchdown counts during or after the last phase, the landing
+    return not rocket.phase_stack or len(rocket.phase_stack) == 1 and isinstance(rocket.phase_stack[0], RocketLandPhase)
+
+
+def run_case(seed: int, index: int, case, time_limit: float):
+    # runs share the worker process, every mission gets its own bus
+    event_bus = EventBus()
+    earth_sprite, moon_sprite, sun_sprite, mars_sprite = create_solar_system(event_bus)
+    earth, sun, mars = earth_sprite.entity, sun_sprite.entity, mars_sprite.entity
+    rocket_sprite = create_mars_mission_rocket(earth, sun, mars, **case, event_bus=event_bus)
+
+    simulation = Simulation(
+        time_scale=config.TIME_SCALE,
+        amount_of_iterations=config.AMOUNT_OF_ITERATIONS,
+        groups=create_physics_groups(earth_sprite, moon_sprite, sun_sprite, mars_sprite, rocket_sprite, event_bus=event_bus),
+        event_bus=event_bus,
+    )
+    rocket = rocket_sprite.entity
+    record = {"seed": seed, "index": index, "parameters": case, "landing_speed": None, "failure": None}
+    start = time.perf_counter()
+
+    try:
+        summary = simulation.run_headless(time_limit, landing_stop_reason(simulation, rocket_sprite, mars))
+        collision = summary["rockets"][0]["collision"]
+        if collision is not None:
+            record["landing_speed"] = collision["speed"]
+            if collision["planet"] == mars_sprite.name and landing(rocket):
+                record["outcome"] = "landed"
+            else:
+                record["outcome"] = "collision"
+                record["failure"] = f"fell on {collision['planet']} with {len(rocket.phase_stack)} phases left"
+        elif summary["stop_reason"] == "phases_complete":
+            record["outcome"] = "phases_complete"
+            planet = next(sprite.name for sprite in (earth_sprite, moon_sprite, sun_sprite, mars_sprite) if sprite.entity is rocket.planet)
+            record["failure"] = f"phases done {rocket.height:.0f} m above {planet}, clear of the surface of {mars_sprite.name}"
+        else:
+            record["outcome"] = summary["stop_reason"]
+            record["failure"] = f"{len(rocket.phase_stack)} phases left after {simulation.total_sim_time:.0f} s"
+    except Exception as error:
+        record["outcome"] = "error"
+        record["failure"] = f"{type(error).__name__}: {error}"
+
+    record["fuel_left"] = rocket.weight - rocket.payload_weight
+    record["sim_time"] = simulation.total_sim_time
+    record["wall_time"] = time.perf_counter() - start
+    return record
+
+
+def load_records(path: str):
+    if not os.path.exists(path):
+        return []
+    with open(path) as records_file:
+        # a run interrupted while writing leaves a truncated last line behind
+        lines = [line for line in records_file.read().split("\n") if line.strip()]
+    records = []
+    for line in lines:
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            pass
+    return records
+
+
+def percentiles(values):
+    if not values:
+        return None
+    return dict(zip(("p5", "p50", "p95"), np.percentile(values, (5, 50, 95)).tolist()))
+
+
+def report(records):
+    outcomes = {}
+    for record in records:
+        outcomes[record["outcome"]] = outcomes.get(record["outcome"], 0) + 1
+    landed = [record for record in records if record["outcome"] == "landed"]
+
+    return {
+        "runs": len(records),
+        "outcomes": outcomes,
+        "success_rate": len(landed) / len(records) if records else None,
+        "landing_speed": percentiles([record["landing_speed"] for record in records if record["landing_speed"] is not None]),
+        "fuel_left": percentiles([record["fuel_left"] for record in landed]),
+        "sim_time": percentiles([record["sim_time"] for record in landed]),
+        "wall_time": sum(record["wall_time"] for record in records),
+        "failures": sorted({record["failure"] for record in records if record["failure"] is not None}),
+    }
+
+
+def configure():
+    parser = argparse.ArgumentParser(prog=sys.argv[0], description="Monte Carlo runs of the Mars mission with perturbed parameters")
+    parser.add_argument("-n", "--runs", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="montecarlo.jsonl", help="Per-run results, existing runs of the same seed are not repeated")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--spread", type=float, default=0.01, help="Relative standard deviation of the mission parameters")
+    parser.add_argument("--angle-spread", type=float, default=0.01, help="Standard deviation of the launch angle, radians")
+    parser.add_argument("--time-limit", type=float, default=DEFAULT_TIME_LIMIT, help="Simulated seconds before a run is given up")
+    add_physics_arguments(parser)
+    args = parser.parse_args()
+    apply_physics_arguments(args)
+    return args
+
+
+if __name__ == '__main__':
+    args = configure()
+
+    if config.EPHEMERIS_PATH is not None:
+        # built once here, the workers only map it
+        Ephemeris.open_or_build(config.EPHEMERIS_PATH, list(create_solar_system()), config.EPHEMERIS_DURATION)
+
+    records = load_records(args.output)
+    # rewritten without the line an interrupted run may have cut short
+    with open(args.output, "w") as output:
+        output.writelines(json.dumps(record) + "\n" for record in records)
+
+    done = {record["index"] for record in records if record["seed"] == args.seed}
+    pending = [index for index in range(args.runs) if index not in done]
+    settings = {name: getattr(config, name) for name in dir(config) if name.isupper()}
+
+    with open(args.output, "a") as output, ProcessPoolExecutor(args.workers, initializer=configure_worker, initargs=(settings,)) as executor:
+        futures = [executor.submit(run_case, args.seed, index, make_case(args.seed, index, args.spread, args.angle_spread), args.time_limit) for index in pending]
+        for completed, future in enumerate(as_completed(futures), len(done) + 1):
+            record = future.result()
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            print(f"{completed}/{args.runs} run {record['index']}: {record['outcome']} ({record['wall_time']:.0f} s)", file=sys.stderr)
+
+    records = [record for record in load_records(args.output) if record["seed"] == args.seed and record["index"] < args.runs]
+    print(json.dumps(report(records), indent=2))
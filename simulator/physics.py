@@ -1,81 +1,104 @@
 import math
 
 
+# Fixed 2D vector: two float slots instead of a coordinate list, arithmetic without intermediate lists
 class Vector:
+    __slots__ = ("x", "y")
+
     def __init__(self, *args):
         if len(args) == 1 and (isinstance(args[0], list) or isinstance(args[0], tuple)):
-            self._coordinates = args[0][::]
+            self.x, self.y = args[0]
         elif len(args) == 2 and all(isinstance(arg, Point) for arg in args):
             point1, point2 = args
-            self._coordinates = [j - i for i, j in zip(point1.coordinates, point2.coordinates)]
+            self.x = point2.x - point1.x
+            self.y = point2.y - point1.y
         else:
             raise ValueError("Invalid number of arguments")
 
+    @classmethod
+    def from_xy(cls, x: float, y: float):
+        vector = cls.__new__(cls)
+        vector.x = x
+        vector.y = y
+        return vector
+
     def __neg__(self):
-        return Vector([-i for i in self._coordinates])
+        return Vector.from_xy(-self.x, -self.y)
 
     def __add__(self, other):
-        return Vector([i + j for i, j in zip(self._coordinates, other.coordinates)])
+        return Vector.from_xy(self.x + other.x, self.y + other.y)
 
     def __iadd__(self, other):
-        self._coordinates = [i + j for i, j in zip(self._coordinates, other.coordinates)]
+        self.x += other.x
+        self.y += other.y
         return self
 
     def __sub__(self, other):
-        return Vector([i - j for i, j in zip(self._coordinates, other.coordinates)])
+        return Vector.from_xy(self.x - other.x, self.y - other.y)
 
     def __isub__(self, other):
-        self._coordinates = [i - j for i, j in zip(self._coordinates, other.coordinates)]
+        self.x -= other.x
+        self.y -= other.y
         return self
 
     def __mul__(self, number: float):
-        return Vector([i * number for i in self._coordinates])
+        return Vector.from_xy(self.x * number, self.y * number)
 
     def __truediv__(self, number: float):
-        return Vector([i / number for i in self._coordinates])
+        return Vector.from_xy(self.x / number, self.y / number)
 
     def __getitem__(self, item: int):
-        return self._coordinates[item]
+        return (self.x, self.y)[item]
+
+    def __iter__(self):
+        return iter((self.x, self.y))
 
     def __len__(self):
-        return len(self.coordinates)
+        return 2
 
     def __repr__(self):
-        return f"Vector({self._coordinates})"
+        return f"Vector([{self.x}, {self.y}])"
+
+    # in-place variants for accumulators, they change the vector for everyone holding it
+    def iadd(self, other):
+        self.x += other.x
+        self.y += other.y
+        return self
+
+    def isub(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        return self
+
+    def scale_add(self, other, factor: float):
+        self.x += other.x * factor
+        self.y += other.y * factor
+        return self
 
     def copy(self):
-        return Vector(self._coordinates)
+        return Vector.from_xy(self.x, self.y)
 
     def cross_product(self, other):
-        if len(other.coordinates) == 2 and len(self._coordinates) == 2:
-            return self.coordinates[0] * other.coordinates[1] - self.coordinates[1] * other.coordinates[0]
+        return self.x * other.y - self.y * other.x
 
     def rotate(self, angle: float):
-        return Vector((self.x * math.cos(angle) - self.y * math.sin(angle), self.x * math.sin(angle) + self.y * math.cos(angle)))
+        return Vector.from_xy(self.x * math.cos(angle) - self.y * math.sin(angle), self.x * math.sin(angle) + self.y * math.cos(angle))
 
     @property
     def coordinates(self):
-        return tuple(self._coordinates)
-
-    @property
-    def x(self):
-        return self._coordinates[0]
-
-    @property
-    def y(self):
-        return self._coordinates[1]
+        return self.x, self.y
 
     @property
     def magnitude(self):
-        return math.sqrt(sum([i ** 2 for i in self._coordinates]))
+        return math.sqrt(self.x ** 2 + self.y ** 2)
 
     def normalize(self):
-        magnitude = self.magnitude
-        return Vector([i / magnitude for i in self._coordinates])
+        magnitude = math.sqrt(self.x ** 2 + self.y ** 2)
+        return Vector.from_xy(self.x / magnitude, self.y / magnitude)
 
     @staticmethod
     def dot_product(v1, v2):
-        return sum([i * j for i, j in zip(v1, v2)])
+        return v1[0] * v2[0] + v1[1] * v2[1]
 
     @property
     def polar_angle(self):
@@ -85,33 +108,34 @@ class Vector:
     def make_vector_by_polar_angle(polar_angle: float, magnitude: float):
         x = magnitude * math.cos(polar_angle)
         y = magnitude * math.sin(polar_angle)
-        return Vector((x, y))
+        return Vector.from_xy(x, y)
 
 
 class Point:
+    __slots__ = ("x", "y")
+
     def __init__(self, coordinates):
-        self._coordinates = coordinates
+        self.x, self.y = coordinates
+
+    @classmethod
+    def from_xy(cls, x: float, y: float):
+        point = cls.__new__(cls)
+        point.x = x
+        point.y = y
+        return point
 
     def __getitem__(self, item):
-        return self._coordinates[item]
+        return (self.x, self.y)[item]
 
     def __add__(self, vector: Vector):
-        return Point([i + j for i, j in zip(self._coordinates, vector.coordinates)])
+        return Point.from_xy(self.x + vector.x, self.y + vector.y)
 
     def __sub__(self, vector: Vector):
-        return Point([i - j for i, j in zip(self._coordinates, vector.coordinates)])
-
-    @property
-    def x(self):
-        return self._coordinates[0]
-
-    @property
-    def y(self):
-        return self._coordinates[1]
+        return Point.from_xy(self.x - vector.x, self.y - vector.y)
 
     @property
     def coordinates(self):
-        return self._coordinates
+        return self.x, self.y
 
     def __repr__(self):
         return f"Point({self.coordinates})"
@@ -119,11 +143,78 @@ class Point:
 
 class Entity:
     def __init__(self, weight: float, position: Point, speed: Vector, force: Vector=Vector((0, 0))):
+        # when bound to an ArrayEngine the entity becomes a view into its arrays
+        self.engine = None
+        self.index = None
+        self._version = 0
         self.position = position
         self.speed = speed
         self.weight = weight
         self.force = force
 
+    @property
+    def state_version(self):
+        # changes whenever position, speed or weight do; bound entities share the counter of the engine
+        return self._version if self.engine is None else self.engine.version
+
+    @property
+    def position(self):
+        if self.engine is None:
+            return self._position
+        return Point(self.engine.positions[self.index].tolist())
+
+    @position.setter
+    def position(self, position: Point):
+        if self.engine is None:
+            self._position = position
+            self._version += 1
+        else:
+            self.engine.positions[self.index] = position.coordinates
+            self.engine.version += 1
+
+    @property
+    def speed(self):
+        if self.engine is None:
+            return self._speed
+        return Vector(self.engine.speeds[self.index].tolist())
+
+    @speed.setter
+    def speed(self, speed: Vector):
+        if self.engine is None:
+            self._speed = speed
+            self._version += 1
+        else:
+            self.engine.speeds[self.index] = speed.coordinates
+            self.engine.version += 1
+
+    @property
+    def force(self):
+        if self.engine is None:
+            return self._force
+        return Vector(self.engine.forces[self.index].tolist())
+
+    @force.setter
+    def force(self, force: Vector):
+        if self.engine is None:
+            self._force = force
+        else:
+            self.engine.forces[self.index] = force.coordinates
+
+    @property
+    def weight(self):
+        if self.engine is None:
+            return self._weight
+        return float(self.engine.weights[self.index])
+
+    @weight.setter
+    def weight(self, weight: float):
+        if self.engine is None:
+            self._weight = weight
+            self._version += 1
+        else:
+            self.engine.weights[self.index] = weight
+            self.engine.version += 1
+
 
 class Physics:
     G = 6.67430e-11
@@ -134,12 +225,13 @@ class Physics:
 
     @staticmethod
     def calculate_gravity(body1: Entity, body2: Entity):
-        weight1 = body1.weight
-        weight2 = body2.weight
-        distance = Physics.calculate_distance(body1.position, body2.position)
-        gravity_force = Physics.G * weight1 * weight2 / distance ** 2
-        force_vector = Vector(body1.position, body2.position).normalize() * gravity_force
-        return force_vector
+        position1 = body1.position
+        position2 = body2.position
+        x = position2.x - position1.x
+        y = position2.y - position1.y
+        distance = math.sqrt(x ** 2 + y ** 2)
+        gravity_force = Physics.G * body1.weight * body2.weight / distance ** 2
+        return Vector.from_xy(x / distance * gravity_force, y / distance * gravity_force)
 
     @staticmethod
     def apply_gravity(body1: Entity, body2: Entity):
@@ -149,6 +241,14 @@ class Physics:
 
     @staticmethod
     def move(body: Entity, delta_time: float):
-        acceleration = body.force / body.weight
-        body.position = body.position + body.speed * delta_time + acceleration * delta_time ** 2 / 2
-        body.speed += acceleration * delta_time
+        weight = body.weight
+        force = body.force
+        position = body.position
+        speed = body.speed
+        acceleration_x = force.x / weight
+        acceleration_y = force.y / weight
+        body.position = Point.from_xy(
+            position.x + speed.x * delta_time + acceleration_x * delta_time ** 2 / 2,
+            position.y + speed.y * delta_time + acceleration_y * delta_time ** 2 / 2,
+        )
+        body.speed = speed.scale_add(Vector.from_xy(acceleration_x, acceleration_y), delta_time)
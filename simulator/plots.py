@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from physics import Physics
+
+
+def lttb(x, y, points: int):
+    # indexes of the samples Largest-Triangle-Three-Buckets keeps: the first and the last one, and from
+    # each bucket in between the one spanning the largest triangle with the sample kept before it and
+    # the mean of the next bucket
+    amount = len(x)
+    if points >= amount or points < 3:
+        return np.arange(amount)
+
+    edges = np.arange(points - 1) * (amount - 2) // (points - 2) + 1
+    sizes = np.diff(edges)
+    means_x = np.append(np.add.reduceat(x[1:-1], edges[:-1] - 1) / sizes, x[-1])
+    means_y = np.append(np.add.reduceat(y[1:-1], edges[:-1] - 1) / sizes, y[-1])
+
+    indexes = np.empty(points, dtype=np.intp)
+    indexes[0], indexes[-1] = 0, amount - 1
+    previous = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs((x[previous] - means_x[bucket + 1]) * (y[start:end] - y[previous])
+                       - (x[previous] - x[start:end]) * (means_y[bucket + 1] - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indexes[bucket + 1] = previous
+    return indexes
+
+
+def save_figure(figure: Figure, directory: str, name: str, formats):
+    FigureCanvasAgg(figure)
+    paths = []
+    for file_format in formats:
+        path = os.path.join(directory, f"{name}.{file_format}")
+        figure.savefig(path)
+        paths.append(path)
+    return paths
+
+
+def plot(directory: str, name: str, formats, title: str, x_label: str, y_label: str, lines, equal_aspect: bool = False):
+    figure = Figure(figsize=(8, 6))
+    axes = figure.add_subplot()
+    for x, y, label in lines:
+        axes.plot(x, y, label=label)
+    axes.set_title(title)
+    axes.set_xlabel(x_label)
+    axes.set_ylabel(y_label)
+    if equal_aspect:
+        axes.invert_yaxis()
+        axes.set_aspect("equal")
+    if any(label is not None for _, _, label in lines):
+        axes.legend()
+    return save_figure(figure, directory, name, formats)
+
+
+def build_plots(telemetry, body_weights, directory: str, formats, points: int):
+    # Runs in the plot worker process with the Agg canvas, never on the simulation's thread. Every
+    # curve is derived from the full columns and then cut down to points samples by LTTB. The
+    # gravity of the tracked bodies (names to weights) comes from their positions and the mass.
+    os.makedirs(directory, exist_ok=True)
+    times = telemetry.column("time")
+    if len(times) < 2:
+        return []
+    speeds_x, speeds_y = telemetry.column("vx"), telemetry.column("vy")
+    speeds = np.hypot(speeds_x, speeds_y)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accelerations = np.hypot(np.diff(speeds_x), np.diff(speeds_y)) / np.diff(times)
+
+    def curve(x, y, label=None):
+        kept = lttb(x, y, points)
+        return x[kept], y[kept], label
+
+    paths = []
+    paths += plot(directory, "speed-vs-time", formats, "Speed vs Time", "Time", "Speed", [curve(times, speeds)])
+    paths += plot(directory, "height-vs-time", formats, "Height vs Time", "Time", "Height", [curve(times, telemetry.column("height"))])
+    paths += plot(directory, "acceleration-vs-time", formats, "Acceleration vs Time", "Time", "Acceleration", [curve(times[1:], accelerations)])
+
+    # a trajectory is not a function of x, the samples kept for x(t) and for y(t) together draw it
+    x, y = telemetry.column("x"), telemetry.column("y")
+    kept = np.union1d(lttb(times, x, points // 2), lttb(times, y, points // 2))
+    paths += plot(directory, "rocket-trajectory", formats, "Rocket trajectory", "X", "Y", [(x[kept], y[kept], None)], equal_aspect=True)
+
+    masses = telemetry.column("mass")
+    gravity = [(name, Physics.G * weight * masses / ((telemetry.column(f"{name}_x") - x) ** 2 + (telemetry.column(f"{name}_y") - y) ** 2))
+               for name, weight in body_weights.items()]
+    gravity = [(name, column) for name, column in gravity if not np.all(np.isnan(column))]
+    if gravity:
+        paths += plot(directory, "gravity-vs-time", formats, f"Gravity to {' and '.join(name for name, _ in gravity)} vs Time",
+                      "Time", "Gravity", [curve(times, column, name) for name, column in gravity])
+    return paths
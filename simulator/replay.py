@@ -0,0 +1,136 @@
+import json
+import os
+
+import numpy as np
+
+from events import EventBus, EventSubscriber, LogableEvent
+from physics import Point
+from simobjects import SimEnsembleObject
+
+FORMAT_VERSION = 1
+
+
+class ReplayedEvent(LogableEvent):
+    def __init__(self, text: str):
+        super().__init__()
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+
+# Writes the positions of every sprite every interval simulated seconds into PATH.frames, rows of
+# float64 laid out by PATH.json: the time, then x and y of each sprite (NaN once it is gone) or of
+# every rocket of an ensemble. Logable events go to PATH.events, a JSON line each with its time.
+# Rows are fixed size, so a recording is readable up to its last written frame at any moment.
+class TrajectoryRecorder(EventSubscriber):
+    def __init__(self, path: str, sprites, interval: float, event_bus: EventBus):
+        self.event_bus = event_bus
+        self.sprites = sorted(sprites, key=lambda sprite: sprite.name)
+        self.interval = interval
+        self.time = None
+        self.last_time = None
+        objects = [{"name": sprite.name, "size": len(sprite.ensemble.positions) if isinstance(sprite, SimEnsembleObject) else None}
+                   for sprite in self.sprites]
+        with open(path + ".json", "w") as metadata_file:
+            json.dump({"version": FORMAT_VERSION, "interval": interval, "objects": objects}, metadata_file)
+        self.frames_file = open(path + ".frames", "wb")
+        self.events_file = open(path + ".events", "w")
+        self.subscribe(LogableEvent)
+
+    def row(self):
+        row = [self.time]
+        for sprite in self.sprites:
+            if isinstance(sprite, SimEnsembleObject):
+                positions = sprite.ensemble.positions.copy()
+                positions[~sprite.ensemble.active] = np.nan
+                row.extend(positions.ravel().tolist())
+            elif sprite.alive():
+                row.extend(sprite.entity.position.coordinates)
+            else:
+                row.extend((np.nan, np.nan))
+        return np.array(row, dtype=np.float64)
+
+    def record(self, simulation):
+        self.time = simulation.total_sim_time
+        if self.last_time is not None and self.time - self.last_time < self.interval:
+            return
+        self.last_time = self.time
+        self.frames_file.write(self.row().tobytes())
+
+    def handle_event(self, event):
+        self.events_file.write(json.dumps({"time": self.time, "text": str(event)}) + "\n")
+
+    def close(self):
+        # the state the run ended in, unless it was just recorded
+        if self.time != self.last_time:
+            self.last_time = self.time
+            self.frames_file.write(self.row().tobytes())
+        self.frames_file.close()
+        self.events_file.close()
+
+
+# A recording opened for playback. The frames are memory mapped and a moment is found by binary
+# search of the time column, so seeking costs O(log n) page reads however long the mission was.
+class TrajectoryReplay:
+    def __init__(self, path: str):
+        with open(path + ".json") as metadata_file:
+            metadata = json.load(metadata_file)
+        if metadata["version"] != FORMAT_VERSION:
+            raise ValueError(f"Recording format {metadata['version']} is not supported")
+        self.objects = metadata["objects"]
+        row_size = 1 + sum(2 if obj["size"] is None else 2 * obj["size"] for obj in self.objects)
+        amount = os.path.getsize(path + ".frames") // (8 * row_size)
+        if amount == 0:
+            raise ValueError(f"Recording {path} has no frames")
+        self.frames = np.memmap(path + ".frames", dtype=np.float64, mode="r", shape=(amount, row_size))
+        self.times = self.frames[:, 0]
+
+        events = []
+        if os.path.exists(path + ".events"):
+            with open(path + ".events") as events_file:
+                events = [json.loads(line) for line in events_file if line.endswith("\n")]
+        self.event_times = np.array([event["time"] for event in events], dtype=np.float64)
+        self.event_texts = [event["text"] for event in events]
+
+    @property
+    def start(self):
+        return float(self.times[0])
+
+    @property
+    def end(self):
+        return float(self.times[-1])
+
+    def index(self, time: float):
+        # the last frame at or before time
+        return min(max(int(np.searchsorted(self.times, time, side="right")) - 1, 0), len(self.times) - 1)
+
+    def state(self, time: float):
+        # positions of the sprites by name at time, linear between the two frames around it; None for
+        # a sprite that is gone, an array of the rockets still flying for an ensemble
+        index = self.index(time)
+        row = self.frames[index]
+        if index + 1 < len(self.frames) and self.times[index + 1] > self.times[index]:
+            following = self.frames[index + 1]
+            fraction = min(max((time - row[0]) / (following[0] - row[0]), 0), 1)
+            moved = row + (following - row) * fraction
+            # a sprite gone in the next frame stays where it was last seen
+            row = np.where(np.isnan(following), row, moved)
+
+        state = {}
+        column = 1
+        for obj in self.objects:
+            if obj["size"] is None:
+                x, y = row[column], row[column + 1]
+                state[obj["name"]] = None if np.isnan(x) else Point((float(x), float(y)))
+                column += 2
+            else:
+                positions = row[column:column + 2 * obj["size"]].reshape(-1, 2)
+                state[obj["name"]] = positions[~np.isnan(positions[:, 0])]
+                column += 2 * obj["size"]
+        return state
+
+    def events_between(self, start: float, end: float):
+        # texts of the events after start up to end
+        first, last = np.searchsorted(self.event_times, (start, end), side="right")
+        return self.event_texts[first:last]
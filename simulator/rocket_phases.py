@@ -1,10 +1,12 @@
 import math
 
+import numpy as np
+
 import config
 
 from entities import Planet, Orbit, RocketPhase, PhaseControlledRocket
 from physics import Physics, Vector, Entity
-from events import EventRegistrer, PrintTotalSimTimeEvent, SetSimulationTimeScaleEvent
+from events import PrintTotalSimTimeEvent, SetSimulationTimeScaleEvent
 
 
 class RocketTakeoffPhase(RocketPhase):
@@ -12,13 +14,21 @@ class RocketTakeoffPhase(RocketPhase):
         self.target_height = target_height
 
     def make_decision(self, rocket: PhaseControlledRocket, delta_time: float):
-        if Orbit.calculate_orbit(rocket.planet, rocket).apogee_height < self.target_height:
+        if rocket.orbit.apogee_height < self.target_height:
             thrust_direction = rocket.position_vector.normalize()
             thrust_vector = thrust_direction * rocket.weight * rocket.target_acceleration - rocket.gravity_to_planet
             rocket.fire_engine(thrust_vector, delta_time)
         else:
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time: float):
+        _, _, _, apogees = ensemble.orbits(rows)
+        climbing = apogees - ensemble.planet_radiuses[ensemble.planet_index[rows]] < self.target_height
+        ensemble.end_phase(rows[~climbing])
+        rows = rows[climbing]
+        thrust = ensemble.radial_directions(rows) * (ensemble.weights[rows] * ensemble.target_accelerations[rows])[:, np.newaxis]
+        ensemble.fire_engine(rows, thrust - ensemble.gravity_to_planet(rows), delta_time)
+
 
 class RocketPrintHeightPhase(RocketPhase):
     def __init__(self):
@@ -55,6 +65,24 @@ class RocketRoundOrbitalManeuverPhase(RocketPhase):
         if delta_v_required <= delta_v_actual:
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        planets = ensemble.planet_index[rows]
+        target_speeds = np.sqrt(Physics.G * ensemble.planet_weights[planets] / (ensemble.planet_radiuses[planets] + self.target_height))
+        delta_v_required = target_speeds - np.linalg.norm(ensemble.relative_speeds(rows), axis=1)
+        delta_v_actual = np.minimum(delta_v_required, ensemble.target_accelerations[rows] * delta_time)
+
+        radial = ensemble.radial_directions(rows)
+        weights = ensemble.weights[rows]
+        thrust = np.column_stack((radial[:, 1], -radial[:, 0])) * (weights * delta_v_actual / delta_time)[:, np.newaxis]
+
+        low = ensemble.heights(rows) < self.target_height
+        gravity = -ensemble.gravity_to_planet(rows[low])
+        remaining = weights[low] - np.linalg.norm(thrust[low] + gravity, axis=1) * delta_time / ensemble.fuel_speeds[rows[low]]
+        thrust[low] += gravity * (remaining / weights[low])[:, np.newaxis]
+
+        ensemble.fire_engine(rows, thrust, delta_time)
+        ensemble.end_phase(rows[delta_v_required <= delta_v_actual])
+
 
 class RocketOrbitalManeuverPhase(RocketPhase):
     def __init__(self, target_orbit: Orbit):
@@ -78,6 +106,23 @@ class RocketOrbitalManeuverPhase(RocketPhase):
         if delta_v_required <= delta_v_actual:
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        target_perigee = self.target_orbit.perigee_distance
+        target_apogee = self.target_orbit.semi_major_axis * 2 - target_perigee
+
+        planet_weights = ensemble.planet_weights[ensemble.planet_index[rows]]
+        target_speeds = np.sqrt(2 * Physics.G * planet_weights * target_apogee / (target_perigee * (target_perigee + target_apogee)))
+
+        relative_speeds = ensemble.relative_speeds(rows)
+        speeds = np.linalg.norm(relative_speeds, axis=1)
+        delta_v_required = target_speeds - speeds
+        delta_v_actual = np.minimum(delta_v_required, ensemble.target_accelerations[rows] * delta_time)
+
+        thrust = relative_speeds * (ensemble.weights[rows] * delta_v_actual / delta_time / speeds)[:, np.newaxis]
+
+        ensemble.fire_engine(rows, thrust, delta_time)
+        ensemble.end_phase(rows[delta_v_required <= delta_v_actual])
+
 
 class RocketLandPhase(RocketPhase):
     def make_decision(self, rocket: PhaseControlledRocket, delta_time):
@@ -97,40 +142,67 @@ class RocketLandPhase(RocketPhase):
 
         rocket.fire_engine(thrust_vector, delta_time)
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        radial = ensemble.radial_directions(rows)
+        takeoff_speeds = radial * np.einsum("ij,ij->i", radial, ensemble.relative_speeds(rows))[:, np.newaxis]
+        deceleration = np.einsum("ij,ij->i", takeoff_speeds, takeoff_speeds) / (2 * ensemble.heights(rows))
+
+        weights = ensemble.weights[rows]
+        gravity = ensemble.gravity_to_planet(rows)
+        thrust = radial * (weights * deceleration + np.linalg.norm(gravity, axis=1))[:, np.newaxis]
+
+        accelerations = (gravity + thrust) / weights[:, np.newaxis]
+        positions = ensemble.positions[rows]
+        new_positions = positions + takeoff_speeds * delta_time + accelerations * delta_time ** 2 / 2
+        planet_positions = ensemble.planet_positions[ensemble.planet_index[rows]]
+        rising = np.linalg.norm(new_positions - planet_positions, axis=1) > np.linalg.norm(positions - planet_positions, axis=1)
+
+        ensemble.end_phase(rows[rising])
+        ensemble.fire_engine(rows, thrust, delta_time)
+
 
 class RocketOrbitCorrectPhase(RocketPhase):
+    stateful = True
+
     def __init__(self, orbit: Orbit):
         self.orbit = orbit
-
-    def calculate_next_orbit(self, engine_force_vector: Vector, rocket, delta_time: float):
-        new_force = rocket.gravity_to_planet + engine_force_vector
+        # the coefficient of the last step, where the search of the next one starts
+        self.coefficient = 1
+
+    @staticmethod
+    def calculate_next_orbit_width(engine_force_vector: Vector, rocket, delta_time: float):
+        # apogee minus perigee distance (2ae) of the orbit after one step with the engine force,
+        # None for an open orbit; Orbit.calculate_orbit in plain floats
+        gravity = rocket.gravity_to_planet
+        position, speed = rocket.position, rocket.speed
+        planet_position, planet_speed = rocket.planet.position, rocket.planet.speed
         new_weight = rocket.weight - engine_force_vector.magnitude * delta_time / rocket.fuel_speed
-        new_acceleration = new_force / new_weight
-        new_position = rocket.position + rocket.speed * delta_time + new_acceleration * delta_time ** 2 / 2
-        new_speed = rocket.speed + new_acceleration * delta_time
-        try:
-            return Orbit.calculate_orbit(rocket.planet, Entity(new_weight, new_position, new_speed))
-        except ValueError:
+        acceleration_x = (gravity.x + engine_force_vector.x) / new_weight
+        acceleration_y = (gravity.y + engine_force_vector.y) / new_weight
+        x = position.x + speed.x * delta_time + acceleration_x * delta_time ** 2 / 2 - planet_position.x
+        y = position.y + speed.y * delta_time + acceleration_y * delta_time ** 2 / 2 - planet_position.y
+        speed_x = speed.x + acceleration_x * delta_time - planet_speed.x
+        speed_y = speed.y + acceleration_y * delta_time - planet_speed.y
+
+        mu = Physics.G * rocket.planet.weight
+        energy = (speed_x ** 2 + speed_y ** 2) / 2 - mu / math.hypot(x, y)
+        if energy >= 0:
             return None
+        angular_momentum = x * speed_y - y * speed_x
+        eccentricity = math.sqrt(max(1 + 2 * energy * angular_momentum ** 2 / mu ** 2, 0))
+        return -mu / energy * eccentricity
 
     def calculate_current_correction_maneuver_coefficient(self, rocket, delta_time: float, current_vector: Vector):
-        current_orbit = Orbit.calculate_orbit(rocket.planet, rocket)
+        # the weakest burn after which the orbit is no wider than now, the full one while every burn widens it
+        current_orbit = rocket.orbit
         current_distance = current_orbit.apogee_distance - current_orbit.perigee_distance
-        left = 0
-        right = 1
-        coefficient = 0.5
-        for i in range(11):
-            new_orbit = self.calculate_next_orbit(current_vector * coefficient, rocket, delta_time)
-            if new_orbit is None:
-                right = coefficient
-                continue
-            if new_orbit.apogee_distance - new_orbit.perigee_distance <= current_distance:
-                right = coefficient
-            else:
-                left = coefficient
-            coefficient = (left + right) / 2
-
-        return coefficient
+
+        def widening(coefficient):
+            width = self.calculate_next_orbit_width(current_vector * coefficient, rocket, delta_time)
+            return None if width is None else width - current_distance
+
+        self.coefficient = self.solve_coefficient(widening, self.coefficient)
+        return self.coefficient
 
     def make_decision(self, rocket: PhaseControlledRocket, delta_time):
         correction_vector = -rocket.position_vector.normalize() * rocket.weight * rocket.target_acceleration
@@ -139,34 +211,113 @@ class RocketOrbitCorrectPhase(RocketPhase):
         if abs(coefficient) < 0.001:
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        weights = ensemble.weights[rows]
+        positions = ensemble.positions[rows]
+        speeds = ensemble.speeds[rows]
+        correction = -ensemble.radial_directions(rows) * (weights * ensemble.target_accelerations[rows])[:, np.newaxis]
+        gravity = ensemble.gravity_to_planet(rows)
+        _, _, perigees, apogees = ensemble.orbits(rows)
+        current_distances = apogees - perigees
+
+        def widening(indexes, coefficients):
+            engine_forces = correction[indexes] * coefficients[:, np.newaxis]
+            new_weights = weights[indexes] - np.linalg.norm(engine_forces, axis=1) * delta_time / ensemble.fuel_speeds[rows[indexes]]
+            new_accelerations = (gravity[indexes] + engine_forces) / new_weights[:, np.newaxis]
+            new_positions = positions[indexes] + speeds[indexes] * delta_time + new_accelerations * delta_time ** 2 / 2
+            new_speeds = speeds[indexes] + new_accelerations * delta_time
+            energy, _, new_perigees, new_apogees = ensemble.orbits(rows[indexes], positions=new_positions, speeds=new_speeds)
+            return np.where(energy < 0, new_apogees - new_perigees - current_distances[indexes], np.nan)
+
+        # the search starts from the coefficient of each rocket's last step, as in make_decision
+        coefficients = ensemble.solve_coefficients(widening, ensemble.phase_coefficient[rows])
+        ensemble.phase_coefficient[rows] = coefficients
+        ensemble.fire_engine(rows, correction * coefficients[:, np.newaxis], delta_time)
+        ensemble.end_phase(rows[np.abs(coefficients) < 0.001])
+
 
 class RocketWaitGreaterHeightPhase(RocketPhase):
+    coasting = True
+
     def __init__(self, target_height: float):
         self.target_height = target_height
 
+    def reached(self, rocket: PhaseControlledRocket):
+        return rocket.height >= self.target_height
+
     def make_decision(self, rocket: PhaseControlledRocket, delta_time):
-        if rocket.height >= self.target_height:
+        if self.reached(rocket):
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        ensemble.end_phase(rows[ensemble.heights(rows) >= self.target_height])
+
+    def max_step(self, rocket: PhaseControlledRocket):
+        # the step that ends the phase has to be short, the next phase starts only after it
+        if self.reached(rocket):
+            return 0
+        if config.COAST:
+            return rocket.conic.time_to_radius(rocket.planet.radius + self.target_height)
+        return self.time_to_height(rocket, self.target_height)
+
 
 class RocketWaitLessHeightPhase(RocketPhase):
+    coasting = True
+
     def __init__(self, target_height: float):
         self.target_height = target_height
 
+    def reached(self, rocket: PhaseControlledRocket):
+        return rocket.height <= self.target_height
+
     def make_decision(self, rocket: PhaseControlledRocket, delta_time):
-        if rocket.height <= self.target_height:
+        if self.reached(rocket):
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        ensemble.end_phase(rows[ensemble.heights(rows) <= self.target_height])
+
+    def max_step(self, rocket: PhaseControlledRocket):
+        if self.reached(rocket):
+            return 0
+        if config.COAST:
+            return rocket.conic.time_to_radius(rocket.planet.radius + self.target_height)
+        return self.time_to_height(rocket, self.target_height)
+
 
 class RocketWaitPolarAnglePhase(RocketPhase):
+    coasting = True
+
     def __init__(self, target_angle, epsilon):
         self.target_angle = target_angle
         self.epsilon = epsilon
 
+    def reached(self, rocket: PhaseControlledRocket):
+        return abs(rocket.polar_angle - self.target_angle) < self.epsilon
+
     def make_decision(self, rocket: PhaseControlledRocket, delta_time):
-        if abs(rocket.polar_angle - self.target_angle) < self.epsilon:
+        if self.reached(rocket):
             rocket.end_phase()
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        position_vectors = ensemble.position_vectors(rows)
+        polar_angles = np.arctan2(position_vectors[:, 1], position_vectors[:, 0]) % (2 * math.pi)
+        ensemble.end_phase(rows[np.abs(polar_angles - self.target_angle) < self.epsilon])
+
+    def max_step(self, rocket: PhaseControlledRocket):
+        if self.reached(rocket):
+            return 0
+        angle_speed = rocket.position_vector.cross_product(rocket.relative_speed) / rocket.absolute_height ** 2
+        if angle_speed == 0:
+            return None
+        if config.COAST:
+            # a sampled run ends the phase as soon as the rocket enters the window, not in its middle
+            return rocket.conic.time_to_polar_angle(self.target_angle - math.copysign(self.epsilon * (1 - 1E-9), angle_speed))
+
+        # land on the target angle, but never step over the whole window
+        angle_distance = (self.target_angle - rocket.polar_angle) * (1 if angle_speed > 0 else -1) % (2 * math.pi)
+        return max(angle_distance, self.epsilon) / abs(angle_speed)
+
 
 class RocketPrelandSlowingPhase(RocketPhase):
     def __init__(self, min_eccentricity, perigee_distance_to_brake):
@@ -174,7 +325,7 @@ class RocketPrelandSlowingPhase(RocketPhase):
         self.perigee_distance_to_brake = perigee_distance_to_brake
 
     def make_decision(self, rocket: PhaseControlledRocket, delta_time):
-        orbit = Orbit.calculate_orbit(rocket.planet, rocket)
+        orbit = rocket.orbit
 
         if orbit.eccentricity >= self.min_eccentricity:
             rocket.end_phase()
@@ -189,6 +340,23 @@ class RocketPrelandSlowingPhase(RocketPhase):
             thrust_vector = thrust_direction * rocket.weight * delta_v_actual / delta_time
             rocket.fire_engine(thrust_vector, delta_time)
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        _, eccentricities, perigees, _ = ensemble.orbits(rows)
+        ending = eccentricities >= self.min_eccentricity
+        ensemble.end_phase(rows[ending])
+
+        rows, perigee_heights = rows[~ending], perigees[~ending] - ensemble.planet_radiuses[ensemble.planet_index[rows[~ending]]]
+        rows = rows[np.abs(ensemble.heights(rows) - perigee_heights) <= self.perigee_distance_to_brake]
+        ensemble.add_speed(rows, -ensemble.relative_speeds(rows), delta_time)
+
+    def max_step(self, rocket: PhaseControlledRocket):
+        orbit = rocket.orbit
+        if orbit.eccentricity >= self.min_eccentricity:
+            return 0
+        if abs(rocket.height - orbit.perigee_height) <= self.perigee_distance_to_brake:
+            return config.ADAPTIVE_THRUST_STEP
+        return self.time_to_height(rocket, orbit.perigee_height + self.perigee_distance_to_brake)
+
 
 class RocketWaitForPlanetAntiphasePhase(RocketPhase):
     def __init__(self,planet: Planet,  epsilon: float):
@@ -238,6 +406,8 @@ class RocketSolarManeuverPhase(RocketPhase):
 
 
 class RocketTestOrbitManeuverPhase(RocketPhase):
+    stateful = True
+
     def __init__(self, source_planet: Planet, star: Planet, target_planet: Planet, crossing_distance: float = 10_000):
         self.source_planet = source_planet
         self.target_planet = target_planet
@@ -263,6 +433,61 @@ class RocketTestOrbitManeuverPhase(RocketPhase):
 
         rocket.fire_engine(thrust_vector, delta_time)
 
+    def make_batch_decision(self, ensemble, rows, delta_time):
+        star, target, source = ensemble.planet_of(self.star), ensemble.planet_of(self.target_planet), ensemble.planet_of(self.source_planet)
+        _, _, _, apogees = ensemble.orbits(rows, np.full(len(rows), star))
+        target_distance = np.linalg.norm(ensemble.planet_positions[target] - ensemble.planet_positions[star])
+        star_vectors = ensemble.positions[rows] - ensemble.planet_positions[star]
+        star_distances = np.linalg.norm(star_vectors, axis=1)
+
+        # the time in the phase is kept per rocket by the ensemble instead of self.total_time
+        times = ensemble.phase_time[rows] + delta_time
+        ensemble.phase_time[rows] = times
+        crossed = self.crossing_distance < star_distances - target_distance
+        ensemble.planet_index[rows[crossed]] = target
+        ensemble.end_phase(rows[crossed])
+
+        cruising = times < 0.3 * 10 ** 7
+        rows, star_vectors, star_distances, apogees = rows[cruising], star_vectors[cruising], star_distances[cruising], apogees[cruising]
+        source_vectors = ensemble.positions[rows] - ensemble.planet_positions[source]
+        source_distances = np.linalg.norm(source_vectors, axis=1)
+        weights = ensemble.weights[rows]
+        thrust = source_vectors * (Physics.G * ensemble.planet_weights[source] * weights / source_distances ** 3 * 0.095)[:, np.newaxis]
+
+        low = apogees <= target_distance
+        thrust_directions = np.column_stack((star_vectors[:, 1], -star_vectors[:, 0])) / star_distances[:, np.newaxis]
+        thrust[low] += thrust_directions[low] * (weights[low] * ensemble.target_accelerations[rows[low]] * 0.5)[:, np.newaxis]
+
+        ensemble.fire_engine(rows, thrust, delta_time)
+
+    def max_step(self, rocket: PhaseControlledRocket):
+        # a low thrust cruise, the orbit around the star changes slowly
+        if self.total_time < 0.3 * 10 ** 7:
+            return config.ADAPTIVE_CRUISE_STEP
+
+        # unpowered afterwards, the steps shrink towards the crossing of the target orbit
+        position = Vector(self.star.position, rocket.position)
+        radial_speed = Vector.dot_product(position.normalize(), rocket.speed - self.star.speed)
+        distance = Physics.calculate_distance(self.target_planet.position, self.star.position) + self.crossing_distance - position.magnitude
+        if radial_speed <= 0:
+            return None
+        return max(distance / radial_speed, config.ADAPTIVE_CRUISE_STEP)
+
+    def batch_max_step(self, ensemble, rows):
+        # max_step with the time in the phase of each rocket, the cruise of any of them limits the step
+        if np.any(ensemble.phase_time[rows] < 0.3 * 10 ** 7):
+            return config.ADAPTIVE_CRUISE_STEP
+
+        star, target = ensemble.planet_of(self.star), ensemble.planet_of(self.target_planet)
+        star_vectors = ensemble.positions[rows] - ensemble.planet_positions[star]
+        star_distances = np.linalg.norm(star_vectors, axis=1)
+        radial_speeds = np.einsum("ij,ij->i", star_vectors, ensemble.speeds[rows] - ensemble.planet_speeds[star]) / star_distances
+        distances = np.linalg.norm(ensemble.planet_positions[target] - ensemble.planet_positions[star]) + self.crossing_distance - star_distances
+        outward = radial_speeds > 0
+        if not np.any(outward):
+            return None
+        return max(float(np.min(distances[outward] / radial_speeds[outward])), config.ADAPTIVE_CRUISE_STEP)
+
 
 class RocketOrbitalBreakPhase(RocketPhase):
     def __init__(self):
@@ -270,18 +495,34 @@ class RocketOrbitalBreakPhase(RocketPhase):
 
     def make_decision(self, rocket: PhaseControlledRocket, delta_time: float):
         try:
-            orbit = Orbit.calculate_orbit(rocket.planet, rocket)
+            orbit = rocket.orbit
             rocket.end_phase()
         except ValueError:
             thrust_direction = -rocket.relative_speed.normalize()
             thrust_vector = thrust_direction * rocket.weight * rocket.target_acceleration
             rocket.fire_engine(thrust_vector, delta_time)
 
+    def make_batch_decision(self, ensemble, rows, delta_time: float):
+        energy, _, _, _ = ensemble.orbits(rows)
+        open_orbit = energy > 0
+        ensemble.end_phase(rows[~open_orbit])
+
+        rows = rows[open_orbit]
+        relative_speeds = ensemble.relative_speeds(rows)
+        thrust = -relative_speeds * (ensemble.weights[rows] * ensemble.target_accelerations[rows] / np.linalg.norm(relative_speeds, axis=1))[:, np.newaxis]
+        ensemble.fire_engine(rows, thrust, delta_time)
+
 
 class SetTimeScalePhase(RocketPhase):
     def __init__(self, time_scale: float):
         self.time_scale = time_scale
 
     def make_decision(self, rocket: PhaseControlledRocket, delta_time: float):
-        EventRegistrer.register_event(SetSimulationTimeScaleEvent(self.time_scale))
+        rocket.event_bus.register_event(SetSimulationTimeScaleEvent(self.time_scale))
         rocket.end_phase()
+
+    def make_batch_decision(self, ensemble, rows, delta_time: float):
+        # the leading rocket of an ensemble sets the time scale, the ones behind it follow silently
+        if not np.any(ensemble.phase_index[ensemble.active] > ensemble.phase_index[rows[0]]):
+            ensemble.event_bus.register_event(SetSimulationTimeScaleEvent(self.time_scale))
+        ensemble.end_phase(rows)
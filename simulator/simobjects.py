@@ -1,28 +1,43 @@
+import math
+
+import numpy as np
 import pygame
 from pygame.sprite import Sprite
 
 import config
 from entities import Planet, BaseRocket
-from physics import Entity, Vector, Point
-from events import EventRegistrer, EventSubscriber, FollowEventCapture, RocketEntityOutOfFuelEvent, RocketSpritetOutOfFuelEvent
+from physics import Entity, Vector, Point, Physics
+from ensemble import RocketEnsemble
+from events import EventBus, EventSubscriber, FollowEventCapture, RocketEntityOutOfFuelEvent, RocketSpritetOutOfFuelEvent
 
 
 class SimObject(Sprite):
-    def __init__(self, entity: Entity, color=pygame.Color("White"), name: str = ""):
+    def __init__(self, entity: Entity, color=pygame.Color("White"), name: str = "", event_bus: EventBus = None):
         super().__init__()
         self.entity = entity
         self.name = name
         self.color = color
+        self.event_bus = event_bus if event_bus is not None else EventBus()
+        # set from the latest snapshot when physics runs on its own thread
+        self.snapshot_position = None
+
+    @property
+    def position(self):
+        return self.snapshot_position if self.snapshot_position is not None else self.entity.position
+
+    def snapshot(self):
+        return Point(tuple(self.entity.position.coordinates))
 
     @property
     def center_on_screen(self):
-        return (self.entity.position.x * self.scale + self.offset.x,
-                self.entity.position.y * self.scale + self.offset.y)
+        position = self.position
+        return (position.x * self.scale + self.offset.x,
+                position.y * self.scale + self.offset.y)
 
     def process_mouseclick(self, mousepos: Point):
         x, y = self.center_on_screen
         if max([abs(mousepos.x - x), abs(mousepos.y - y)]) < config.CLICK_RADIUS:
-            EventRegistrer.register_event(FollowEventCapture(self, Vector(self.center_on_screen)))
+            self.event_bus.register_event(FollowEventCapture(self, Vector(self.center_on_screen)))
 
     def update_screen_settings(self, scale: float, offset: Vector):
         self.scale = scale
@@ -37,40 +52,124 @@ class SimObject(Sprite):
     def draw_text_marker(self, screen, font):
         self._draw_text_marker(screen, font, 0)
 
+    def on_screen(self, width: int, height: int, radius: float = 0):
+        # whether a circle of radius pixels around the sprite touches the viewport
+        x, y = self.center_on_screen
+        margin = radius + config.ROCKET_MARKER_SIZE
+        return -margin < x < width + margin and -margin < y < height + margin
+
     def draw(self, screen, font):
         raise NotImplementedError()
 
 
+def clip_polygon(points, width: int, height: int):
+    # Sutherland-Hodgman against the viewport, one edge of it at a time
+    for inside, cross in (
+        (lambda p: p[0] >= 0, lambda a, b: (0, a[1] + (b[1] - a[1]) * (0 - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[0] <= width, lambda a, b: (width, a[1] + (b[1] - a[1]) * (width - a[0]) / (b[0] - a[0]))),
+        (lambda p: p[1] >= 0, lambda a, b: (a[0] + (b[0] - a[0]) * (0 - a[1]) / (b[1] - a[1]), 0)),
+        (lambda p: p[1] <= height, lambda a, b: (a[0] + (b[0] - a[0]) * (height - a[1]) / (b[1] - a[1]), height)),
+    ):
+        clipped = []
+        for index, point in enumerate(points):
+            previous = points[index - 1]
+            if inside(point):
+                if not inside(previous):
+                    clipped.append(cross(previous, point))
+                clipped.append(point)
+            elif inside(previous):
+                clipped.append(cross(previous, point))
+        points = clipped
+        if not points:
+            break
+    return points
+
+
 class SimPlanetaryObject(SimObject):
-    def __init__(self, entity: Planet, color=pygame.Color("White"), name: str = "PLANET"):
-        super().__init__(entity, color=color, name=name)
+    def __init__(self, entity: Planet, color=pygame.Color("White"), name: str = "PLANET", event_bus: EventBus = None):
+        super().__init__(entity, color=color, name=name, event_bus=event_bus)
 
     def process_mouseclick(self, mousepos: Point):
         x, y = self.center_on_screen
         if max([abs(mousepos.x - x), abs(mousepos.y - y)]) < max([config.CLICK_RADIUS, self.entity.radius * self.scale]):
-            EventRegistrer.register_event(FollowEventCapture(self, Vector(self.center_on_screen)))
+            self.event_bus.register_event(FollowEventCapture(self, Vector(self.center_on_screen)))
+
+    def on_screen(self, width: int, height: int, radius: float = 0):
+        return super().on_screen(width, height, max(radius, self.entity.radius * self.scale))
 
     def draw(self, screen, font):
         if not isinstance(self.entity, Planet):
             raise ValueError("Entity is not a Planet")
-        pygame.draw.circle(
-            screen, self.color, self.center_on_screen,
-            max(int(self.entity.radius * self.scale), config.MIN_PLANETARY_SIZE)
-        )
+        x, y = self.center_on_screen
+        radius = self.entity.radius * self.scale
+        if radius <= config.MIN_PLANETARY_SIZE:
+            # less than a pixel across, a marker is all that shows
+            size = config.MIN_PLANETARY_SIZE
+            screen.fill(self.color, (int(x) - size, int(y) - size, 2 * size, 2 * size))
+        elif radius <= config.MAX_CIRCLE_RADIUS:
+            pygame.draw.circle(screen, self.color, (x, y), int(radius))
+        else:
+            self.draw_horizon(screen, x, y, radius)
+
+    def draw_horizon(self, screen, x: float, y: float, radius: float):
+        # Zoomed in on the surface the circle is far larger than the window: only its part inside the
+        # window is drawn, the sector of the angles under which the window is seen from the center,
+        # clipped to the window
+        width, height = screen.get_size()
+        corners = [(0, 0), (width, 0), (width, height), (0, height)]
+        if all((cx - x) ** 2 + (cy - y) ** 2 <= radius ** 2 for cx, cy in corners):
+            screen.fill(self.color)
+            return
+        if 0 <= x <= width and 0 <= y <= height:
+            span_start, span_end = -math.pi, math.pi
+        else:
+            direction = math.atan2(height / 2 - y, width / 2 - x)
+            angles = [(math.atan2(cy - y, cx - x) - direction + math.pi) % (2 * math.pi) - math.pi for cx, cy in corners]
+            span_start, span_end = direction + min(angles), direction + max(angles)
+        segments = min(max(int(radius * (span_end - span_start) / config.HORIZON_SEGMENT_LENGTH), 8), 512)
+        points = [(x, y)] + [(x + radius * math.cos(angle), y + radius * math.sin(angle))
+                             for angle in np.linspace(span_start, span_end, segments + 1).tolist()]
+        points = clip_polygon(points, width, height)
+        if len(points) >= 3:
+            pygame.draw.polygon(screen, self.color, points)
 
     def draw_text_marker(self, screen, font):
         self._draw_text_marker(screen, font, self.entity.radius * self.scale)
 
 
+# What the predicted orbit of a rocket is drawn from, copied out of the physics state: the planet
+# position it is anchored at, the state relative to the planet and the version of the rocket state
+class OrbitState:
+    def __init__(self, rocket: BaseRocket):
+        planet = rocket.planet
+        planet_position = planet.position
+        self.planet = planet
+        self.planet_position = Point((planet_position.x, planet_position.y))
+        self.position = Vector(planet_position, rocket.position)
+        self.speed = rocket.speed - planet.speed
+        self.mu = Physics.G * planet.weight
+        self.weight = rocket.weight
+        self.version = rocket.state_version
+
+
 class SimRocketObject(SimObject, EventSubscriber):
-    def __init__(self, entity: BaseRocket, color=pygame.Color("red"), name: str = "ROCKET"):
-        super().__init__(entity, color=color, name=name)
+    def __init__(self, entity: BaseRocket, color=pygame.Color("red"), name: str = "ROCKET", event_bus: EventBus = None):
+        super().__init__(entity, color=color, name=name, event_bus=event_bus)
         self.subscribe(RocketEntityOutOfFuelEvent)
         self.no_fuel_notifyed = False
+        # set from the latest snapshot when physics runs on its own thread
+        self.snapshot_orbit = None
+
+    def orbit_snapshot(self):
+        return OrbitState(self.entity)
+
+    @property
+    def orbit_state(self):
+        return self.snapshot_orbit if self.snapshot_orbit is not None else self.orbit_snapshot()
 
     def handle_event(self, event):
         if not self.no_fuel_notifyed and event.rocket == self.entity:
-            EventRegistrer.register_event(RocketSpritetOutOfFuelEvent(self))
+            self.event_bus.register_event(RocketSpritetOutOfFuelEvent(self))
             self.no_fuel_notifyed = True
 
     def draw(self, screen, font):
@@ -80,3 +179,36 @@ class SimRocketObject(SimObject, EventSubscriber):
             screen, self.color, self.center_on_screen,
             config.ROCKET_MARKER_SIZE
         )
+
+
+class SimEnsembleObject(SimObject):
+    def __init__(self, ensemble: RocketEnsemble, color=pygame.Color("orange"), name: str = "ENSEMBLE", event_bus: EventBus = None):
+        super().__init__(None, color=color, name=name, event_bus=event_bus)
+        self.ensemble = ensemble
+
+    @property
+    def position(self):
+        # positions of the rockets still flying, an array instead of a Point
+        return self.snapshot_position if self.snapshot_position is not None else self.snapshot()
+
+    def snapshot(self):
+        return self.ensemble.positions[self.ensemble.active].copy()
+
+    def on_screen(self, width: int, height: int, radius: float = 0):
+        # the rockets are culled one by one when drawn
+        return True
+
+    @property
+    def center_on_screen(self):
+        positions = self.position
+        center = positions.mean(axis=0) if len(positions) != 0 else self.ensemble.positions.mean(axis=0)
+        return (float(center[0]) * self.scale + self.offset.x,
+                float(center[1]) * self.scale + self.offset.y)
+
+    def draw(self, screen, font):
+        positions = self.position * self.scale + np.array(self.offset.coordinates)
+        width, height = screen.get_size()
+        visible = (positions[:, 0] >= 0) & (positions[:, 0] < width) & (positions[:, 1] >= 0) & (positions[:, 1] < height)
+        size = config.ROCKET_MARKER_SIZE
+        for x, y in positions[visible].astype(int).tolist():
+            screen.fill(self.color, (x - size // 2, y - size // 2, size, size))
@@ -1,18 +1,28 @@
 import sys
+import math
 import pygame
+import threading
 import time
 
 import config
 from groups import RenderGroup, WidgetGroup, ClickableGroup
 from physics import Vector, Point
 from config import MOUSE_SCALE_DELTA, OFFSET_DELTA, SCALE_DELTA
-from events import EventRegistrer, EventSubscriber, BuildPlotsEvent, PauseEvent, TimeScaleUpdateEvent, FollowEvent, FollowEventCapture, FollowEventUncapture, PrintTotalSimTimeEvent, SetSimulationTimeScaleEvent
+from events import EventBus, EventSubscriber, BuildPlotsEvent, PauseEvent, TimeScaleUpdateEvent, FollowEvent, FollowEventCapture, FollowEventUncapture, PrintTotalSimTimeEvent, SetSimulationTimeScaleEvent
+from events import CollisionEvent, SaveCheckpointEvent, CheckpointSavedEvent, SimulationRateEvent, FrameEvent, EphemerisEndEvent
+from checkpoint import save_checkpoint
+from entities import PhaseControlledRocket
+from simobjects import SimRocketObject, SimEnsembleObject
 from logger import ConsoleLogger
+from replay import ReplayedEvent
+from trails import TrailLayer
+from worker import PhysicsWorker
 
 
 class Simulation(EventSubscriber):
     def __init__(self, dimensions=(1920, 1080), offset = (960, 540), pixels_per_meter: float = 1E-5,
-                 time_scale: float = 10, amount_of_iterations: float = 40, groups=(), widgets=(), clickable=()):
+                 time_scale: float = 10, amount_of_iterations: float = 40, groups=(), widgets=(), clickable=(), threaded: bool = False,
+                 event_bus: EventBus = None, recorder=None, replay=None, physics_budget: float = None):
         self.width, self.height = dimensions
         self.main_window = None
         self.paused = False
@@ -21,22 +31,198 @@ class Simulation(EventSubscriber):
         self.time_scale = time_scale
         self.amount_of_iterations = amount_of_iterations
         self.total_sim_time = 0
+        self.steps = 0
+        self.collisions = []
         self.offset = Vector(offset)
         self.mouse_on_time = 0
 
         self.objects = {sprite for group in groups for sprite in group}
         self.groups = groups
-        self.render_group = RenderGroup(*self.objects)
-        self.widget_group = WidgetGroup(widgets)
+        # planets driven by an ephemeris are only known over its span, the simulation stops at its end
+        end_times = [group.end_time for group in groups if group.end_time is not None]
+        self.end_time = min(end_times) if end_times else None
+        self.rockets = sorted((sprite for sprite in self.objects if isinstance(sprite, SimRocketObject)), key=lambda sprite: sprite.name)
+        self.ensembles = sorted((sprite for sprite in self.objects if isinstance(sprite, SimEnsembleObject)), key=lambda sprite: sprite.name)
+        # created by run(), headless runs never load fonts
+        self.render_group = None
+        self.widget_group = None
+        self.trail_layer = None
+        self.widgets = widgets
         self.clickable_group = ClickableGroup(clickable)
 
+        self.threaded = threaded
+        self.worker = None
+
+        # with a budget a frame steps for physics_budget seconds of wall time instead of
+        # amount_of_iterations steps, the window's own drawing time is taken out of it
+        self.physics_budget = physics_budget
+        self.step_cost = None
+        self.render_cost = 0
+
+        # a recorder writes the trajectories as the simulation steps, a replay is played back instead
+        # of stepping: no physics runs and the sprites are drawn at the recorded positions
+        self.recorder = recorder
+        self.replay = replay
+        if replay is not None:
+            self.total_sim_time = replay.start
+
         self.followed_sprite = None
         self.followed_position = Vector((0, 0))
 
+        # the bus its sprites, groups and widgets were built with
+        self.event_bus = event_bus if event_bus is not None else EventBus()
+
         if config.VERBOSE:
-            self.console_logger = ConsoleLogger()
+            self.console_logger = ConsoleLogger(self.event_bus)
 
-        self.subscribe(PauseEvent, TimeScaleUpdateEvent, FollowEvent, PrintTotalSimTimeEvent, SetSimulationTimeScaleEvent)
+        self.subscribe(PauseEvent, TimeScaleUpdateEvent, FollowEvent, PrintTotalSimTimeEvent, SetSimulationTimeScaleEvent, CollisionEvent, SaveCheckpointEvent)
+
+    @property
+    def variable_step(self):
+        return any(group.variable_step for group in self.groups)
+
+    def step(self, delta_time: float):
+        if self.end_time is not None:
+            delta_time = min(delta_time, self.end_time - self.total_sim_time)
+            if delta_time <= 0:
+                return
+        for group in self.groups:
+            group.update(delta_time)
+
+        self.total_sim_time += delta_time
+        self.steps += 1
+        if self.recorder is not None:
+            self.recorder.record(self)
+
+    def frame(self, delta_time: float):
+        # simulated time of one window frame
+        if self.physics_budget is not None:
+            self.budgeted_frame(delta_time)
+        elif self.variable_step:
+            self.advance(delta_time * self.time_scale * self.amount_of_iterations)
+        else:
+            for _ in range(self.amount_of_iterations):
+                self.step(delta_time * self.time_scale)
+        if self.end_time is not None and self.total_sim_time >= self.end_time and not self.paused:
+            self.event_bus.register_event(EphemerisEndEvent(self.end_time))
+            self.event_bus.register_event(PauseEvent(True))
+
+    def budgeted_frame(self, delta_time: float):
+        # As many steps as the measured cost of a step says fit in the budget, cut short at the
+        # deadline when they got slower; the cost is averaged so the count follows load smoothly
+        budget = max(min(self.physics_budget, delta_time - self.render_cost), 0)
+        start = time.perf_counter()
+        deadline = start + budget
+        steps = max(int(budget / self.step_cost), 1) if self.step_cost else 1
+        done = 0
+        while done < steps and (done == 0 or time.perf_counter() < deadline):
+            if self.variable_step:
+                # a step covers at most the simulated time of a fixed one, the groups may shorten it
+                self.step(self.next_step_size(delta_time * self.time_scale))
+            else:
+                self.step(delta_time * self.time_scale)
+            done += 1
+        cost = (time.perf_counter() - start) / done
+        self.step_cost = cost if self.step_cost is None else self.step_cost + (cost - self.step_cost) * config.BUDGET_SMOOTHING
+
+    def next_step_size(self, remaining: float):
+        limits = [group.max_step() for group in self.groups]
+        step = min([remaining] + [limit for limit in limits if limit is not None])
+        return min(max(step, config.ADAPTIVE_MIN_STEP), remaining)
+
+    def advance(self, duration: float):
+        # variable step mode: the groups agree on the step size (integrator error, phase events)
+        remaining = duration
+        while remaining > duration * 1E-12:
+            step = self.next_step_size(remaining)
+            self.step(step)
+            remaining -= step
+
+    def time_stop_reason(self, time_limit: float = None):
+        if time_limit is not None and self.total_sim_time >= time_limit:
+            return "time_limit"
+        if self.end_time is not None and self.total_sim_time >= self.end_time:
+            return "ephemeris_end"
+        return None
+
+    def stop_reason(self, time_limit: float = None):
+        if (reason := self.time_stop_reason(time_limit)) is not None:
+            return reason
+
+        # a rocket is done once it hit a planet (and was killed) or ran out of phases
+        if (all(not rocket.alive() or isinstance(rocket.entity, PhaseControlledRocket) and not rocket.entity.phase_stack for rocket in self.rockets)
+                and all(sprite.ensemble.finished for sprite in self.ensembles)):
+            return "collision" if self.collisions or any(sprite.ensemble.crashed for sprite in self.ensembles) else "phases_complete"
+        return None
+
+    def run_headless(self, time_limit: float = None, stop_reason=None):
+        # no window, fonts or widgets: physics runs as fast as it can until a stop condition,
+        # stop_reason(time_limit) when given instead of the simulation's own
+        delta_time = 1 / 60
+        start = time.perf_counter()
+        stop_reason = stop_reason if stop_reason is not None else self.stop_reason
+
+        while (reason := stop_reason(time_limit)) is None:
+            if self.variable_step:
+                # no frames to keep up with, the groups alone choose the step
+                self.step(self.next_step_size(time_limit - self.total_sim_time if time_limit is not None else math.inf))
+            else:
+                self.step(delta_time * self.time_scale)
+
+        return self.summary(reason, time.perf_counter() - start)
+
+    def summary(self, stop_reason: str, wall_time: float):
+        collisions = {event.rocket: event for event in self.collisions}
+        rockets = []
+        for rocket in self.rockets:
+            collision = collisions.get(rocket)
+            rockets.append({
+                "name": rocket.name,
+                "alive": rocket.alive(),
+                "phases_left": len(rocket.entity.phase_stack) if isinstance(rocket.entity, PhaseControlledRocket) else None,
+                "weight": rocket.entity.weight,
+                "height": rocket.entity.height,
+                "speed": rocket.entity.relative_speed.magnitude,
+                # reuse of orbit elements, heights and gravity within a step
+                "derived_state_hits_per_step": rocket.entity.derived_state.hits / max(self.steps, 1),
+                "derived_state_misses_per_step": rocket.entity.derived_state.misses / max(self.steps, 1),
+                "collision": None if collision is None else {
+                    "planet": collision.planet.name,
+                    "angle": collision.collision_angle,
+                    "speed": collision.finite_speed,
+                },
+            })
+
+        return {
+            "stop_reason": stop_reason,
+            "sim_time": self.total_sim_time,
+            "wall_time": wall_time,
+            "steps": self.steps,
+            "rockets": rockets,
+            "ensembles": [dict(name=sprite.name, **sprite.ensemble.summary()) for sprite in self.ensembles],
+        }
+
+    def seek(self, time: float):
+        # replay mode: shows the recording at time, sprites gone by then are not drawn
+        self.total_sim_time = min(max(time, self.replay.start), self.replay.end)
+        state = self.replay.state(self.total_sim_time)
+        for sprite in self.objects:
+            position = state.get(sprite.name)
+            if position is None:
+                self.render_group.remove(sprite)
+            else:
+                sprite.snapshot_position = position
+                self.render_group.add(sprite)
+
+    def replay_frame(self, delta_time: float):
+        # a frame of the recording passes as much simulated time as a frame of the simulation would,
+        # at the cost of a seek instead of amount_of_iterations steps
+        start = self.total_sim_time
+        self.seek(start + delta_time * self.time_scale * self.amount_of_iterations)
+        for text in self.replay.events_between(start, self.total_sim_time):
+            self.event_bus.register_event(ReplayedEvent(text))
+        if self.total_sim_time >= self.replay.end:
+            self.event_bus.register_event(PauseEvent(True))
 
     @property
     def display_center(self):
@@ -58,6 +244,10 @@ class Simulation(EventSubscriber):
             self.followed_position += addition
 
     def handle_event(self, event):
+        if isinstance(event, (PauseEvent, TimeScaleUpdateEvent, SetSimulationTimeScaleEvent, SaveCheckpointEvent)) and self.worker is not None and threading.current_thread() is not self.worker:
+            # the worker owns the physics state, it applies the command between two frames
+            self.worker.commands.put(event)
+            return
         if isinstance(event, PauseEvent):
             self.paused = event.is_paused
         if isinstance(event, TimeScaleUpdateEvent):
@@ -72,6 +262,12 @@ class Simulation(EventSubscriber):
             print("Total sim time:", self.total_sim_time)
         if isinstance(event, SetSimulationTimeScaleEvent):
             self.time_scale = event.time_scale
+        if isinstance(event, CollisionEvent):
+            self.collisions.append(event)
+            event.rocket.kill()
+        if isinstance(event, SaveCheckpointEvent):
+            save_checkpoint(self, event.path)
+            self.event_bus.register_event(CheckpointSavedEvent(event.path, self.total_sim_time))
 
 
     def handle_pygame_event(self, event):
@@ -100,17 +296,34 @@ class Simulation(EventSubscriber):
                 config.draw_markers = not config.draw_markers
             if event.key == pygame.K_h:
                 config.draw_widgets = not config.draw_widgets
+            if event.key == pygame.K_t:
+                config.draw_trails = not config.draw_trails
+            if event.key == pygame.K_o:
+                config.draw_orbits = not config.draw_orbits
             if event.key == pygame.K_ESCAPE:
-                EventRegistrer.register_event(FollowEventUncapture())
+                self.event_bus.register_event(FollowEventUncapture())
 
             if event.key == pygame.K_p:
-                EventRegistrer.register_event(BuildPlotsEvent())
+                self.event_bus.register_event(BuildPlotsEvent())
+            if event.key == pygame.K_k and self.replay is None:
+                self.event_bus.register_event(SaveCheckpointEvent(config.CHECKPOINT_PATH if config.CHECKPOINT_PATH is not None else "checkpoint.npz"))
             if event.key == pygame.K_SPACE:
-                EventRegistrer.register_event(PauseEvent(not self.paused))
+                self.event_bus.register_event(PauseEvent(not self.paused))
             if event.key == pygame.K_LEFTBRACKET and self.amount_of_iterations // config.AMOUNT_OF_ITERATIONS_DELTA >= 1:
-                EventRegistrer.register_event(TimeScaleUpdateEvent(self.time_scale, self.amount_of_iterations // config.AMOUNT_OF_ITERATIONS_DELTA))
+                self.event_bus.register_event(TimeScaleUpdateEvent(self.time_scale, self.amount_of_iterations // config.AMOUNT_OF_ITERATIONS_DELTA))
             if event.key == pygame.K_RIGHTBRACKET and self.amount_of_iterations * config.AMOUNT_OF_ITERATIONS_DELTA <= config.MAX_AMOUNT_OF_ITERATIONS:
-                EventRegistrer.register_event(TimeScaleUpdateEvent(self.time_scale, self.amount_of_iterations * config.AMOUNT_OF_ITERATIONS_DELTA))
+                self.event_bus.register_event(TimeScaleUpdateEvent(self.time_scale, self.amount_of_iterations * config.AMOUNT_OF_ITERATIONS_DELTA))
+
+            if self.replay is not None:
+                seek_step = (self.replay.end - self.replay.start) * config.REPLAY_SEEK_FRACTION
+                if event.key == pygame.K_COMMA:
+                    self.seek(self.total_sim_time - seek_step)
+                if event.key == pygame.K_PERIOD:
+                    self.seek(self.total_sim_time + seek_step)
+                if event.key == pygame.K_HOME:
+                    self.seek(self.replay.start)
+                if event.key == pygame.K_END:
+                    self.seek(self.replay.end)
 
         # window is resized
 
@@ -140,14 +353,35 @@ class Simulation(EventSubscriber):
         pygame.display.set_caption('Rocket Simulator')
         icon = pygame.image.load(config.ICON_PATH)
         pygame.display.set_icon(icon)
+        self.render_group = RenderGroup(*self.objects)
+        self.widget_group = WidgetGroup(self.widgets)
+        self.trail_layer = TrailLayer(self.objects)
         delta_time = 1 / 60
         clock = pygame.time.Clock()
+        total_sim_time = self.total_sim_time
+
+        if self.replay is not None:
+            self.seek(self.total_sim_time)
+            for text in self.replay.events_between(-math.inf, self.total_sim_time):
+                self.event_bus.register_event(ReplayedEvent(text))
+        elif self.threaded:
+            # whatever physics fires is handled on this thread, once per frame
+            self.event_bus.owner = threading.current_thread()
+            self.worker = PhysicsWorker(self, delta_time)
+            self.worker.start()
+
+        rate_time, rate_sim_time = time.perf_counter(), total_sim_time
 
         while True:
             self.main_window.fill(pygame.Color("black"))
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    if self.worker is not None:
+                        self.worker.stop()
+                        self.worker.join()
+                    if self.recorder is not None:
+                        self.recorder.close()
                     pygame.quit()
                     sys.exit()
                 else:
@@ -155,20 +389,42 @@ class Simulation(EventSubscriber):
 
             self.process_keyboard()
 
-            if not self.paused:
-                for _ in range(self.amount_of_iterations):
-                    for group in self.groups:
-                        group.update(delta_time * self.time_scale)
-
-                    self.total_sim_time += delta_time * self.time_scale
+            if self.worker is not None:
+                snapshot = self.worker.latest()
+                for sprite, position in snapshot.positions.items():
+                    sprite.snapshot_position = position
+                for sprite, orbit in snapshot.orbits.items():
+                    sprite.snapshot_orbit = orbit
+                total_sim_time = snapshot.total_sim_time
+                self.event_bus.dispatch_deferred()
+            elif self.replay is not None:
+                if not self.paused:
+                    self.replay_frame(delta_time)
+                total_sim_time = self.total_sim_time
+            elif not self.paused:
+                self.frame(delta_time)
+                total_sim_time = self.total_sim_time
+            render_start = time.perf_counter()
+
+            if render_start - rate_time >= config.RATE_INTERVAL:
+                self.event_bus.register_event(SimulationRateEvent((total_sim_time - rate_sim_time) / (render_start - rate_time)))
+                rate_time, rate_sim_time = render_start, total_sim_time
+            if self.event_bus.has_subscribers(FrameEvent):
+                self.event_bus.register_event(FrameEvent())
 
             self.render_group.update_screen_settings(self.pixels_per_meter, self.offset)
 
             if self.followed_sprite is not None:
                 self.offset += self.followed_position - Vector(self.followed_sprite.center_on_screen)
 
+            self.trail_layer.update(total_sim_time, self.pixels_per_meter, self.offset)
+            # the replay has no physics, the rockets' entities do not know their orbits
+            self.trail_layer.render(self.main_window, config.draw_trails, config.draw_orbits and self.replay is None, self.pixels_per_meter, self.offset)
             self.render_group.render(self.main_window)
-            self.widget_group.render(self.main_window, self.total_sim_time)
+            self.widget_group.render(self.main_window, total_sim_time)
 
             pygame.display.flip()
+            if self.worker is None:
+                # the physics thread has the whole budget, drawing does not share its time
+                self.render_cost += (time.perf_counter() - render_start - self.render_cost) * config.BUDGET_SMOOTHING
             clock.tick(60)
@@ -0,0 +1,139 @@
+import os
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+
+# Sampling policies decide which rocket events become rows of the telemetry
+class EveryNSteps:
+    def __init__(self, steps: float):
+        self.steps = max(int(steps), 1)
+        self.count = 0
+
+    def sample(self, event):
+        self.count -= 1
+        if self.count > 0:
+            return False
+        self.count = self.steps
+        return True
+
+
+class EveryInterval:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.last_time = None
+
+    def sample(self, event):
+        if self.last_time is not None and event.time - self.last_time < self.interval:
+            return False
+        self.last_time = event.time
+        return True
+
+
+class OnChange:
+    # a new row once the speed vector or the height moved by more than the relative threshold
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.last_speed = None
+        self.last_height = None
+
+    def sample(self, event):
+        if (self.last_speed is not None
+                and (event.speed - self.last_speed).magnitude <= self.threshold * self.last_speed.magnitude
+                and abs(event.height - self.last_height) <= self.threshold * abs(self.last_height)):
+            return False
+        self.last_speed = event.speed
+        self.last_height = event.height
+        return True
+
+
+SAMPLING_POLICIES = {
+    "steps": EveryNSteps,
+    "time": EveryInterval,
+    "change": OnChange,
+}
+
+
+def make_sampling_policy(name: str, value: float):
+    return SAMPLING_POLICIES[name](value)
+
+
+# The rows of a store up to some moment, picklable for another process: the spilled rows are read
+# from the spill file, the ones still in memory are copied
+class TelemetrySnapshot:
+    def __init__(self, dtype, path: str, spilled: int, rows):
+        self.dtype = dtype
+        self.path = path
+        self.spilled = spilled
+        self.rows = rows
+
+    def __len__(self):
+        return self.spilled + len(self.rows)
+
+    def column(self, name: str):
+        if self.spilled == 0:
+            return self.rows[name].copy()
+        spilled = np.memmap(self.path, dtype=self.dtype, mode="r", shape=(self.spilled,))
+        return np.concatenate((spilled[name], self.rows[name]))
+
+    def save(self, path: str):
+        np.savez(path, **{name: self.column(name) for name in self.dtype.names})
+
+
+# Rows of float columns in a preallocated buffer that doubles up to chunk_size rows. A full chunk is
+# appended to the spill file (path, or a temporary file removed with the store), which is memory
+# mapped again when a column is read, so the memory held stays bounded however long the mission runs.
+class TelemetryStore:
+    def __init__(self, columns, chunk_size: int = 65536, path: str = None):
+        self.dtype = np.dtype([(column, np.float64) for column in columns])
+        self.chunk_size = chunk_size
+        self.buffer = np.empty(min(1024, chunk_size), dtype=self.dtype)
+        self.size = 0
+        self.spilled = 0
+        if path is None:
+            descriptor, path = tempfile.mkstemp(suffix=".telemetry")
+            os.close(descriptor)
+            weakref.finalize(self, os.remove, path)
+        self.path = path
+        self.spill_file = open(path, "w+b")
+        # snapshots may be taken from the window thread while the physics thread appends
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.spilled + self.size
+
+    def append(self, row):
+        with self.lock:
+            if self.size == len(self.buffer):
+                if self.size < self.chunk_size:
+                    self.buffer = np.concatenate((self.buffer, np.empty(min(self.size, self.chunk_size - self.size), dtype=self.dtype)))
+                else:
+                    self.spill()
+            self.buffer[self.size] = row
+            self.size += 1
+
+    def set(self, column: str, value: float):
+        # fills a column of the last row
+        with self.lock:
+            self.buffer[column][self.size - 1] = value
+
+    def spill(self):
+        self.buffer[:self.size].tofile(self.spill_file)
+        self.spill_file.flush()
+        self.spilled += self.size
+        self.size = 0
+
+    def snapshot(self):
+        with self.lock:
+            return TelemetrySnapshot(self.dtype, self.path, self.spilled, self.buffer[:self.size].copy())
+
+    def column(self, name: str):
+        return self.snapshot().column(name)
+
+    def save(self, path: str):
+        self.snapshot().save(path)
+
+    def close(self):
+        self.spill_file.close()
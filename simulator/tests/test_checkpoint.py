@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+import config
+from checkpoint import save_checkpoint, load_checkpoint
+from events import EventBus
+from fork import build_mission, fork
+from groups import create_physics_groups
+from integrators import INTEGRATORS
+from mission import create_solar_system, create_mars_mission_rocket, create_mars_mission_ensemble
+from simulation import Simulation
+
+
+def build():
+    event_bus = EventBus()
+    earth, moon, sun, mars = create_solar_system(event_bus)
+    rocket = create_mars_mission_rocket(earth.entity, sun.entity, mars.entity, event_bus=event_bus)
+    planets = [sprite.entity for sprite in (earth, moon, sun, mars)]
+    ensemble = create_mars_mission_ensemble(planets, earth.entity, sun.entity, mars.entity, 4, event_bus=event_bus)
+    groups = create_physics_groups(earth, moon, sun, mars, rocket, ensemble, event_bus=event_bus)
+    return Simulation(time_scale=1, groups=groups, event_bus=event_bus)
+
+
+def fly(simulation, duration: float):
+    if simulation.variable_step:
+        simulation.advance(duration)
+    else:
+        for _ in range(round(duration * 6)):
+            simulation.step(1 / 6)
+
+
+def state(simulation):
+    entities = [(sprite.entity.position.coordinates, sprite.entity.speed.coordinates, sprite.entity.weight)
+                for sprite in sorted(simulation.objects, key=lambda sprite: sprite.name) if sprite.entity is not None]
+    phases = [len(sprite.entity.phase_stack) for sprite in simulation.rockets]
+    ensembles = [(sprite.ensemble.positions.tobytes(), sprite.ensemble.speeds.tobytes(), sprite.ensemble.phase_index.tobytes())
+                 for sprite in simulation.ensembles]
+    return simulation.total_sim_time, simulation.steps, entities, phases, ensembles
+
+
+@pytest.mark.parametrize("integrator", list(INTEGRATORS))
+def test_restored_simulation_continues_bitwise(monkeypatch, tmp_path, integrator):
+    monkeypatch.setattr(config, "INTEGRATOR", integrator)
+    path = str(tmp_path / "mission.npz")
+    simulation = build()
+    fly(simulation, 700)
+    save_checkpoint(simulation, path)
+    fly(simulation, 700)
+    expected = state(simulation)
+
+    restored = build()
+    load_checkpoint(restored, path)
+    fly(restored, 700)
+    assert state(restored) == expected
+
+
+def test_checkpoint_is_plain_data(tmp_path):
+    path = str(tmp_path / "mission.npz")
+    simulation = build()
+    fly(simulation, 100)
+    save_checkpoint(simulation, path)
+    with np.load(path, allow_pickle=False) as data:
+        assert all(data[key].dtype != object for key in data.files)
+
+
+def test_a_checkpoint_is_not_restored_into_a_mission_built_differently(monkeypatch, tmp_path):
+    path = str(tmp_path / "mission.npz")
+    save_checkpoint(build(), path)
+    with pytest.raises(ValueError, match="ENSEMBLE_SIZE"):
+        load_checkpoint(build_mission(), path)
+
+
+def test_fork_builds_the_mission_of_the_checkpoint(monkeypatch, tmp_path):
+    path = str(tmp_path / "mission.npz")
+    monkeypatch.setattr(config, "ENSEMBLE_SIZE", 3)
+    simulation = build_mission()
+    fly(simulation, 100)
+    save_checkpoint(simulation, path)
+
+    monkeypatch.setattr(config, "ENSEMBLE_SIZE", 0)
+    summary, = fork(path, [None], time_limit=110, workers=1)
+    assert summary["sim_time"] >= 110
+    assert summary["ensembles"][0]["rockets"] == 3
@@ -0,0 +1,25 @@
+import config
+from events import EventBus
+from groups import create_physics_groups
+from mission import create_mission
+from simulation import Simulation
+
+
+def build(event_bus: EventBus):
+    return Simulation(time_scale=config.TIME_SCALE, groups=create_physics_groups(*create_mission(event_bus), event_bus=event_bus), event_bus=event_bus)
+
+
+def test_coast_keeps_the_fixed_step_while_the_rocket_burns(monkeypatch):
+    monkeypatch.setattr(config, "COAST", True)
+    simulation = build(EventBus())
+    assert not next(iter(simulation.rockets)).entity.coasting
+    assert not simulation.variable_step
+
+
+# the whole default mission, about three minutes: the burns are tuned to where the sampled run ends
+# the wait phases, a coast that ends them elsewhere leaves the rocket short of Mars
+def test_the_default_mission_lands_with_coast(monkeypatch):
+    monkeypatch.setattr(config, "COAST", True)
+    summary = build(EventBus()).run_headless(3E7)
+    assert summary["stop_reason"] == "phases_complete"
+    assert summary["rockets"][0]["alive"] and summary["rockets"][0]["phases_left"] == 0
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+import config
+from entities import RocketPhase
+from events import EventBus
+from groups import create_physics_groups
+from mission import create_solar_system, create_mars_mission_rocket, create_mars_mission_ensemble
+from rocket_phases import RocketTestOrbitManeuverPhase
+from simulation import Simulation
+
+
+def fly(duration: float, delta_time: float = 1 / 6):
+    event_bus = EventBus()
+    earth, moon, sun, mars = create_solar_system(event_bus)
+    rocket = create_mars_mission_rocket(earth.entity, sun.entity, mars.entity, event_bus=event_bus)
+    planets = [sprite.entity for sprite in (earth, moon, sun, mars)]
+    ensemble = create_mars_mission_ensemble(planets, earth.entity, sun.entity, mars.entity, 4, spread=0, angle_spread=0, event_bus=event_bus)
+    groups = create_physics_groups(earth, moon, sun, mars, rocket, ensemble, event_bus=event_bus)
+    simulation = Simulation(time_scale=1, groups=groups, event_bus=event_bus)
+    while simulation.total_sim_time < duration:
+        if simulation.variable_step:
+            simulation.step(simulation.next_step_size(duration - simulation.total_sim_time))
+        else:
+            simulation.step(delta_time)
+    return rocket.entity, ensemble.ensemble
+
+
+def test_zero_spread_copies_fly_the_mission_rocket_path():
+    rocket, ensemble = fly(3000)
+    assert np.all(ensemble.active)
+    # the same steps, only the gravity sums are added up in another order
+    assert np.all(np.linalg.norm(ensemble.positions - rocket.position.coordinates, axis=1) < 1E-3)
+    assert np.all(np.linalg.norm(ensemble.speeds - rocket.speed.coordinates, axis=1) < 1E-6)
+
+
+# a variable step can span a whole coast phase: the copies substep it and their phases end it on
+# time, they follow the rocket to a fraction of its distance from the planet (the rocket itself
+# coasts on a conic or goes through Dormand-Prince). The flight ends soon after the last coast: the
+# cruise burns are gated on the heliocentric apogee, a kilometre apart the copies burn at other times
+@pytest.mark.parametrize("integrator, coast", [("dopri", False), ("euler", True), ("dopri", True)])
+def test_zero_spread_copies_stay_with_the_rocket_under_variable_steps(monkeypatch, integrator, coast):
+    monkeypatch.setattr(config, "INTEGRATOR", integrator)
+    monkeypatch.setattr(config, "COAST", coast)
+    rocket, ensemble = fly(25000)
+    assert np.all(ensemble.active)
+    assert np.all(ensemble.phase_index == len(ensemble.phases) - len(rocket.phase_stack))
+    distances = np.linalg.norm(ensemble.positions - rocket.position.coordinates, axis=1)
+    assert np.all(distances < 1E-2 * rocket.absolute_height)
+
+
+def mission_ensemble(amount: int):
+    earth, moon, sun, mars = create_solar_system()
+    planets = [sprite.entity for sprite in (earth, moon, sun, mars)]
+    return create_mars_mission_ensemble(planets, earth.entity, sun.entity, mars.entity, amount, spread=0, angle_spread=0).ensemble
+
+
+def test_the_cruise_limit_follows_the_time_in_the_phase_of_the_copies():
+    ensemble = mission_ensemble(2)
+    phase = next(phase for phase in ensemble.phases if isinstance(phase, RocketTestOrbitManeuverPhase))
+    rows = np.arange(2)
+    assert phase.batch_max_step(ensemble, rows) == config.ADAPTIVE_CRUISE_STEP
+    ensemble.phase_time[:] = 0.3 * 10 ** 7
+    # a rocket flying the same phase object does not change the limit of the copies
+    phase.total_time = 0
+    assert phase.batch_max_step(ensemble, rows) != config.ADAPTIVE_CRUISE_STEP
+
+
+def test_phases_with_per_rocket_state_do_not_fall_back_to_scalar_views():
+    class CountingPhase(RocketPhase):
+        stateful = True
+
+        def __init__(self):
+            self.count = 0
+
+        def make_decision(self, rocket, delta_time: float):
+            self.count += 1
+
+        def max_step(self, rocket):
+            return None
+
+    ensemble = mission_ensemble(2)
+    rows = np.arange(2)
+    with pytest.raises(NotImplementedError):
+        CountingPhase().make_batch_decision(ensemble, rows, 1)
+    with pytest.raises(NotImplementedError):
+        CountingPhase().batch_max_step(ensemble, rows)
@@ -0,0 +1,79 @@
+import threading
+
+from events import EventBus, EventSubscriber, RocketEvent, SetSimulationTimeScaleEvent
+from groups import PhysicsGroup, create_physics_groups
+from mission import create_mission
+from physics import Vector
+from rocket_phases import SetTimeScalePhase
+from simulation import Simulation
+
+
+class Counter(EventSubscriber):
+    def __init__(self, event_bus: EventBus, *event_types):
+        self.event_bus = event_bus
+        self.events = []
+        self.subscribe(*event_types)
+
+    def handle_event(self, event):
+        self.events.append(event)
+
+
+def build(event_bus: EventBus):
+    sprites = create_mission(event_bus)
+    return Simulation(time_scale=1, groups=create_physics_groups(*sprites, event_bus=event_bus), clickable=sprites, event_bus=event_bus)
+
+
+def on_other_thread(function):
+    thread = threading.Thread(target=function)
+    thread.start()
+    thread.join()
+
+
+def test_simulations_in_one_process_keep_their_events_apart():
+    first_bus, second_bus = EventBus(), EventBus()
+    first, second = build(first_bus), build(second_bus)
+    counter = Counter(first_bus, RocketEvent)
+
+    second.step(1)
+    assert counter.events == []
+    first.step(1)
+    assert len(counter.events) == 1
+
+
+def test_the_phases_of_a_rocket_reach_the_simulation_it_was_built_for():
+    event_bus = EventBus()
+    simulation, other = build(event_bus), build(EventBus())
+    counter = Counter(event_bus, SetSimulationTimeScaleEvent)
+    rocket = next(iter(simulation.rockets)).entity
+    while not isinstance(rocket.phase_stack[-1], SetTimeScalePhase):
+        rocket.end_phase()
+    simulation.step(1)
+    other.step(1)
+    assert [event.time_scale for event in counter.events] == [1000]
+    assert simulation.time_scale == 1000 and other.time_scale == 1
+
+
+def test_events_from_another_thread_wait_for_the_owner_of_the_bus():
+    event_bus = EventBus()
+    counter = Counter(event_bus, RocketEvent)
+    event_bus.owner = threading.current_thread()
+    speed = Vector((0, 0))
+    on_other_thread(lambda: event_bus.register_event(RocketEvent(0, speed, speed, speed, 1.0, 1.0)))
+    assert counter.events == []
+    event_bus.dispatch_deferred()
+    assert len(counter.events) == 1
+
+
+def test_a_rocket_crashed_on_the_physics_thread_is_killed_on_the_owner_thread():
+    event_bus = EventBus()
+    simulation = build(event_bus)
+    sprite = next(iter(simulation.rockets))
+    planet = sprite.entity.planet
+    sprite.entity.position = planet.position + Vector((planet.radius / 2, 0))
+    event_bus.owner = threading.current_thread()
+    on_other_thread(lambda: simulation.step(1 / 60))
+    # out of the physics at once, still drawn until the window's thread handles the collision
+    assert not any(isinstance(group, PhysicsGroup) for group in sprite.groups())
+    assert sprite.alive() and simulation.collisions == []
+    event_bus.dispatch_deferred()
+    assert not sprite.alive() and len(simulation.collisions) == 1
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+import config
+from entities import Planet
+from gravity import DENSE_KERNEL_LIMIT, calculate_forces
+from physics import Physics, Point, Vector
+
+
+def bodies(amount: int, seed: int = 0):
+    generator = np.random.default_rng(seed)
+    positions = generator.uniform(-1E11, 1E11, (amount, 2))
+    weights = 10 ** generator.uniform(3, 25, amount)
+    return positions, weights
+
+
+def reference_forces(positions, weights, massive=None):
+    # the pairwise Physics.apply_gravity loop the kernels replace, and the sum of the magnitudes of
+    # the pulls on every body the rounding of the kernels is measured against; bodies that are not
+    # massive pull nothing
+    if massive is None:
+        massive = np.ones(len(positions), dtype=bool)
+    planets = [Planet(weight, Point(tuple(position)), Vector((0, 0)), 1, 0) for position, weight in zip(positions.tolist(), weights.tolist())]
+    for planet in planets:
+        planet.force = Vector((0, 0))
+    magnitudes = np.zeros(len(planets))
+    for first in range(len(planets)):
+        for second in range(first + 1, len(planets)):
+            force = Physics.calculate_gravity(planets[first], planets[second])
+            if massive[first] and massive[second]:
+                Physics.apply_gravity(planets[first], planets[second])
+            elif massive[second]:
+                planets[first].force += force
+            elif massive[first]:
+                planets[second].force -= force
+            else:
+                continue
+            magnitudes[[first, second]] += force.magnitude * massive[[second, first]]
+    return np.array([planet.force.coordinates for planet in planets]), magnitudes
+
+
+def assert_close(forces, expected, magnitudes):
+    assert np.all(np.linalg.norm(forces - expected, axis=1) <= 1E-12 * magnitudes)
+
+
+@pytest.mark.parametrize("amount", [2, DENSE_KERNEL_LIMIT, 3 * DENSE_KERNEL_LIMIT])
+def test_pairwise_kernel_matches_the_pairwise_loop(monkeypatch, amount):
+    monkeypatch.setattr(config, "RESTRICTED", False)
+    monkeypatch.setattr(config, "GRAVITY_MODE", "pairwise")
+    positions, weights = bodies(amount)
+    expected, magnitudes = reference_forces(positions, weights)
+    assert_close(calculate_forces(positions, weights), expected, magnitudes)
+
+
+@pytest.mark.parametrize("amount", [DENSE_KERNEL_LIMIT, 3 * DENSE_KERNEL_LIMIT])
+def test_restricted_kernel_matches_the_pairwise_loop_without_the_pull_of_test_particles(monkeypatch, amount):
+    monkeypatch.setattr(config, "RESTRICTED", True)
+    monkeypatch.setattr(config, "GRAVITY_MODE", "pairwise")
+    positions, weights = bodies(amount)
+    massive = np.arange(amount) % 8 == 0
+    expected, magnitudes = reference_forces(positions, weights, massive)
+    assert_close(calculate_forces(positions, weights, massive), expected, magnitudes)
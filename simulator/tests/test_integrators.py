@@ -0,0 +1,25 @@
+import numpy as np
+
+from gravity import calculate_accelerations
+from integrators import make_integrator
+
+
+def test_weights_changed_in_place_are_not_served_from_the_last_evaluation():
+    integrator = make_integrator("verlet")
+    positions = np.array([[0.0, 0.0], [1E7, 0.0]])
+    speeds = np.array([[0.0, 0.0], [0.0, 6000.0]])
+    weights = np.array([6E24, 1E3])
+    offsets = []
+
+    def field(trial_positions, time_offset: float):
+        offsets.append(time_offset)
+        return calculate_accelerations(trial_positions, weights)
+
+    new_positions, new_speeds = integrator.step(positions, speeds, weights, field(positions, 0), field, 1.0)
+    # like the rows of an ArrayEngine, the state and the weights change in place between steps
+    positions[:], speeds[:] = new_positions, new_speeds
+    weights[0] *= 2
+    accelerations = field(positions, 0)
+    offsets.clear()
+    integrator.step(positions, speeds, weights, accelerations, field, 1.0)
+    assert offsets[0] == 0
@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from plots import lttb
+
+
+def reference_lttb(x, y, points: int):
+    # the loop of Steinarsson's thesis, with the buckets of (len - 2) / (points - 2) samples
+    def edge(bucket):
+        return bucket * (len(x) - 2) // (points - 2) + 1
+
+    kept = [0]
+    for bucket in range(points - 2):
+        start, end = edge(bucket), edge(bucket + 1)
+        next_start, next_end = end, edge(bucket + 2)
+        if bucket == points - 3:
+            next_start, next_end = len(x) - 1, len(x)
+        mean_x, mean_y = np.mean(x[next_start:next_end]), np.mean(y[next_start:next_end])
+        previous = kept[-1]
+        areas = [abs((x[previous] - mean_x) * (y[index] - y[previous]) - (x[previous] - x[index]) * (mean_y - y[previous]))
+                 for index in range(start, end)]
+        kept.append(start + int(np.argmax(areas)))
+    kept.append(len(x) - 1)
+    return np.array(kept)
+
+
+@pytest.mark.parametrize("amount, points", [(1000, 100), (1001, 37), (50, 49), (32, 24), (10, 3)])
+def test_the_samples_of_the_reference_algorithm_are_kept(amount, points):
+    generator = np.random.default_rng(amount)
+    x = np.cumsum(generator.uniform(0.1, 1, amount))
+    y = generator.standard_normal(amount)
+    kept = lttb(x, y, points)
+    assert len(kept) == points
+    assert kept[0] == 0 and kept[-1] == amount - 1
+    assert np.all(np.diff(kept) > 0)
+    np.testing.assert_array_equal(kept, reference_lttb(x, y, points))
+
+
+def test_a_spike_is_kept():
+    x = np.arange(1000.0)
+    y = np.zeros(1000)
+    y[617] = 5
+    assert 617 in lttb(x, y, 20)
+
+
+@pytest.mark.parametrize("points", [2, 1000, 5000])
+def test_short_columns_and_too_few_points_keep_every_sample(points):
+    assert np.array_equal(lttb(np.arange(1000.0), np.arange(1000.0), points), np.arange(1000))
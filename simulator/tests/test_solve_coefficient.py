@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from ensemble import RocketEnsemble
+from entities import RocketPhase
+
+
+def counted(function):
+    calls = []
+
+    def wrapped(coefficient):
+        calls.append(coefficient)
+        return function(coefficient)
+    return wrapped, calls
+
+
+def cubic(root: float):
+    return lambda coefficient: root ** 3 - coefficient ** 3
+
+
+@pytest.mark.parametrize("guess", [1, 0.1, 0.66, 0.95])
+def test_the_root_is_found_within_the_tolerance(guess):
+    root = 0.3 ** (1 / 3)
+    function, calls = counted(cubic(root))
+    assert abs(RocketPhase.solve_coefficient(function, guess) - root) <= 0.001 / 2
+    # bisection of the whole range would take ten evaluations after the first two
+    assert len(calls) < 10
+
+
+def test_a_guess_next_to_the_root_is_refined_in_a_few_evaluations():
+    function, calls = counted(cubic(0.5))
+    assert abs(RocketPhase.solve_coefficient(function, 0.5005) - 0.5) <= 0.001 / 2
+    assert len(calls) <= 4
+
+
+def test_without_a_root_in_the_bracket_the_ends_are_returned():
+    assert RocketPhase.solve_coefficient(lambda coefficient: 1.0, 0.4) == 1
+    assert RocketPhase.solve_coefficient(lambda coefficient: 1.0, 1) == 1
+    assert RocketPhase.solve_coefficient(lambda coefficient: -1.0, 0.4) == 0
+    assert RocketPhase.solve_coefficient(lambda coefficient: None, 0.4) == 0
+
+
+def test_none_counts_as_below_and_is_bisected():
+    function = lambda coefficient: None if coefficient > 0.37 else 1.0
+    assert abs(RocketPhase.solve_coefficient(function, 1) - 0.37) <= 0.001 / 2
+
+
+def test_the_ensemble_solver_matches_the_scalar_one():
+    roots = np.array([0.2, 0.5, 0.9, 1.5, -1])
+    guesses = np.array([1, 0.4, 0.95, 0.3, 0.5])
+
+    def scalar_function(root):
+        return lambda coefficient: (None if coefficient > 0.8 else 1.0) if root > 1 else root - coefficient
+
+    def function(indexes, coefficients):
+        values = roots[indexes] - coefficients
+        return np.where((roots[indexes] > 1) & (coefficients > 0.8), np.nan, np.where(roots[indexes] > 1, 1.0, values))
+
+    expected = [RocketPhase.solve_coefficient(scalar_function(root), guess) for root, guess in zip(roots, guesses)]
+    np.testing.assert_allclose(RocketEnsemble.solve_coefficients(function, guesses), expected)
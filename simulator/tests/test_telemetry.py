@@ -0,0 +1,29 @@
+import pickle
+
+import numpy as np
+
+from telemetry import TelemetryStore
+
+
+def test_the_rows_spill_past_the_chunk_and_read_back_in_order(tmp_path):
+    store = TelemetryStore(["time", "x"], chunk_size=4, path=str(tmp_path / "rows.telemetry"))
+    for row in range(10):
+        store.append((row, 2 * row))
+    store.set("x", -1)
+
+    assert len(store) == 10
+    assert len(store.buffer) <= 4
+    np.testing.assert_array_equal(store.column("time"), np.arange(10))
+    np.testing.assert_array_equal(store.column("x"), [*range(0, 18, 2), -1])
+
+
+def test_a_snapshot_keeps_its_rows_after_more_appends(tmp_path):
+    store = TelemetryStore(["time"], chunk_size=4, path=str(tmp_path / "rows.telemetry"))
+    for row in range(6):
+        store.append((row,))
+    snapshot = pickle.loads(pickle.dumps(store.snapshot()))
+    for row in range(6, 20):
+        store.append((row,))
+
+    assert len(snapshot) == 6
+    np.testing.assert_array_equal(snapshot.column("time"), np.arange(6))
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+
+import pygame
+
+import config
+
+
+# Rendered text surfaces by (text, color, font), the least recently drawn is evicted once there are
+# capacity of them. Markers and widgets draw the same few strings every frame, so after the first
+# frame they cost a dict lookup instead of a font.render.
+class TextCache:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text: str, antialias: bool, color):
+        key = (text, color if isinstance(color, str) else tuple(color), antialias, font)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+        self.misses += 1
+        surface = self.surfaces[key] = font.render(text, antialias, color)
+        if len(self.surfaces) > self.capacity:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+text_cache = TextCache(config.TEXT_CACHE_SIZE)
+
+
+# A font whose render goes through the shared text cache, everything else is the pygame font's.
+# The surfaces it returns are shared, they must not be drawn on.
+class CachedFont:
+    def __init__(self, font: pygame.font.Font, cache: TextCache = None):
+        self.font = font
+        self.cache = cache if cache is not None else text_cache
+
+    def render(self, text: str, antialias: bool, color):
+        return self.cache.render(self.font, text, antialias, color)
+
+    def __getattr__(self, name):
+        return getattr(self.font, name)
@@ -0,0 +1,136 @@
+import math
+import time
+
+import numpy as np
+import pygame
+
+import config
+from kepler import Conic
+from physics import Vector
+from simobjects import SimEnsembleObject, SimRocketObject, OrbitState
+
+
+# The last capacity positions of a sprite in world space, in a ring buffer, and the polyline they
+# make on the screen. New samples are projected one by one; the whole polyline is projected again,
+# in one array operation, only when the view changed. Every sample is written twice, capacity rows
+# apart, so the samples from the oldest one on are always a contiguous slice.
+class Trail:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.samples = np.empty((2 * capacity, 2))
+        self.clear()
+
+    def clear(self):
+        self.start = 0
+        self.size = 0
+        self.points = []
+        self.last_x = self.last_y = math.inf
+
+    def append(self, x: float, y: float, scale: float, offset: Vector):
+        index = (self.start + self.size) % self.capacity
+        self.samples[index] = self.samples[index + self.capacity] = x, y
+        if self.size == self.capacity:
+            self.start = (self.start + 1) % self.capacity
+            del self.points[0]
+        else:
+            self.size += 1
+        self.last_x, self.last_y = x, y
+        self.points.append((x * scale + offset.x, y * scale + offset.y))
+
+    def project(self, scale: float, offset: Vector):
+        ordered = self.samples[self.start:self.start + self.size]
+        self.points = (ordered * scale + offset.coordinates).tolist()
+
+
+# The conic a rocket follows around its planet, as points relative to the planet. Thrust and a new
+# planet change it at once, so it is sampled again right away when the weight or the planet of the
+# rocket changed. Anything else that moves the rocket (perturbations, a restored checkpoint) only
+# makes it drift, and a rocket whose state changed is sampled again at most every refresh seconds;
+# between those moments drawing it costs a translation.
+class OrbitOverlay:
+    def __init__(self, points: int, refresh: float = None):
+        self.anomalies = np.linspace(-math.pi, math.pi, points)
+        self.refresh = refresh if refresh is not None else config.ORBIT_REFRESH
+        self.key = None
+        self.version = None
+        self.time = None
+        self.shape = None
+        self.closed = False
+        self.scale = None
+        self.scaled = None
+
+    def update(self, state: OrbitState, now: float):
+        key = (state.weight, state.planet)
+        if key == self.key and (state.version == self.version or now - self.time < self.refresh):
+            return
+        self.key = key
+        self.version = state.version
+        self.time = now
+        self.scale = None
+        position = state.position
+        conic = Conic(position, state.speed, state.mu)
+        anomalies = self.anomalies
+        self.closed = conic.elliptic
+        if not conic.elliptic:
+            # the branch of the hyperbola up to config.ORBIT_MAX_DISTANCE times the current distance
+            limit = math.acos(max(min((conic.parameter / (position.magnitude * config.ORBIT_MAX_DISTANCE) - 1) / conic.eccentricity, 1), -1))
+            anomalies = anomalies * (limit / math.pi)
+        radii = conic.parameter / (1 + conic.eccentricity * np.cos(anomalies))
+        angles = conic.periapsis_angle + conic.direction * anomalies
+        self.shape = np.column_stack((radii * np.cos(angles), radii * np.sin(angles)))
+
+    def project(self, planet_x: float, planet_y: float, scale: float):
+        if self.scale != scale:
+            self.scale = scale
+            self.scaled = self.shape * scale
+        return (self.scaled + (planet_x, planet_y)).tolist()
+
+
+class TrailLayer:
+    def __init__(self, sprites, capacity: int = None, sample_pixels: float = None, orbit_points: int = None):
+        capacity = capacity if capacity is not None else config.TRAIL_LENGTH
+        self.sample_pixels = sample_pixels if sample_pixels is not None else config.TRAIL_SAMPLE_PIXELS
+        orbit_points = orbit_points if orbit_points is not None else config.ORBIT_POINTS
+        self.trails = {sprite: Trail(capacity) for sprite in sprites if not isinstance(sprite, SimEnsembleObject)}
+        self.orbits = {sprite: OrbitOverlay(orbit_points) for sprite in sprites if isinstance(sprite, SimRocketObject)}
+        self.view = None
+        self.time = None
+
+    def update(self, time: float, scale: float, offset: Vector):
+        # a replay that went back in time starts the trails again
+        if self.time is not None and time < self.time:
+            for trail in self.trails.values():
+                trail.clear()
+        self.time = time
+
+        view = (scale, offset.x, offset.y)
+        moved = view != self.view
+        self.view = view
+        min_distance = (self.sample_pixels / scale) ** 2
+        for sprite, trail in self.trails.items():
+            if not sprite.alive():
+                continue
+            position = sprite.position
+            x, y = position.x, position.y
+            if (x - trail.last_x) ** 2 + (y - trail.last_y) ** 2 >= min_distance:
+                trail.append(x, y, scale, offset)
+            if moved:
+                trail.project(scale, offset)
+
+    def render(self, screen, draw_trails: bool, draw_orbits: bool, scale: float, offset: Vector):
+        if draw_trails:
+            for sprite, trail in self.trails.items():
+                if len(trail.points) >= 2:
+                    pygame.draw.lines(screen, sprite.color, False, trail.points)
+        if draw_orbits:
+            now = time.perf_counter()
+            for sprite, orbit in self.orbits.items():
+                if not sprite.alive():
+                    continue
+                # from the snapshot of the physics thread when there is one, the live state is not
+                # this thread's to read
+                state = sprite.orbit_state
+                orbit.update(state, now)
+                planet = state.planet_position
+                points = orbit.project(planet.x * scale + offset.x, planet.y * scale + offset.y, scale)
+                pygame.draw.lines(screen, sprite.color, orbit.closed, points)
@@ -1,9 +1,11 @@
+from collections import deque
+
 from pygame.sprite import Sprite
 import pygame
 
 import config
 from logger import Logger
-from events import EventSubscriber, PauseEvent, TimeScaleUpdateEvent, FollowEvent, FollowEventCapture, FollowEventUncapture, SetSimulationTimeScaleEvent
+from events import EventBus, EventSubscriber, PauseEvent, TimeScaleUpdateEvent, FollowEvent, FollowEventCapture, FollowEventUncapture, SetSimulationTimeScaleEvent, SimulationRateEvent
 
 
 class Widget(Sprite):
@@ -15,23 +17,38 @@ class Widget(Sprite):
 
 
 class LoggerWidget(Widget, Logger):
-    def __init__(self):
-        self.event_strings = []
+    def __init__(self, event_bus: EventBus):
+        # the last LOGGER_SCROLLBACK lines, drawn into one surface that is rebuilt only when a line is added
+        self.event_strings = deque(maxlen=config.LOGGER_SCROLLBACK)
+        self.version = 0
+        self.surface = None
+        self.surface_version = None
         Widget.__init__(self)
-        Logger.__init__(self)
+        Logger.__init__(self, event_bus)
 
     def handle_event(self, event):
         event_string = str(event)
         self.event_strings.append(event_string)
+        self.version += 1
+
+    def render_lines(self, font):
+        event_texts = [font.render(text, True, "White") for text in list(self.event_strings)]
+        surface = pygame.Surface((max((text.get_width() for text in event_texts), default=0),
+                                  sum(text.get_height() for text in event_texts)), pygame.SRCALPHA)
+        y = 0
+        for text in event_texts:
+            surface.blit(text, (surface.get_width() - text.get_width(), y))
+            y += text.get_height()
+        return surface
 
     def render(self, screen, font, simtime: float):
-        event_texts = [font.render(text, True, "White") for text in self.event_strings]
-        x = screen.get_width() - config.WIDGET_MARGIN
-        y = screen.get_height() - config.WIDGET_MARGIN
-
-        for text in reversed(event_texts):
-            screen.blit(text, (x - text.get_width(), y - text.get_height()))
-            y -= text.get_height()
+        version = self.version
+        if self.surface_version != version:
+            self.surface = self.render_lines(font)
+            self.surface_version = version
+        surface = self.surface
+        screen.blit(surface, (screen.get_width() - config.WIDGET_MARGIN - surface.get_width(),
+                              screen.get_height() - config.WIDGET_MARGIN - surface.get_height()))
 
 
 class ClockWidget(Widget):
@@ -48,12 +65,15 @@ class ClockWidget(Widget):
 
 
 class TimeScaleWidget(Widget, EventSubscriber):
-    def __init__(self, is_paused, time_scale, amount_of_iterations):
+    def __init__(self, is_paused, time_scale, amount_of_iterations, event_bus: EventBus):
         super().__init__()
+        self.event_bus = event_bus
         self.is_paused = is_paused
         self.time_scale = time_scale
         self.amount_of_iterations = amount_of_iterations
-        self.subscribe(PauseEvent, TimeScaleUpdateEvent, SetSimulationTimeScaleEvent)
+        # simulated seconds per wall second actually reached
+        self.rate = None
+        self.subscribe(PauseEvent, TimeScaleUpdateEvent, SetSimulationTimeScaleEvent, SimulationRateEvent)
 
     def handle_event(self, event):
         if isinstance(event, PauseEvent):
@@ -63,20 +83,27 @@ class TimeScaleWidget(Widget, EventSubscriber):
             self.amount_of_iterations = event.amount_of_iterations
         elif isinstance(event, SetSimulationTimeScaleEvent):
             self.time_scale = event.time_scale
+        elif isinstance(event, SimulationRateEvent):
+            self.rate = event.rate
         else:
             raise ValueError("Unsupported event")
 
     def render(self, screen, font, simtime):
         if self.is_paused:
             text = font.render("Paused!", True, "White")
+        elif config.PHYSICS_BUDGET is not None:
+            achieved = f"X{self.rate:.0f}" if self.rate is not None else "X..."
+            text = font.render(f"{achieved} in {config.PHYSICS_BUDGET * 1000:.0f} ms/frame", True, "White")
         else:
-            text = font.render(f"X{int(self.time_scale * self.amount_of_iterations)}", True, "White")
+            achieved = f" (X{self.rate:.0f})" if self.rate is not None else ""
+            text = font.render(f"X{int(self.time_scale * self.amount_of_iterations)}{achieved}", True, "White")
         screen.blit(text, (config.WIDGET_MARGIN, config.WIDGET_MARGIN))
 
 
 class CaptureWidget(Widget, EventSubscriber):
-    def __init__(self, followed_sprite):
+    def __init__(self, followed_sprite, event_bus: EventBus):
         super().__init__()
+        self.event_bus = event_bus
         self.subscribe(FollowEvent)
         self.followed_sprite = followed_sprite
 
@@ -92,3 +119,14 @@ class CaptureWidget(Widget, EventSubscriber):
 
         text = font.render(f"{self.followed_sprite.name} is captured (escape to uncapture)", True, self.followed_sprite.color)
         screen.blit(text, (config.WIDGET_MARGIN, screen.get_height() - text.get_height() - config.WIDGET_MARGIN))
+
+
+class StepStatsWidget(Widget):
+    def __init__(self, integrator):
+        super().__init__()
+        self.integrator = integrator
+
+    def render(self, screen, font, simtime):
+        text = font.render(f"Steps: {self.integrator.accepted_steps} accepted, {self.integrator.rejected_steps} rejected, "
+                           f"h={self.integrator.step_size:.3g}s", True, "White")
+        screen.blit(text, (config.WIDGET_MARGIN, config.WIDGET_MARGIN * 2 + text.get_height()))
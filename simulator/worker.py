@@ -0,0 +1,68 @@
+import queue
+import threading
+import time
+
+from simobjects import SimRocketObject
+
+
+# Immutable picture of the physics state, the render loop only ever reads these: the positions of
+# the sprites and what the orbits of the rockets are drawn from
+class Snapshot:
+    def __init__(self, total_sim_time: float, positions: dict, orbits: dict):
+        self.total_sim_time = total_sim_time
+        self.positions = positions
+        self.orbits = orbits
+
+
+# Runs the physics of a simulation on its own thread. Every frame of simulated time ends with a
+# snapshot published into a double buffer, commands from the window (pause, time scale) wait in a
+# queue and are applied between frames, so the physics state is only ever touched by this thread.
+# The events it fires wait on the bus for the window's thread, their handlers never run here.
+class PhysicsWorker(threading.Thread):
+    def __init__(self, simulation, frame_time: float = 1 / 60):
+        super().__init__(name="physics", daemon=True)
+        self.simulation = simulation
+        self.frame_time = frame_time
+        self.commands = queue.Queue()
+        self.running = True
+        self.lock = threading.Lock()
+        self.buffers = [None, None]
+        self.front = 0
+        self.publish()
+
+    def publish(self):
+        back = 1 - self.front
+        alive = [sprite for sprite in self.simulation.objects if sprite.alive()]
+        self.buffers[back] = Snapshot(
+            self.simulation.total_sim_time,
+            {sprite: sprite.snapshot() for sprite in alive},
+            {sprite: sprite.orbit_snapshot() for sprite in alive if isinstance(sprite, SimRocketObject)},
+        )
+        with self.lock:
+            self.front = back
+
+    def latest(self) -> Snapshot:
+        with self.lock:
+            return self.buffers[self.front]
+
+    def stop(self):
+        self.running = False
+
+    def run(self):
+        next_frame = time.perf_counter()
+
+        while self.running:
+            while not self.commands.empty():
+                self.simulation.handle_event(self.commands.get_nowait())
+
+            if not self.simulation.paused:
+                self.simulation.frame(self.frame_time)
+                self.publish()
+
+            # keep the pace of the window; a frame that took longer is not caught up on later
+            next_frame += self.frame_time
+            delay = next_frame - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.perf_counter()